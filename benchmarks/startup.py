@@ -0,0 +1,58 @@
+from Code.generation.stub_server import StubServer
+import subprocess
+import tempfile
+import json
+import time
+import sys
+import os
+
+# run from the directory containing Code/: python -m Code.benchmarks.startup
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROPOSITIONS_PATH = os.path.join(PARENT_DIR, "Code", "data", "propositions.jsonl")
+
+GENERATE_ONLY = '''
+import sys
+import time
+start = time.perf_counter()
+from Code import main
+main.TEMPERATURES = [0.0]
+main.REQUESTS_PER_SECOND = 1000
+main.main(["generate", sys.argv[1], "key", sys.argv[2], sys.argv[3], "1"])
+print(time.perf_counter() - start)
+print("torch" in sys.modules, "transformers" in sys.modules)
+'''
+
+def timed_run(args: list) -> tuple:
+  start = time.perf_counter()
+  completed = subprocess.run([sys.executable] + args, cwd = PARENT_DIR, capture_output = True, text = True, check = True)
+
+  return time.perf_counter() - start, completed.stdout
+
+def main():
+  help_seconds, _ = timed_run(["-m", "Code.main", "--help"])
+  bad_argv_seconds = time.perf_counter()
+  subprocess.run([sys.executable, "-m", "Code.main", "verify"], cwd = PARENT_DIR, capture_output = True)
+  bad_argv_seconds = time.perf_counter() - bad_argv_seconds
+
+  with StubServer() as server, tempfile.TemporaryDirectory() as folder_path:
+    process_seconds, stdout = timed_run(["-c", GENERATE_ONLY, server.url, folder_path, PROPOSITIONS_PATH])
+    generate_seconds, imports = stdout.strip().splitlines()[-2:]
+    torch_imported, transformers_imported = [flag == "True" for flag in imports.split()]
+    requests = server.requests
+
+  result = {
+    "help seconds": help_seconds,
+    "bad argv seconds": bad_argv_seconds,
+    "generate process seconds": process_seconds,
+    "generate seconds": float(generate_seconds),
+    "generate requests": requests,
+    "torch imported": torch_imported,
+    "transformers imported": transformers_imported
+  }
+  print(json.dumps(result, indent = 2))
+
+  if torch_imported or transformers_imported:
+    sys.exit("The generation-only path imported torch or transformers")
+
+if __name__ == "__main__":
+  main()
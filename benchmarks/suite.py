@@ -0,0 +1,244 @@
+from Code.utils.synthetic import synthetic_proofs
+import subprocess
+import contextlib
+import statistics
+import tempfile
+import argparse
+import platform
+import random
+import shutil
+import json
+import time
+import sys
+import os
+
+# run from the directory containing Code/: python -m Code.benchmarks.suite --output bench.json
+# every component runs in its own process so that its peak RSS is its own
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARENT_DIR = os.path.dirname(PACKAGE_DIR)
+PROPOSITIONS_PATH = os.path.join(PACKAGE_DIR, "data", "propositions.jsonl")
+COMPONENTS = ["parse_response", "generation", "nli_step", "nli_proof", "ensemble_proof", "ensemble_batched", "verify_latex", "latex_pool", "statistics"]
+
+def render(proof: dict) -> str:
+  # a synthetic proof written out the way a model answers the system prompt
+  return f'Variable definitions:\n{proof["premise"]}\n\nProof type(s):\n{proof["proof type"][0]}\n\nProof:\n' + "\n".join(proof["proof"]) + "\nQED"
+
+def timed_each(function, items: list) -> list:
+  latencies = []
+
+  for item in items:
+    start = time.perf_counter()
+    function(item)
+    latencies.append(time.perf_counter() - start)
+
+  return latencies
+
+def summarize(latencies: list, proofs: int, steps: int) -> dict:
+  seconds = sum(latencies)
+  ordered = sorted(latencies)
+  percentile = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+
+  return {
+    "calls": len(latencies),
+    "proofs": proofs,
+    "steps": steps,
+    "seconds": seconds,
+    "proofs per second": proofs / seconds if seconds and proofs else None,
+    "steps per second": steps / seconds if seconds else None,
+    "p50 ms": percentile(0.5),
+    "p99 ms": percentile(0.99),
+    "mean ms": statistics.mean(latencies) * 1000 if latencies else None
+  }
+
+def tiny_nli_models(models_dir: str, **kwargs) -> list:
+  from Code.verification.verification_model import NLIModelType, NLIModel
+  from Code.benchmarks.tiny_models import build_tiny_ensemble
+
+  paths = build_tiny_ensemble(models_dir, PROPOSITIONS_PATH)
+
+  return [NLIModel(model_type, path, "cpu", 50, **kwargs) for model_type, path in zip(NLIModelType, paths)]
+
+def bench_parse_response(proofs: list, models_dir: str) -> dict:
+  from Code.generation.generation_model import GenModelType, GenModel
+
+  model = GenModel(GenModelType.GPT, "stub", 0.0, "http://127.0.0.1:9/v1", "key", tempfile.gettempdir())
+  responses = [render(proof) for proof in proofs]
+
+  return summarize(timed_each(model.parse_response, responses), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_generation(proofs: list, models_dir: str) -> dict:
+  from Code.generation.generation_model import GenModelType, GenModel
+  from Code.generation.stub_server import StubServer
+
+  with StubServer(content = render(proofs[0])) as server, tempfile.TemporaryDirectory() as folder:
+    model = GenModel(GenModelType.GPT, "stub", 0.0, server.url, "key", folder)
+    prompts = [[{"type": "text", "text": f'Prove the following proposition: {proof["id"]} {proof["prompt type"]}'}] for proof in proofs]
+    call = lambda prompt: model.parse_response(model.get_response("system", prompt))
+    call(prompts[0])
+
+    return summarize(timed_each(call, prompts), len(proofs), len(proofs[0]["proof"]) * len(proofs))
+
+def bench_nli_step(proofs: list, models_dir: str) -> dict:
+  model = tiny_nli_models(models_dir)[0]
+  pairs = [(proof["premise"], step) for proof in proofs for step in proof["proof"]][:len(proofs) * 4]
+  model.verify_step(*pairs[0])
+
+  return summarize(timed_each(lambda pair: model.verify_step(*pair), pairs), 0, len(pairs))
+
+def bench_nli_proof(proofs: list, models_dir: str) -> dict:
+  model = tiny_nli_models(models_dir)[0]
+  model.verify_proof(proofs[0])
+
+  return summarize(timed_each(model.verify_proof, proofs), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_ensemble_proof(proofs: list, models_dir: str) -> dict:
+  from Code.verification.verification_model import VerificationModel
+
+  ensemble = VerificationModel(tiny_nli_models(models_dir))
+  ensemble.verify_proof(proofs[0])
+
+  return summarize(timed_each(ensemble.verify_proof, proofs), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_ensemble_batched(proofs: list, models_dir: str) -> dict:
+  from Code.verification.verification_model import VerificationModel
+
+  ensemble = VerificationModel(tiny_nli_models(models_dir))
+  ensemble.verify_proofs(proofs[:2])
+  batches = [proofs[lo:lo + 64] for lo in range(0, len(proofs), 64)]
+
+  return summarize(timed_each(ensemble.verify_proofs, batches), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_verify_latex(proofs: list, models_dir: str) -> dict:
+  from Code.utils.utils import verify_latex
+  from Code.main import LATEX_TEMPLATE
+
+  if shutil.which("pdflatex") is None:
+    return {"skipped": "pdflatex not found"}
+
+  with tempfile.TemporaryDirectory() as folder:
+    path = os.path.join(folder, "syntax-verification.jsonl")
+
+    return summarize(timed_each(lambda proof: verify_latex(path, proof, LATEX_TEMPLATE), proofs), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_latex_pool(proofs: list, models_dir: str) -> dict:
+  from Code.utils.latex import LatexPool
+  from Code.main import LATEX_TEMPLATE, LATEX_WORKERS, LATEX_BATCH_SIZE
+
+  if shutil.which("pdflatex") is None:
+    return {"skipped": "pdflatex not found"}
+
+  with LatexPool(LATEX_TEMPLATE, LATEX_WORKERS, batch_size = LATEX_BATCH_SIZE) as latex_pool:
+    return summarize(timed_each(latex_pool.verify_many, [proofs]), len(proofs), sum(len(proof["proof"]) for proof in proofs))
+
+def bench_statistics(proofs: list, models_dir: str) -> dict:
+  from Code.utils.statistics import StatisticsEngine
+
+  # annotated verification files for 5 models x 2 temperatures x 2 attempts
+  rng = random.Random(0)
+  models, temperatures = [f"MODEL{i}" for i in range(5)], [0.0, 1.0]
+
+  with tempfile.TemporaryDirectory() as folder:
+    for model in models:
+      for attempt in ["Attempt 1", "Attempt 2"]:
+        for temperature in temperatures:
+          path = os.path.join(folder, model, attempt, f"Temperature-{temperature}")
+          os.makedirs(path)
+
+          with open(os.path.join(path, "verification.jsonl"), "w") as f:
+            for proof in proofs:
+              record = {
+                "id": proof["id"],
+                "prompt type": proof["prompt type"],
+                "classifications": [rng.random() < 0.5 for _ in range(5)],
+                "success": rng.random() < 0.5,
+                "success-human": rng.random() < 0.5,
+                "clarity": rng.randint(1, 5),
+                "descriptiveness": rng.randint(1, 5),
+                "redundancy": rng.randint(0, 100),
+                "steps": len(proof["proof"])
+              }
+              f.write(json.dumps(record) + "\n")
+
+    engine = StatisticsEngine()
+    compute = engine.compute
+    latencies = []
+
+    def timed_compute(*args, **kwargs):
+      start = time.perf_counter()
+      result = compute(*args, **kwargs)
+      latencies.append(time.perf_counter() - start)
+
+      return result
+
+    engine.compute = timed_compute
+    engine.report(folder, models, temperatures)
+
+  n_proofs = len(proofs) * len(models) * len(temperatures)
+
+  return summarize(latencies, n_proofs, sum(len(proof["proof"]) for proof in proofs) * len(models) * len(temperatures))
+
+def run_component(name: str, limit: int, models_dir: str) -> dict:
+  import resource
+
+  proofs = synthetic_proofs(PROPOSITIONS_PATH)[:limit]
+
+  # the result is the only thing the child writes to stdout
+  with contextlib.redirect_stdout(sys.stderr):
+    result = globals()[f"bench_{name}"](proofs, models_dir)
+  # ru_maxrss is in kilobytes on Linux
+  result["peak rss mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+  return result
+
+def git_commit() -> str | None:
+  try:
+    return subprocess.run(["git", "rev-parse", "HEAD"], cwd = PACKAGE_DIR, capture_output = True, text = True, check = True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def main(argv: list | None = None):
+  parser = argparse.ArgumentParser(description = "Offline benchmarks of the generation, verification, LaTeX and statistics hot paths")
+  parser.add_argument("--components", nargs = "+", choices = COMPONENTS, default = COMPONENTS)
+  parser.add_argument("--limit", type = int, default = 200, help = "number of synthetic proofs per component")
+  parser.add_argument("--models-dir", default = None, help = "where to keep the tiny models, a temporary folder by default")
+  parser.add_argument("--output", default = None, help = "write the results here as JSON as well as printing them")
+  parser.add_argument("--component", default = None, help = argparse.SUPPRESS) # set in the child processes
+  args = parser.parse_args(argv)
+
+  if args.component is not None:
+    print(json.dumps(run_component(args.component, args.limit, args.models_dir)))
+    return
+
+  with tempfile.TemporaryDirectory() as models_dir:
+    models_dir = args.models_dir or models_dir
+    results = {}
+
+    for name in args.components:
+      completed = subprocess.run(
+        [sys.executable, "-m", "Code.benchmarks.suite", "--component", name, "--limit", str(args.limit), "--models-dir", models_dir],
+        cwd = PARENT_DIR,
+        capture_output = True,
+        text = True
+      )
+
+      if completed.returncode == 0:
+        results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+      else:
+        results[name] = {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit code {completed.returncode}"}
+
+  report = {
+    "commit": git_commit(),
+    "python": platform.python_version(),
+    "machine": platform.machine(),
+    "cpus": os.cpu_count(),
+    "limit": args.limit,
+    "components": results
+  }
+  print(json.dumps(report, indent = 2))
+
+  if args.output is not None:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+  main()
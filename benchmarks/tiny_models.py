@@ -0,0 +1,69 @@
+from Code.utils.utils import parse_jsonl
+import random
+import os
+
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]"]
+
+def proposition_words(propositions_path: str) -> list:
+  words = set()
+
+  for proposition in parse_jsonl(propositions_path):
+    words.update(f'{proposition["statement"]} {proposition["example"]}'.split())
+
+  return sorted(words)
+
+def build_tiny_model(path: str, words: list, tokenizer_seed: int = 0, model_seed: int = 0, hidden_size: int = 32, layers: int = 2, max_length: int = 256):
+  # a randomly initialised BERT classifier with 3 labels and a whitespace word-level tokenizer,
+  # saved like a hub checkpoint so NLIModel loads it by path
+  from tokenizers import Tokenizer, models, pre_tokenizers, processors
+  from transformers import PreTrainedTokenizerFast, BertConfig, BertForSequenceClassification
+  import torch
+
+  shuffled = list(words)
+  random.Random(tokenizer_seed).shuffle(shuffled)
+  vocab = {word: i for i, word in enumerate(SPECIAL_TOKENS + shuffled)}
+
+  tokenizer = Tokenizer(models.WordLevel(vocab, unk_token = "[UNK]"))
+  tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+  tokenizer.post_processor = processors.TemplateProcessing(
+    single = "[CLS] $A [SEP]",
+    pair = "[CLS] $A [SEP] $B [SEP]",
+    special_tokens = [("[CLS]", vocab["[CLS]"]), ("[SEP]", vocab["[SEP]"])]
+  )
+  fast_tokenizer = PreTrainedTokenizerFast(
+    tokenizer_object = tokenizer,
+    pad_token = "[PAD]",
+    unk_token = "[UNK]",
+    cls_token = "[CLS]",
+    sep_token = "[SEP]",
+    model_max_length = max_length
+  )
+
+  torch.manual_seed(model_seed)
+  config = BertConfig(
+    vocab_size = len(vocab),
+    hidden_size = hidden_size,
+    num_hidden_layers = layers,
+    num_attention_heads = 2,
+    intermediate_size = hidden_size * 2,
+    max_position_embeddings = max_length,
+    num_labels = 3
+  )
+  BertForSequenceClassification(config).save_pretrained(path)
+  fast_tokenizer.save_pretrained(path)
+
+def build_tiny_ensemble(folder: str, propositions_path: str) -> list:
+  # five checkpoints in NLIModelType order; the last three share a tokenizer like the DeBERTa-v3 models
+  words = proposition_words(propositions_path)
+  tokenizer_seeds = [1, 2, 3, 3, 3]
+  paths = []
+
+  for i, tokenizer_seed in enumerate(tokenizer_seeds):
+    path = os.path.join(folder, f"tiny-{i}")
+
+    if not os.path.exists(os.path.join(path, "config.json")):
+      build_tiny_model(path, words, tokenizer_seed, i)
+
+    paths.append(path)
+
+  return paths
@@ -0,0 +1,59 @@
+from Code.verification.verification_model import NLIModelType, NLIModel, VerificationModel
+from Code.verification import shared_tokenizers
+from Code.utils.synthetic import synthetic_proofs
+from Code.config import NLI_MODEL_NAMES
+import argparse
+import json
+import time
+import os
+
+# run from the directory containing Code/: python -m Code.benchmarks.tokenization
+PROPOSITIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "propositions.jsonl")
+
+def timed(function, *args) -> tuple:
+  start = time.perf_counter()
+  result = function(*args)
+
+  return time.perf_counter() - start, result
+
+def main(argv: list | None = None):
+  parser = argparse.ArgumentParser(description = "Tokenization time with and without sharing encodings between NLI models")
+  parser.add_argument("--model-name", action = "append", default = [], metavar = "TYPE=NAME", help = "override a checkpoint, e.g. BART=/path/to/model")
+  parser.add_argument("--limit", type = int, default = 200, help = "number of synthetic proofs")
+  args = parser.parse_args(argv)
+
+  overrides = dict(item.split("=", 1) for item in args.model_name)
+  models = [NLIModel(model_type, overrides.get(model_type.name, NLI_MODEL_NAMES[model_type.value]), "cpu", 50) for model_type in NLIModelType]
+  proofs = synthetic_proofs(PROPOSITIONS_PATH)[:args.limit]
+
+  for model in models:
+    model.load()
+
+  # encoding alone, every model on its own versus once per encoding key
+  separate_seconds = sum(timed(model.encode_proofs, proofs)[0] for model in models)
+  groups = {}
+
+  for model in models:
+    groups.setdefault(model.encoding_key(), model)
+
+  shared_seconds = sum(timed(model.encode_proofs, proofs)[0] for model in groups.values())
+
+  # end to end, which includes the forward passes
+  classify_separate, separate = timed(VerificationModel(models, share_tokenization = False).classify_proofs, proofs)
+  classify_shared, shared = timed(VerificationModel(models, share_tokenization = True).classify_proofs, proofs)
+
+  result = {
+    "proofs": len(proofs),
+    "models": len(models),
+    "tokenizers loaded": len(shared_tokenizers.by_fingerprint),
+    "encoding groups": len(groups),
+    "encode seconds separate": separate_seconds,
+    "encode seconds shared": shared_seconds,
+    "classify seconds separate": classify_separate,
+    "classify seconds shared": classify_shared,
+    "same classifications": separate == shared
+  }
+  print(json.dumps(result, indent = 2))
+
+if __name__ == "__main__":
+  main()
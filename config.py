@@ -0,0 +1,6 @@
+# settings shared by main.py and the standalone verification scripts, kept here so those scripts don't import main
+GRADE_THRESHOLD = 50
+NLI_BATCH_SIZE = 16
+NLI_MAX_BATCH_TOKENS = 8192
+VERIFY_CHUNK_SIZE = 64 # proofs verified per batch before results are written
+NLI_MODEL_NAMES = ["Jaehun/PrismNLI-0.4B", "facebook/bart-large-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli-fever-anli", "MoritzLaurer/DeBERTa-v3-large-mnli-fever-anli-ling-wanli"]
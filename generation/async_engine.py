@@ -0,0 +1,173 @@
+from openai import APIStatusError, APIConnectionError, APITimeoutError
+from Code.generation.generation_model import close_async_clients
+import asyncio
+import random
+import time
+
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+UNSUPPORTED_STATUS_CODES = [400, 422] # how providers reject a parameter such as `n`
+
+class TokenBucket():
+  def __init__(self, rate: float, capacity: int):
+    self.rate = rate
+    self.capacity = capacity
+    self.tokens = capacity
+    self.updated = time.monotonic()
+    self.lock = asyncio.Lock()
+
+  async def acquire(self):
+    async with self.lock:
+      while True:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+
+        await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncGenEngine():
+  # limits maps a model name or base URL to its own concurrency cap
+  def __init__(self, concurrency: int = 8, requests_per_second: float = 5, burst: int = 10, max_retries: int = 5, base_delay: float = 1, max_delay: float = 60, limits: dict | None = None):
+    self.concurrency = concurrency
+    self.requests_per_second = requests_per_second
+    self.burst = burst
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.limits = limits or {}
+    self.semaphores = {}
+    self.buckets = {}
+
+  def semaphore(self, model) -> asyncio.Semaphore:
+    key = (model.url, model.model_name)
+
+    if key not in self.semaphores:
+      limit = self.limits.get(model.model_name, self.limits.get(model.url, self.concurrency))
+      self.semaphores[key] = asyncio.Semaphore(limit)
+
+    return self.semaphores[key]
+
+  def bucket(self, model) -> TokenBucket:
+    if model.url not in self.buckets:
+      self.buckets[model.url] = TokenBucket(self.requests_per_second, self.burst)
+
+    return self.buckets[model.url]
+
+  def is_retryable(self, e: Exception) -> bool:
+    if isinstance(e, APIStatusError):
+      return e.status_code in RETRY_STATUS_CODES
+
+    return isinstance(e, (APIConnectionError, APITimeoutError))
+
+  def backoff(self, attempt: int) -> float:
+    # full jitter: uniform over [0, capped exponential delay]
+    return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+  async def request(self, model, system_prompt: str, prompt: list, metrics: dict | None = None, n: int = 1) -> str | list:
+    # one provider call under the concurrency and rate limits, retried on 429/5xx and connection errors
+    for attempt in range(self.max_retries + 1):
+      if metrics is not None:
+        metrics.clear()
+
+      try:
+        async with self.semaphore(model):
+          await self.bucket(model).acquire()
+
+          return await model.request_async(system_prompt, prompt, metrics, n)
+      except Exception as e:
+        if attempt == self.max_retries or not self.is_retryable(e):
+          raise
+
+      await asyncio.sleep(self.backoff(attempt))
+
+  async def call(self, model, system_prompt: str, prompt: list, sample: int = 0, metrics: dict | None = None) -> str:
+    # cache hits skip the concurrency and rate limits; metrics is filled in by streaming requests
+    if (cached := model.cached_response(system_prompt, prompt, sample)) is not None:
+      return cached
+
+    content = await self.request(model, system_prompt, prompt, metrics)
+    model.store_response(system_prompt, prompt, sample, content)
+
+    return content
+
+  async def call_samples(self, jobs: list, system_prompt: str) -> list:
+    # the uncached samples of one prompt are asked for in a single request with n set;
+    # whatever the provider doesn't return is requested one sample at a time
+    model, prompt = jobs[0]["model"], jobs[0]["prompt"]
+    results = [None] * len(jobs)
+
+    for i, job in enumerate(jobs):
+      try:
+        results[i] = model.cached_response(system_prompt, prompt, job.get("sample", 0))
+      except Exception as e:
+        results[i] = e
+
+    missing = [i for i, result in enumerate(results) if result is None]
+
+    if len(missing) > 1 and model.supports_n:
+      try:
+        contents = await self.request(model, system_prompt, prompt, n = len(missing))
+      except Exception as e:
+        if not (isinstance(e, APIStatusError) and e.status_code in UNSUPPORTED_STATUS_CODES):
+          return [e if i in missing else result for i, result in enumerate(results)]
+
+        model.supports_n = False
+        contents = []
+
+      for i, content in zip(missing, contents):
+        model.store_response(system_prompt, prompt, jobs[i].get("sample", 0), content)
+        results[i] = content
+
+    async def single(job: dict) -> str | Exception:
+      try:
+        return await self.call(model, system_prompt, prompt, job.get("sample", 0))
+      except Exception as e:
+        return e
+
+    remaining = [i for i, result in enumerate(results) if result is None]
+
+    for i, result in zip(remaining, await asyncio.gather(*[single(jobs[i]) for i in remaining])):
+      results[i] = result
+
+    return results
+
+  def plan(self, jobs: list) -> list:
+    # jobs for the same theorem, prompt type, model and temperature differ only in their sample
+    # (attempt 1 and attempt 2), so they are grouped to share one request
+    groups = {}
+
+    for job in jobs:
+      model = job["model"]
+
+      if model.stream:
+        groups[id(job)] = [job]
+      else:
+        groups.setdefault((model.url, model.model_name, model.temperature, job["theorem"]["id"], job["prompt type"]), []).append(job)
+
+    return list(groups.values())
+
+  async def run_job(self, job: dict, system_prompt: str, on_response):
+    try:
+      job["metrics"] = {}
+      response = await self.call(job["model"], system_prompt, job["prompt"], job.get("sample", 0), job["metrics"])
+    except Exception as e:
+      response = e
+
+    on_response(job, response)
+
+  async def run_group(self, jobs: list, system_prompt: str, on_response):
+    if len(jobs) == 1:
+      return await self.run_job(jobs[0], system_prompt, on_response)
+
+    for job, response in zip(jobs, await self.call_samples(jobs, system_prompt)):
+      on_response(job, response)
+
+  async def run(self, jobs: list, system_prompt: str, on_response):
+    # on_response(job, str | Exception) is called as each request finishes; the clients opened on this loop are closed at the end
+    try:
+      await asyncio.gather(*[self.run_group(group, system_prompt, on_response) for group in self.plan(jobs)])
+    finally:
+      await close_async_clients()
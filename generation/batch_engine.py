@@ -0,0 +1,140 @@
+from Code.utils.jsonl import loads, dumps
+import hashlib
+import json
+import time
+import os
+
+TERMINAL_STATUSES = ["completed", "failed", "expired", "cancelled"]
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+class BatchError(Exception):
+  def __init__(self, message: str, status_code: int | None = None):
+    super().__init__(message)
+    self.status_code = status_code
+
+class BatchEngine():
+  # sends requests through the provider's Batch API, one batch per (base_url, model) and round;
+  # requests that fail with 429/5xx or are left out of an expired batch go into the next round
+  def __init__(self, folder: str, poll_interval: float = 30, max_rounds: int = 3, completion_window: str = "24h"):
+    self.folder = folder # batch input files and the ids of batches still in flight
+    self.poll_interval = poll_interval
+    self.max_rounds = max_rounds
+    self.completion_window = completion_window
+
+    os.makedirs(self.folder, exist_ok = True)
+
+  def group(self, jobs: list) -> dict:
+    groups = {}
+
+    for job in jobs:
+      model = job["model"]
+      groups.setdefault((model.url, model.api_key, model.model_name), []).append(job)
+
+    return groups
+
+  def submit(self, client, lines: list) -> tuple:
+    # returns (batch id, state file); an identical input still in flight from an interrupted run is picked up instead of resubmitted
+    data = b"".join(dumps(line) + b"\n" for line in lines)
+    name = hashlib.sha256(data).hexdigest()[:16]
+    input_path = os.path.join(self.folder, f"{name}.input.jsonl")
+    state_path = os.path.join(self.folder, f"{name}.json")
+
+    if os.path.exists(state_path):
+      with open(state_path, "r") as f:
+        return json.load(f)["batch id"], state_path
+
+    with open(input_path, "wb") as f:
+      f.write(data)
+
+    with open(input_path, "rb") as f:
+      input_file = client.files.create(file = f, purpose = "batch")
+
+    batch = client.batches.create(input_file_id = input_file.id, endpoint = "/v1/chat/completions", completion_window = self.completion_window)
+
+    with open(state_path, "w") as f:
+      json.dump({"batch id": batch.id, "input file id": input_file.id, "requests": len(lines)}, f)
+
+    return batch.id, state_path
+
+  def wait(self, client, batch_id: str):
+    while (batch := client.batches.retrieve(batch_id)).status not in TERMINAL_STATUSES:
+      time.sleep(self.poll_interval)
+
+    return batch
+
+  def results(self, client, batch, model) -> dict:
+    # custom_id -> response content or BatchError
+    results = {}
+
+    for file_id in [batch.output_file_id, batch.error_file_id]:
+      if not file_id:
+        continue
+
+      for line in client.files.content(file_id).text.splitlines():
+        if not line.strip():
+          continue
+
+        record = loads(line)
+        response = record.get("response") or {}
+        status_code = response.get("status_code")
+
+        try:
+          if status_code != 200:
+            raise BatchError(json.dumps(record.get("error") or response.get("body")), status_code)
+
+          usage = response["body"].get("usage") or {}
+          model.record_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+          results[record["custom_id"]] = model.extract_content(response["body"])
+        except Exception as e:
+          results[record["custom_id"]] = e if isinstance(e, BatchError) else BatchError(str(e))
+
+    return results
+
+  def run(self, jobs: list, system_prompt: str, on_response):
+    # same contract as AsyncGenEngine.run: on_response(job, str | Exception) once per job
+    pending = []
+
+    for job in jobs:
+      try:
+        cached = job["model"].cached_response(system_prompt, job["prompt"], job.get("sample", 0))
+      except Exception as e: # CacheMiss in offline mode
+        on_response(job, e)
+        continue
+
+      if cached is not None:
+        on_response(job, cached)
+      else:
+        pending.append(job)
+
+    for batch_round in range(self.max_rounds):
+      if not pending:
+        return
+
+      submitted = []
+
+      # every batch is submitted before any is waited on, so the provider works on them together
+      for group_jobs in self.group(pending).values():
+        model = group_jobs[0]["model"]
+        lines = [job["model"].batch_request(f"request-{i}", system_prompt, job["prompt"]) for i, job in enumerate(group_jobs)]
+        submitted.append((group_jobs, *self.submit(model.client, lines)))
+
+      pending = []
+
+      for group_jobs, batch_id, state_path in submitted:
+        model = group_jobs[0]["model"]
+        batch = self.wait(model.client, batch_id)
+        results = self.results(model.client, batch, model)
+
+        for i, job in enumerate(group_jobs):
+          result = results.get(f"request-{i}")
+          retryable = result is None or (isinstance(result, BatchError) and result.status_code in RETRY_STATUS_CODES)
+
+          if isinstance(result, str):
+            job["model"].store_response(system_prompt, job["prompt"], job.get("sample", 0), result)
+            on_response(job, result)
+          elif retryable and batch_round < self.max_rounds - 1:
+            pending.append(job)
+          else:
+            on_response(job, result or BatchError(f"No result in batch {batch_id} ({batch.status})"))
+
+        os.remove(state_path)
@@ -1,7 +1,13 @@
 from enum import Enum
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from Code.generation.response_cache import ResponseCache
+from Code.generation.section_parser import END_MARKER, MalformedResponse, SectionParser, parse_sections
+from Code.utils.utils import append_jsonl
+from Code.utils.metrics import METRICS, RATE_BUCKETS
+import asyncio
+import weakref
+import time
 import os
-import json
 
 class GenModelType(Enum):
   DEEPSEEK = 0
@@ -10,8 +16,36 @@ class GenModelType(Enum):
   LLAMA = 3
   O4 = 4
 
+# Anthropic's API has no `n`; other providers that ignore it return fewer choices and are topped up with single calls
+NO_MULTI_SAMPLE = [GenModelType.CLAUDE]
+
+# one client, and so one connection pool, per (base_url, api_key); async clients are also per event loop,
+# and are dropped with it
+clients = {}
+async_clients = weakref.WeakKeyDictionary()
+
+def pooled_client(url: str, api_key: str) -> OpenAI:
+  if (url, api_key) not in clients:
+    clients[url, api_key] = OpenAI(base_url = url, api_key = api_key)
+
+  return clients[url, api_key]
+
+def pooled_async_client(url: str, api_key: str) -> AsyncOpenAI:
+  # retries are left to AsyncGenEngine so backoff is shared across requests
+  loop_clients = async_clients.setdefault(asyncio.get_running_loop(), {})
+
+  if (url, api_key) not in loop_clients:
+    loop_clients[url, api_key] = AsyncOpenAI(base_url = url, api_key = api_key, max_retries = 0)
+
+  return loop_clients[url, api_key]
+
+async def close_async_clients():
+  # closes the connection pools of the running loop, which must happen before the loop itself is closed
+  for client in async_clients.pop(asyncio.get_running_loop(), {}).values():
+    await client.close()
+
 class GenModel():
-  def __init__(self, model_type: GenModelType, model_name: str, temperature: float, url: str, api_key: str, folder_path: str) -> None:
+  def __init__(self, model_type: GenModelType, model_name: str, temperature: float, url: str, api_key: str, folder_path: str, cache: ResponseCache | None = None, stream: bool = False) -> None:
     self.model_type = model_type
     self.model_name = model_name
     self.temperature = temperature
@@ -19,55 +53,180 @@ class GenModel():
     
     self.url = url
     self.api_key = api_key
-    self.client = OpenAI(base_url = self.base_url, api_key = self.api_key)
+    self.client = pooled_client(self.url, self.api_key)
+    self.cache = cache
+    self.stream = stream # stream completions, parsing sections as they arrive
+    self.supports_n = model_type not in NO_MULTI_SAMPLE # cleared if the provider rejects `n`
 
-  def get_response(self, system_prompt: str, prompt: list) -> str:
-    response = self.client.chat.completions.create(
-      model = self.model_name,
-      messages = [
-          {"role": "system", "content": system_prompt},
-          {"role": "user", "content": prompt}
-      ]
-  	)
+  def build_messages(self, system_prompt: str, prompt: list) -> list:
+    return [
+      {"role": "system", "content": system_prompt},
+      {"role": "user", "content": prompt}
+    ]
 
+  def extract_content(self, response) -> str:
+    # response is a completion, or its JSON body in a Batch API output file
     try:
-      return response.choices[0].message.content
-    except Exception as e:
-      raise Exception(f"Unable to generate proof")
-        
-  def parse_response(self, response):
-    response_by_line = map(
-      lambda x: x.strip().strip("*_").strip(),
-      	filter(
-          lambda x: x != "",
-          response.split("\n")
-				)
-		)
-    response = []
-
-    for line in response_by_line:
-      response += list(
-        map(
-          lambda x: x + ".",
-          line.split(".")
-        )
-      )
-        
-    idx_1 = response.index("Variable definitions:")
-    idx_2 = response.index("Proof type(s):")
-    idx_3 = response.index("Proof:")
-    idx_4 = response.index("QED")
+      if isinstance(response, dict):
+        return response["choices"][0]["message"]["content"]
 
-    var_def = "\n".join(response[idx_1 + 1: idx_2])
-    proof_type = response[idx_2 + 1: idx_3]
-    proof = response[idx_3 + 1: idx_4]
+      return response.choices[0].message.content
+    except Exception:
+      raise Exception("Unable to generate proof")
 
+  def batch_request(self, custom_id: str, system_prompt: str, prompt: list) -> dict:
     return {
-      "premise": var_def,
-      "proof type": proof_type,
-      "proof": proof
+      "custom_id": custom_id,
+      "method": "POST",
+      "url": "/v1/chat/completions",
+      "body": {
+        "model": self.model_name,
+        "temperature": self.temperature,
+        "messages": self.build_messages(system_prompt, prompt)
+      }
     }
-  
+
+  def cache_key(self, system_prompt: str, prompt: list, sample: int) -> str | None:
+    if self.cache is None:
+      return None
+
+    return self.cache.key(self.model_name, self.temperature, system_prompt, prompt, sample)
+
+  def cached_response(self, system_prompt: str, prompt: list, sample: int = 0) -> str | None:
+    key = self.cache_key(system_prompt, prompt, sample)
+
+    if key is None:
+      return None
+
+    cached = self.cache.lookup(key)
+    METRICS.count("generation_cache_hits_total" if cached is not None else "generation_cache_misses_total", model = self.model_name)
+
+    return cached
+
+  def store_response(self, system_prompt: str, prompt: list, sample: int, content: str):
+    key = self.cache_key(system_prompt, prompt, sample)
+
+    if key is not None:
+      self.cache.put(key, content)
+
+  def record_usage(self, prompt_tokens: int | None, completion_tokens: int | None, seconds: float | None = None):
+    # seconds is None for Batch API results, whose latency is the batch's and not the request's
+    if prompt_tokens is not None:
+      METRICS.count("generation_prompt_tokens_total", prompt_tokens, model = self.model_name)
+
+    if completion_tokens is not None:
+      METRICS.count("generation_completion_tokens_total", completion_tokens, model = self.model_name)
+
+    if seconds is not None:
+      METRICS.observe("generation_seconds", seconds, model = self.model_name)
+
+      if completion_tokens and seconds > 0:
+        METRICS.observe("generation_tokens_per_second", completion_tokens / seconds, RATE_BUCKETS, model = self.model_name)
+
+  def record_response(self, response, seconds: float):
+    usage = response.usage
+    self.record_usage(usage and usage.prompt_tokens, usage and usage.completion_tokens, seconds)
+
+  def request(self, system_prompt: str, prompt: list) -> str:
+    start = time.perf_counter()
+    response = self.client.chat.completions.create(
+      model = self.model_name,
+      temperature = self.temperature,
+      messages = self.build_messages(system_prompt, prompt)
+    )
+    self.record_response(response, time.perf_counter() - start)
+
+    return self.extract_content(response)
+
+  def get_async_client(self) -> AsyncOpenAI:
+    return pooled_async_client(self.url, self.api_key)
+
+  async def request_async(self, system_prompt: str, prompt: list, metrics: dict | None = None, n: int = 1) -> str | list:
+    # returns a list of up to n contents when n > 1
+    if self.stream:
+      return await self.request_stream(system_prompt, prompt, {} if metrics is None else metrics)
+
+    start = time.perf_counter()
+    response = await self.get_async_client().chat.completions.create(
+      model = self.model_name,
+      temperature = self.temperature,
+      messages = self.build_messages(system_prompt, prompt),
+      **({"n": n} if n > 1 else {})
+    )
+    self.record_response(response, time.perf_counter() - start)
+
+    if n > 1:
+      return [choice.message.content for choice in sorted(response.choices, key = lambda choice: choice.index) if choice.message.content]
+
+    return self.extract_content(response)
+
+  async def request_stream(self, system_prompt: str, prompt: list, metrics: dict) -> str:
+    # stops reading at QED and raises MalformedResponse as soon as the template is broken, or when the stream ends
+    # without QED; metrics gets time to first token, total seconds, tokens generated and why the stream ended.
+    # QED is not sent as a stop sequence: "stop" is also the finish reason of a model that simply ended, so a
+    # response only counts as complete when QED actually arrives, and the stream is cut here as soon as it does
+    parser = SectionParser()
+    chunks, n_chunks, finish_reason, prompt_tokens = [], 0, None, None
+    start = time.perf_counter()
+
+    stream = await self.get_async_client().chat.completions.create(
+      model = self.model_name,
+      temperature = self.temperature,
+      messages = self.build_messages(system_prompt, prompt),
+      stream = True,
+      stream_options = {"include_usage": True}
+    )
+
+    try:
+      async for chunk in stream:
+        if chunk.usage is not None:
+          metrics["tokens"] = chunk.usage.completion_tokens
+          prompt_tokens = chunk.usage.prompt_tokens
+
+        if not chunk.choices:
+          continue
+
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        text = chunk.choices[0].delta.content
+
+        if text:
+          metrics.setdefault("ttft", time.perf_counter() - start)
+          chunks.append(text)
+          n_chunks += 1
+
+          if parser.feed(text):
+            finish_reason = "qed"
+            break
+    except MalformedResponse:
+      finish_reason = "malformed"
+      raise
+    finally:
+      await stream.close()
+      metrics.setdefault("tokens", n_chunks) # providers send about one token per chunk when usage is cut off
+      metrics["seconds"] = time.perf_counter() - start
+      metrics["finish reason"] = finish_reason
+      self.record_usage(prompt_tokens, metrics["tokens"], metrics["seconds"])
+      METRICS.count("generation_streams_total", model = self.model_name, finish_reason = finish_reason)
+
+    if finish_reason == "length":
+      raise MalformedResponse(f'Response truncated at {metrics["tokens"]} tokens before "{END_MARKER}"')
+
+    parser.finish()
+
+    return "".join(chunks)
+
+  def get_response(self, system_prompt: str, prompt: list, sample: int = 0) -> str:
+    if (cached := self.cached_response(system_prompt, prompt, sample)) is not None:
+      return cached
+
+    content = self.request(system_prompt, prompt)
+    self.store_response(system_prompt, prompt, sample, content)
+
+    return content
+        
+  def parse_response(self, response: str) -> dict:
+    return parse_sections(response)
+
   def write_response(self, theorem: dict, prompt_type: str, response: dict) -> dict:
     response_dict = {
 			"id": theorem["id"],
@@ -77,8 +236,7 @@ class GenModel():
       "proof": response["proof"],
 		}
       
-    with open(self.path, "a") as file:
-      file.write(f'{json.dumps(response_dict)}\n')
+    append_jsonl(self.path, response_dict)
 
     return response_dict
       
\ No newline at end of file
@@ -0,0 +1,111 @@
+from enum import Enum
+import hashlib
+import json
+import time
+import os
+
+class CacheMode(Enum):
+  READ_THROUGH = 0 # serve hits, call the provider on misses and store the answer
+  REFRESH = 1 # always call the provider and overwrite the stored answer
+  OFFLINE = 2 # serve hits only, misses raise CacheMiss
+
+class CacheMiss(Exception):
+  pass
+
+class ResponseCache():
+  def __init__(self, folder: str, mode: CacheMode = CacheMode.READ_THROUGH, max_bytes: int | None = None, max_age: float | None = None, evict_every: int = 100):
+    self.folder = folder
+    self.mode = mode
+    self.max_bytes = max_bytes
+    self.max_age = max_age # seconds
+    self.evict_every = evict_every
+    self.writes = 0
+    self.hits = 0
+    self.misses = 0
+
+    os.makedirs(self.folder, exist_ok = True)
+    self.evict()
+
+  def key(self, model_name: str, temperature: float, system_prompt: str, prompt: list, sample: int = 0) -> str:
+    material = json.dumps([model_name, temperature, system_prompt, prompt, sample], sort_keys = True)
+
+    return hashlib.sha256(material.encode()).hexdigest()
+
+  def path(self, key: str) -> str:
+    return os.path.join(self.folder, key[:2], f"{key}.json")
+
+  def get(self, key: str) -> str | None:
+    path = self.path(key)
+
+    try:
+      with open(path, "r") as f:
+        entry = json.load(f)
+    except (OSError, ValueError):
+      self.misses += 1
+      return None
+
+    if self.max_age is not None and time.time() - entry["created"] > self.max_age:
+      os.remove(path)
+      self.misses += 1
+      return None
+
+    # atime is the last-used time for eviction, mtime stays the creation time
+    os.utime(path, (time.time(), os.stat(path).st_mtime))
+    self.hits += 1
+
+    return entry["response"]
+
+  def put(self, key: str, response: str):
+    path = self.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "w") as f:
+      json.dump({"created": time.time(), "response": response}, f)
+
+    os.replace(tmp_path, path)
+    self.writes += 1
+
+    if self.writes % self.evict_every == 0:
+      self.evict()
+
+  def evict(self):
+    entries = []
+    now = time.time()
+
+    for root, _, files in os.walk(self.folder):
+      for name in files:
+        if not name.endswith(".json"):
+          continue
+
+        path = os.path.join(root, name)
+        stat = os.stat(path)
+
+        if self.max_age is not None and now - stat.st_mtime > self.max_age:
+          os.remove(path)
+        else:
+          entries.append((stat.st_atime, stat.st_size, path))
+
+    if self.max_bytes is None:
+      return
+
+    total = sum(size for _, size, _ in entries)
+
+    # least recently used first
+    for _, size, path in sorted(entries):
+      if total <= self.max_bytes:
+        break
+
+      os.remove(path)
+      total -= size
+
+  def lookup(self, key: str) -> str | None:
+    if self.mode == CacheMode.REFRESH:
+      return None
+
+    response = self.get(key)
+
+    if response is None and self.mode == CacheMode.OFFLINE:
+      raise CacheMiss(f"No cached response for {key}")
+
+    return response
@@ -0,0 +1,118 @@
+import re
+
+SECTION_HEADERS = ["Variable definitions:", "Proof type(s):", "Proof:"]
+END_MARKER = "QED"
+MAX_PREAMBLE_LINES = 100 # lines allowed before "Variable definitions:", e.g. chain of thought
+MAX_SECTION_LINES = 200 # longer sections are treated as runaway output
+
+class MalformedResponse(Exception):
+  pass
+
+class SectionParser():
+  # consumes the response a chunk at a time and raises MalformedResponse as soon as the template is broken
+  def __init__(self):
+    self.buffer = ""
+    self.section = None # index into SECTION_HEADERS, None before the first header
+    self.sections = [[] for _ in SECTION_HEADERS]
+    self.preamble_lines = 0
+    self.done = False
+
+  def feed(self, text: str) -> bool:
+    # returns True once QED has been seen, after which further text is ignored
+    if self.done:
+      return True
+
+    *lines, self.buffer = (self.buffer + text).split("\n")
+
+    for line in lines:
+      self.add_line(line)
+
+      if self.done:
+        return True
+
+    # QED is usually the last line, so it is accepted before its newline arrives
+    if self.clean(self.buffer) == END_MARKER:
+      self.add_line(self.buffer)
+      self.buffer = ""
+
+    return self.done
+
+  def clean(self, line: str) -> str:
+    return line.strip().strip("*_#").strip()
+
+  def add_line(self, line: str):
+    line = self.clean(line)
+
+    if not line or self.done:
+      return
+
+    for idx, header in enumerate(SECTION_HEADERS):
+      if line.startswith(header):
+        expected = 0 if self.section is None else self.section + 1
+
+        if idx != expected:
+          raise MalformedResponse(f'Unexpected "{header}"')
+
+        self.section = idx
+        line = self.clean(line[len(header):])
+
+        if line:
+          self.add_content(line)
+
+        return
+
+    if line.rstrip(".") == END_MARKER or line.endswith(f" {END_MARKER}") or line.endswith(f" {END_MARKER}."):
+      self.add_content(self.clean(line[:line.rindex(END_MARKER)]))
+      self.end()
+    else:
+      self.add_content(line)
+
+  def add_content(self, line: str):
+    if not line:
+      return
+
+    if self.section is None:
+      self.preamble_lines += 1
+
+      if self.preamble_lines > MAX_PREAMBLE_LINES:
+        raise MalformedResponse(f'No "{SECTION_HEADERS[0]}" in the first {MAX_PREAMBLE_LINES} lines')
+
+      return
+
+    self.sections[self.section].append(line)
+
+    if len(self.sections[self.section]) > MAX_SECTION_LINES:
+      raise MalformedResponse(f'"{SECTION_HEADERS[self.section]}" is longer than {MAX_SECTION_LINES} lines')
+
+  def end(self):
+    if self.section != len(SECTION_HEADERS) - 1:
+      raise MalformedResponse(f'"{END_MARKER}" before "{SECTION_HEADERS[-1]}"')
+
+    self.done = True
+
+  def finish(self) -> dict:
+    if not self.done:
+      self.add_line(self.buffer)
+      self.buffer = ""
+
+    if not self.done:
+      raise MalformedResponse(f'Response ended before "{END_MARKER}"')
+
+    definitions, proof_types, proof = self.sections
+    steps = [sentence for line in proof for sentence in re.split(r"(?<=\.)\s+", line) if sentence]
+
+    # a proof without steps can't be graded, so it is rejected here rather than written out
+    if not steps:
+      raise MalformedResponse(f'"{SECTION_HEADERS[-1]}" has no steps')
+
+    return {
+      "premise": "\n".join(definitions),
+      "proof type": proof_types,
+      "proof": steps
+    }
+
+def parse_sections(response: str) -> dict:
+  parser = SectionParser()
+  parser.feed(response)
+
+  return parser.finish()
@@ -0,0 +1,292 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+from email.parser import BytesParser
+from email import policy
+import random
+import json
+import re
+import time
+import sys
+
+# a minimal OpenAI-compatible server for running generation without a provider
+STUB_PROOF = '''Variable definitions:
+Let $A$, $B$ and $C$ be sets.
+
+Proof type(s):
+Direct proof.
+
+Proof:
+Let $x \\in A$.
+Since $A \\subseteq B$, we have $x \\in B$.
+Since $B \\subseteq C$, we have $x \\in C$.
+Hence $A \\subseteq C$.
+QED'''
+
+class StubHandler(BaseHTTPRequestHandler):
+  def log_message(self, format, *args):
+    pass
+
+  def send_json(self, status: int, body: dict):
+    payload = json.dumps(body).encode()
+    self.send_response(status)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(payload)))
+    self.end_headers()
+    self.wfile.write(payload)
+
+  def read_json(self) -> dict:
+    length = int(self.headers.get("Content-Length", 0))
+
+    return json.loads(self.rfile.read(length) or b"{}")
+
+  def reply(self, request: dict) -> tuple:
+    # (content, finish reason), cut at the first stop sequence, or at max_tokens words, like a real provider
+    content = self.server.content
+    stops = request.get("stop") or []
+    cuts = [content.index(stop) for stop in ([stops] if isinstance(stops, str) else stops) if stop in content]
+    content = content[:min(cuts)] if cuts else content
+    words = re.findall(r"\S+\s*|\s+", content)
+
+    if self.server.max_tokens is not None and len(words) > self.server.max_tokens:
+      return "".join(words[:self.server.max_tokens]), "length"
+
+    return content, "stop"
+
+  def completion(self, request: dict) -> dict:
+    content, finish_reason = self.reply(request)
+    n = request.get("n", 1)
+
+    return {
+      "id": f"chatcmpl-{random.getrandbits(32):08x}",
+      "object": "chat.completion",
+      "created": int(time.time()),
+      "model": request.get("model", "stub"),
+      "choices": [
+        {"index": i, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}
+        for i in range(n)
+      ],
+      "usage": {
+        "prompt_tokens": sum(len(str(m.get("content", "")).split()) for m in request.get("messages", [])),
+        "completion_tokens": len(content.split()) * n,
+        "total_tokens": 0
+      }
+    }
+
+  def send_stream(self, request: dict):
+    # server-sent events, one word per chunk
+    content, finish_reason = self.reply(request)
+    words = re.findall(r"\S+\s*|\s+", content)
+    chunk_id = f"chatcmpl-{random.getrandbits(32):08x}"
+    chunk = lambda choices, usage = None: {
+      "id": chunk_id,
+      "object": "chat.completion.chunk",
+      "created": int(time.time()),
+      "model": request.get("model", "stub"),
+      "choices": choices,
+      "usage": usage
+    }
+    events = [chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+    events += [chunk([{"index": 0, "delta": {"content": word}, "finish_reason": None}]) for word in words]
+    events.append(chunk([{"index": 0, "delta": {}, "finish_reason": finish_reason}]))
+
+    if (request.get("stream_options") or {}).get("include_usage"):
+      events.append(chunk([], {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}))
+
+    self.send_response(200)
+    self.send_header("Content-Type", "text/event-stream")
+    self.end_headers()
+
+    try:
+      for event in events:
+        self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+        self.wfile.flush()
+
+        if self.server.token_latency:
+          time.sleep(self.server.token_latency)
+
+      self.wfile.write(b"data: [DONE]\n\n")
+    except (BrokenPipeError, ConnectionResetError):
+      pass # the client stopped reading
+
+    self.close_connection = True
+
+  def read_upload(self) -> bytes:
+    # the "file" part of a multipart/form-data body
+    length = int(self.headers.get("Content-Length", 0))
+    message = BytesParser(policy = policy.default).parsebytes(
+      f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + self.rfile.read(length)
+    )
+
+    for part in message.iter_parts():
+      if part.get_param("name", header = "content-disposition") == "file":
+        return part.get_payload(decode = True)
+
+    return b""
+
+  def new_id(self, prefix: str) -> str:
+    return f"{prefix}-{random.getrandbits(48):012x}"
+
+  def file_object(self, file_id: str, purpose: str) -> dict:
+    return {"id": file_id, "object": "file", "bytes": len(self.server.files[file_id]), "created_at": int(time.time()), "filename": f"{file_id}.jsonl", "purpose": purpose}
+
+  def batch_object(self, batch: dict) -> dict:
+    # a batch reports in_progress until batch_latency has passed, then its outputs are written
+    if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.server.batch_latency:
+      self.run_batch(batch)
+
+    return {
+      "id": batch["id"],
+      "object": "batch",
+      "endpoint": batch["endpoint"],
+      "input_file_id": batch["input_file_id"],
+      "completion_window": batch["completion_window"],
+      "status": batch["status"],
+      "output_file_id": batch.get("output_file_id"),
+      "error_file_id": batch.get("error_file_id"),
+      "created_at": int(batch["created_at"]),
+      "request_counts": batch["request_counts"]
+    }
+
+  def run_batch(self, batch: dict):
+    outputs, errors = [], []
+
+    for line in self.server.files[batch["input_file_id"]].decode().splitlines():
+      if not line.strip():
+        continue
+
+      request = json.loads(line)
+      self.server.requests += 1
+      record = {"id": self.new_id("batch_req"), "custom_id": request["custom_id"], "error": None}
+
+      if random.random() < self.server.failure_rate:
+        record["response"] = {"status_code": 500, "request_id": self.new_id("req"), "body": {"error": {"message": "stub failure", "type": "server_error"}}}
+        errors.append(record)
+      else:
+        record["response"] = {"status_code": 200, "request_id": self.new_id("req"), "body": self.completion(request["body"])}
+        outputs.append(record)
+
+    for key, records in [("output_file_id", outputs), ("error_file_id", errors)]:
+      if records:
+        file_id = self.new_id("file")
+        self.server.files[file_id] = "".join(json.dumps(record) + "\n" for record in records).encode()
+        batch[key] = file_id
+
+    batch["status"] = "completed"
+    batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+
+  def do_GET(self):
+    path = self.path.rstrip("/")
+
+    with self.server.lock:
+      if (match := re.search(r"/batches/([^/]+)$", path)) and match.group(1) in self.server.batches:
+        self.send_json(200, self.batch_object(self.server.batches[match.group(1)]))
+      elif (match := re.search(r"/files/([^/]+)/content$", path)) and match.group(1) in self.server.files:
+        payload = self.server.files[match.group(1)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/jsonl")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+      else:
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+  def rate_limited(self) -> bool:
+    # the first rate_limit_first requests get a 429
+    with self.server.lock:
+      self.server.rate_limited += 1
+
+      return self.server.rate_limited <= self.server.rate_limit_first
+
+  def do_POST(self):
+    path = self.path.rstrip("/")
+
+    if path.endswith("/files"):
+      file_id = self.new_id("file")
+
+      with self.server.lock:
+        self.server.files[file_id] = self.read_upload()
+        self.send_json(200, self.file_object(file_id, "batch"))
+
+      return
+
+    request = self.read_json()
+
+    if path.endswith("/batches"):
+      with self.server.lock:
+        batch = {
+          "id": self.new_id("batch"),
+          "endpoint": request["endpoint"],
+          "input_file_id": request["input_file_id"],
+          "completion_window": request["completion_window"],
+          "status": "in_progress",
+          "created_at": time.time(),
+          "request_counts": {"total": 0, "completed": 0, "failed": 0}
+        }
+        self.server.batches[batch["id"]] = batch
+        self.send_json(200, self.batch_object(batch))
+
+      return
+
+    if self.server.latency:
+      time.sleep(self.server.latency)
+
+    if self.rate_limited():
+      self.send_json(429, {"error": {"message": "stub rate limit", "type": "rate_limit_error"}})
+    elif random.random() < self.server.failure_rate:
+      self.send_json(random.choice([429, 500, 503]), {"error": {"message": "stub failure", "type": "server_error"}})
+    elif self.path.rstrip("/").endswith("/chat/completions"):
+      self.server.requests += 1
+
+      if request.get("stream"):
+        self.send_stream(request)
+      else:
+        self.send_json(200, self.completion(request))
+    else:
+      self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+class StubServer():
+  def __init__(self, host: str = "127.0.0.1", port: int = 0, content: str = STUB_PROOF, latency: float = 0, failure_rate: float = 0, token_latency: float = 0, batch_latency: float = 0, max_tokens: int | None = None, rate_limit_first: int = 0):
+    self.httpd = ThreadingHTTPServer((host, port), StubHandler)
+    self.httpd.content = content
+    self.httpd.latency = latency
+    self.httpd.failure_rate = failure_rate
+    self.httpd.token_latency = token_latency # seconds between streamed chunks
+    self.httpd.requests = 0
+    self.httpd.batch_latency = batch_latency # seconds before a batch completes
+    self.httpd.max_tokens = max_tokens # longer replies are truncated with finish reason "length"
+    self.httpd.rate_limit_first = rate_limit_first # completion requests answered with 429 before any succeeds
+    self.httpd.rate_limited = 0
+    self.httpd.files = {}
+    self.httpd.batches = {}
+    self.httpd.lock = threading.Lock()
+    self.thread = threading.Thread(target = self.httpd.serve_forever, daemon = True)
+
+  @property
+  def url(self) -> str:
+    host, port = self.httpd.server_address[:2]
+
+    return f"http://{host}:{port}/v1"
+
+  @property
+  def requests(self) -> int:
+    return self.httpd.requests
+
+  def start(self):
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.httpd.shutdown()
+    self.httpd.server_close()
+
+  def __enter__(self):
+    return self.start()
+
+  def __exit__(self, *args):
+    self.stop()
+
+if __name__ == "__main__":
+  port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+  server = StubServer(port = port)
+  print(f"Serving stub OpenAI API on {server.url}")
+  server.httpd.serve_forever()
@@ -1,12 +1,17 @@
-from Code.utils.utils import parse_jsonl, build_prompts, verify_latex
+from Code.utils.utils import append_jsonl, build_prompts, parse_jsonl
+from Code.utils.jsonl import configure_appenders
+from Code.utils.metrics import METRICS
+from Code.utils.resume import ResumeIndex
+from Code.utils.results_store import open_store
 from Code.generation.generation_model import GenModelType, GenModel
-from Code.verification.verification_model import NLIModelType, NLIModel, VerificationModel
+from Code.generation.async_engine import AsyncGenEngine
+from Code.generation.response_cache import CacheMode, ResponseCache
+from Code.config import GRADE_THRESHOLD, NLI_BATCH_SIZE, NLI_MAX_BATCH_TOKENS, NLI_MODEL_NAMES, VERIFY_CHUNK_SIZE
 from datetime import datetime
 
-import torch
-import json
+import argparse
+import asyncio
 import os
-import sys
 
 SYSTEM_PROMPT = '''
 You are a mathematician with an excellent understanding of undergraduate and high-school level mathematics.
@@ -43,104 +48,408 @@ LATEX_TEMPLATE = rf'''
 %s
 \end{{document}}
 '''
-DEVICE = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-GRADE_THRESHOLD = 50
-
-nli_model_names = ["Jaehun/PrismNLI-0.4B", "facebook/bart-large-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli-fever-anli", "MoritzLaurer/DeBERTa-v3-large-mnli-fever-anli-ling-wanli"]
-nli_models = [NLIModel(model_type, nli_model_names[model_type.value], DEVICE, GRADE_THRESHOLD) for model_type in NLIModelType]
-verification_model = VerificationModel(nli_models)
-
-base_url, api_key, folder_path, proofs_path, attempt = sys.argv
-temperatures = [0.0, 0.4, 0.8, 1.0]
-model_names = ["deepseek/deepseek-r1-0528", "openai/gpt-4.1", "anthropic/claude-sonnet-4", "meta-llama/llama-3.1-405b-instruct", "openai/o4-mini-high"]
-
-for model_type in GenModelType:
-  path = os.path.join(folder_path, f'{model_type.name}')
-  attempt_1_folder = os.path.join(path, "Attempt 1")
-  attempt_2_folder = os.path.join(path, "Attempt 2")
-  
-  if not os.path.exists(path):
-    os.makedirs(path)
-    os.makedirs(attempt_1_folder)
-    os.makedirs(attempt_2_folder)
-    
-    for temperature in temperatures:
-      os.makedirs(os.path.join(attempt_1_folder, f"Temperature-{temperature}"))
-      os.makedirs(os.path.join(attempt_2_folder, f"Temperature-{temperature}"))
-    
-theorems_json = parse_jsonl(proofs_path)
-theorems = build_prompts(theorems_json)
+GENERATION_CONCURRENCY = 8 # in-flight requests per model
+REQUESTS_PER_SECOND = 5 # per provider
+MAX_RETRIES = 5
+BATCH_POLL_INTERVAL = 30 # seconds between batch status checks
+BATCH_MAX_ROUNDS = 3 # batches submitted for requests that failed with 429/5xx
+CACHE_MODE = CacheMode.READ_THROUGH
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_MAX_AGE = None # seconds, None keeps entries until evicted by size
+SCORE_CACHE_MAX_ENTRIES = 5_000_000
+LATEX_WORKERS = os.cpu_count()
+LATEX_TIMEOUT = 60 # seconds per proof
+LATEX_BATCH_SIZE = 25 # proofs per TeX run
+PIPELINE_QUEUE_SIZE = 256 # proofs waiting between two stages of `all`
+JSONL_FLUSH_EVERY = 64 # records buffered per output file
+JSONL_FSYNC_EVERY = None # flushes between fsyncs, None leaves it to the OS
+JSONL_UNBUFFERED = ["proofs.jsonl", "generation-error.jsonl"] # written after every record, since a paid response is lost otherwise
+METRICS_FILE = "metrics.jsonl" # one line of latencies, token counts and cache hits per run, in folder_path
+PROMETHEUS_FILE = "metrics.prom" # the same as a Prometheus textfile, rewritten at the end of each run
+
+TEMPERATURES = [0.0, 0.4, 0.8, 1.0]
+GEN_MODEL_NAMES = ["deepseek/deepseek-r1-0528", "openai/gpt-4.1", "anthropic/claude-sonnet-4", "meta-llama/llama-3.1-405b-instruct", "openai/o4-mini-high"]
+PROMPT_TYPES = ["zero shot", "chain of thought", "few shot"]
 
-for temperature in temperatures:
+def attempt_folder(attempt: str) -> str:
+  match attempt:
+    case "1":
+      return "Attempt 1"
+    case "2":
+      return "Attempt 2"
+    case _:
+      raise ValueError("Input a valid attempt")
+
+def make_folders(folder_path: str):
   for model_type in GenModelType:
-    path = os.path.join(folder_path, f'{model_type.name}')
-    
-    match attempt:
-      case 1:
-        path = os.path.join(path, "Attempt 1")
-      case 2:
-        path = os.path.join(path, "Attempt 2")
-      case _:
-        raise ValueError("Input a valid attempt")
-    
-    path = os.path.join(path, f"Temperature-{temperature}")
-    error_path = os.path.join(path, "generation-error.jsonl")
-    log_path = os.path.join(path, "generation-error-log.txt")
-    verification_path = os.path.join(path, "verification.jsonl")
-    syntax_path = os.path.join(path, "syntax-verification.jsonl")
-    failed_path = os.path.join(path, "failed-proofs.jsonl")
-    latex_path = os.path.join(path, "trial.tex")
-    model = GenModel(model_type, model_names[model_type.value], temperature, base_url, api_key, path)
+    for attempt in ["1", "2"]:
+      for temperature in TEMPERATURES:
+        os.makedirs(os.path.join(folder_path, f'{model_type.name}', attempt_folder(attempt), f"Temperature-{temperature}"), exist_ok = True)
+
+def attempts(attempt: str) -> list:
+  return ["1", "2"] if attempt == "all" else [attempt]
+
+def temperature_folders(folder_path: str, attempt: str) -> list:
+  return [
+    (model_type, temperature, os.path.join(folder_path, f'{model_type.name}', attempt_folder(single_attempt), f"Temperature-{temperature}"))
+    for single_attempt in attempts(attempt) for temperature in TEMPERATURES for model_type in GenModelType
+  ]
+
+def results_store(args):
+  return open_store(args.store) if args.store else None
+
+def record_key(path: str, record: dict) -> tuple:
+  return path, record["id"], record["prompt type"]
+
+def chunks(items: list, size: int) -> list:
+  return [items[lo:lo + size] for lo in range(0, len(items), size)]
+
+def check_resume(args, folders: list):
+  # verify and latex always skip proofs already graded, keyed on (id, prompt type), so proofs appended
+  # for the same keys by a second run would never be graded; appending is only allowed with --resume
+  if args.resume:
+    return
+
+  for _, _, path in folders:
+    proofs_path = os.path.join(path, "proofs.jsonl")
+
+    if os.path.exists(proofs_path) and os.path.getsize(proofs_path) > 0:
+      raise FileExistsError(f"{proofs_path} already holds proofs; pass --resume to continue that run, or use a new folder")
+
+def generate(args, on_proof = None, index = None):
+  # on_proof(path, proof) is called after each proof is written, e.g. to feed the pipeline;
+  # the pipeline passes its own index, since building another one would repair files its other stages append to
+  make_folders(args.folder_path)
+
+  if index is None:
+    folders = temperature_folders(args.folder_path, args.attempt)
+    check_resume(args, folders)
+    index = ResumeIndex([path for _, _, path in folders] if args.resume else [], results_store(args))
+
+  theorems_json = parse_jsonl(args.proofs_path)
+  theorems = build_prompts(args.proofs_path)
+  cache = ResponseCache(os.path.join(args.folder_path, "response-cache"), CACHE_MODE, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+  jobs = []
+
+  # each attempt is its own sample of the same prompt, so with "all" both come from one request where n is supported
+  for attempt in attempts(args.attempt):
+    for model_type, temperature, path in temperature_folders(args.folder_path, attempt):
+      model = GenModel(model_type, GEN_MODEL_NAMES[model_type.value], temperature, args.base_url, args.api_key, path, cache, args.stream)
+
+      for i in range(len(theorems)):
+        for j in range(len(theorems[i])):
+          if not index.is_done(path, theorems_json[i]["id"], PROMPT_TYPES[j], "generation"):
+            jobs.append({
+              "model": model,
+              "path": path,
+              "theorem": theorems_json[i],
+              "prompt type": PROMPT_TYPES[j],
+              "prompt": theorems[i][j],
+              "sample": int(attempt) - 1
+            })
+
+  def on_response(job: dict, response: str | Exception):
+    if job.get("metrics"):
+      append_jsonl(os.path.join(job["path"], "generation-metrics.jsonl"), {
+        "id": job["theorem"]["id"],
+        "prompt type": job["prompt type"],
+        "success": not isinstance(response, Exception),
+        **job["metrics"]
+      })
+
+    try:
+      if isinstance(response, Exception):
+        raise response
+
+      response_dict = job["model"].parse_response(response)
+    except Exception as e:
+      append_jsonl(os.path.join(job["path"], "generation-error.jsonl"), job["prompt"][0])
+      
+      with open(os.path.join(job["path"], "generation-error-log.txt"), "a") as f:
+        f.write(f"{str(datetime.now())}: Failed to generate proof for theorem {job['theorem']['id']} prompt type {job['prompt type']}: {e}\n")
+      
+      return
+
+    proof = job["model"].write_response(job["theorem"], job["prompt type"], response_dict)
+    index.add(job["path"], "generation", proof)
+
+    if on_proof is not None:
+      on_proof(job["path"], proof)
+
+  if args.batch:
+    from Code.generation.batch_engine import BatchEngine
+
+    engine = BatchEngine(os.path.join(args.folder_path, "batches"), BATCH_POLL_INTERVAL, BATCH_MAX_ROUNDS)
+    engine.run(jobs, SYSTEM_PROMPT, on_response)
+  else:
+    engine = AsyncGenEngine(GENERATION_CONCURRENCY, REQUESTS_PER_SECOND, max_retries = MAX_RETRIES)
+    asyncio.run(engine.run(jobs, SYSTEM_PROMPT, on_response))
+
+def pending_proofs(folders: list, index: ResumeIndex, stage: str) -> list:
+  pending = []
+
+  for _, _, path in folders:
+    proofs_path = os.path.join(path, "proofs.jsonl")
+
+    if os.path.exists(proofs_path):
+      pending += [(path, proof) for proof in parse_jsonl(proofs_path) if not index.is_done(*record_key(path, proof), stage)]
+
+  return pending
+
+def record_failures(folders: list, index: ResumeIndex, proofs_path: str):
+  # store failed proofs for proof correction once both graders have run
+  statements = {theorem["id"]: theorem["statement"] for theorem in parse_jsonl(proofs_path)}
+
+  for path, proof in pending_proofs(folders, index, "failed"):
+    grading = index.get(*record_key(path, proof), "verification")
+    syntax_grading = index.get(*record_key(path, proof), "latex")
+
+    if grading is None or syntax_grading is None or (grading["success"] and syntax_grading["success"]):
+      continue
+
+    failed_proof_dict = {
+      "id": proof["id"],
+      "prompt type": proof["prompt type"],
+      "statement": statements[proof["id"]],
+      "reason": "" # blank for human reviwe
+    }
+
+    if not syntax_grading["success"]:
+      failed_proof_dict["reason"] = "Incorrect LaTeX syntax."
     
-    for i in range(len(theorems)):
-      theorem = theorems[i]
-
-      for j in range(len(theorem)):
-        prompt = theorem[j]
-        prompt_type = ""
-
-        match i:
-          case 0:
-            prompt_type = "zero shot"
-          case 1:
-            prompt_type = "chain of thought"
-          case 2:
-            prompt_type = "few shot"
-
-        try:
-          response = model.get_response(SYSTEM_PROMPT, prompt)
-          response_dict = model.parse_response(response)
-        except Exception as e:
-          with open(error_path, "a") as f:
-            f.write(f"{json.dumps(prompt[0])}\n")
-          
-          with open(log_path, "a") as f:
-            string_in = f"{str(datetime.now())}: Failed to generate proof for theorem {theorem["id"]} prompt type %s \n"  
-            f.write(string_in % prompt_type)
-          
-          continue
-        
-        written_response = model.write_response(response_json, theorems_json[i], prompt_type, response_dict)
-
-        grading = verification_model.verify_proof(response_dict)
-        verification_model.write_result(verification_path, grading)
-
-        syntax_grading = verify_latex(latex_path, written_response, LATEX_TEMPLATE)
-
-        with open(syntax_path, "a") as f:
-          f.write(f'{json.dumps(syntax_grading)}\n')
-
-        # store failed proofs for proof correction
-        if not grading["success"] or not syntax_grading["success"]:
-          failed_proof_dict = {
-            "id": theorems_json[i]["id"],
-            "prompt type": prompt_type,
-            "statement": theorems_json[i]["statement"],
-            "reason": "" # blank for human reviwe
-          }
-
-          if not syntax_grading["success"]:
-            failed_proof_dict["reason"] = "Incorrect LaTeX syntax."
-          
-          with open(failed_path, "a") as f:
-            f.write(f'{json.dumps(failed_proof_dict)}\n')
\ No newline at end of file
+    append_jsonl(os.path.join(path, "failed-proofs.jsonl"), failed_proof_dict)
+    index.add(path, "failed", failed_proof_dict)
+
+def build_verification_model(args):
+  import torch
+  from Code.verification.verification_model import NLIModelType, NLIModel, VerificationModel
+  from Code.verification.score_cache import ScoreCache
+  from Code.verification.backends import InferenceBackend
+
+  device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+  score_cache = ScoreCache(os.path.join(args.folder_path, "score-cache.sqlite"), SCORE_CACHE_MAX_ENTRIES)
+  model_kwargs = [
+    dict(
+      model_type = model_type,
+      model_name = NLI_MODEL_NAMES[model_type.value],
+      device = device,
+      grade_threshold = GRADE_THRESHOLD,
+      batch_size = NLI_BATCH_SIZE,
+      max_batch_tokens = NLI_MAX_BATCH_TOKENS,
+      early_exit = args.early_exit,
+      score_cache = score_cache,
+      backend = InferenceBackend[args.backend],
+      artifact_dir = os.path.join(args.folder_path, "nli-artifacts")
+    )
+    for model_type in NLIModelType
+  ]
+
+  if args.parallel and not args.model_major:
+    from Code.verification.ensemble_pool import EnsemblePool
+
+    return EnsemblePool(model_kwargs)
+
+  return VerificationModel([NLIModel(**kwargs) for kwargs in model_kwargs], cascade = args.cascade and not args.model_major)
+
+def score_path(path: str, model_type) -> str:
+  return os.path.join(path, f"nli-scores-{model_type.name.lower()}.jsonl")
+
+def verify_model_major(verification_model, pending: list, index: ResumeIndex):
+  verification_model.score_model_major(pending, score_path, VERIFY_CHUNK_SIZE)
+
+  for (path, _), grading in zip(pending, verification_model.merge_model_major(pending, score_path)):
+    verification_model.write_result(os.path.join(path, "verification.jsonl"), grading)
+    index.add(path, "verification", grading)
+
+def verify_chunk(verification_model, chunk: list, index: ResumeIndex):
+  for (path, _), grading in zip(chunk, verification_model.verify_proofs([proof for _, proof in chunk])):
+    verification_model.write_result(os.path.join(path, "verification.jsonl"), grading)
+    index.add(path, "verification", grading)
+
+def latex_chunk(latex_pool, chunk: list, index: ResumeIndex):
+  for (path, _), syntax_grading in zip(chunk, latex_pool.verify_many([proof for _, proof in chunk])):
+    append_jsonl(os.path.join(path, "syntax-verification.jsonl"), syntax_grading)
+    index.add(path, "latex", syntax_grading)
+
+def verify(args):
+  folders = temperature_folders(args.folder_path, args.attempt)
+  index = ResumeIndex([path for _, _, path in folders], results_store(args))
+  pending = pending_proofs(folders, index, "verification")
+
+  if pending:
+    verification_model = build_verification_model(args)
+
+    # the worker processes of --parallel are stopped even when verification fails
+    try:
+      if args.model_major:
+        verify_model_major(verification_model, pending, index)
+      else:
+        for chunk in chunks(pending, VERIFY_CHUNK_SIZE):
+          verify_chunk(verification_model, chunk, index)
+    finally:
+      if args.parallel and not args.model_major:
+        verification_model.close()
+
+  record_failures(folders, index, args.proofs_path)
+
+def latex(args):
+  from Code.utils.latex import LatexPool
+
+  folders = temperature_folders(args.folder_path, args.attempt)
+  index = ResumeIndex([path for _, _, path in folders], results_store(args))
+  pending = pending_proofs(folders, index, "latex")
+
+  with LatexPool(LATEX_TEMPLATE, LATEX_WORKERS, LATEX_TIMEOUT, batch_size = LATEX_BATCH_SIZE) as latex_pool:
+    for chunk in chunks(pending, LATEX_WORKERS * LATEX_BATCH_SIZE):
+      latex_chunk(latex_pool, chunk, index)
+
+  record_failures(folders, index, args.proofs_path)
+
+def stats(args):
+  from Code.utils.statistics import StatisticsEngine, engine, format_report
+
+  models = [model_type.name for model_type in GenModelType]
+  engine = StatisticsEngine(open_store(args.store)) if args.store else engine
+  print(format_report(engine.report(args.folder_path, models, TEMPERATURES, args.file, args.baseline)))
+
+def run_pipeline(args):
+  # generation, verification and LaTeX run at once, joined by bounded queues; a full queue
+  # stalls the stage before it, so at most PIPELINE_QUEUE_SIZE proofs wait between two stages
+  from Code.utils.pipeline import Source, Stage, run_stages
+  from Code.utils.latex import LatexPool
+  import queue
+
+  make_folders(args.folder_path)
+  folders = temperature_folders(args.folder_path, args.attempt)
+  check_resume(args, folders)
+  index = ResumeIndex([path for _, _, path in folders], results_store(args))
+  to_verify, to_latex = queue.Queue(PIPELINE_QUEUE_SIZE), queue.Queue(PIPELINE_QUEUE_SIZE)
+
+  def produce(emit):
+    # proofs generated by an earlier run that were never graded go first
+    pending = {record_key(path, proof): (path, proof) for path, proof in pending_proofs(folders, index, "verification") + pending_proofs(folders, index, "latex")}
+
+    for item in pending.values():
+      emit(item)
+
+    generate(args, on_proof = lambda path, proof: emit((path, proof)), index = index)
+
+  def verify_stage(items: list) -> list:
+    chunk = [(path, proof) for path, proof in items if not index.is_done(*record_key(path, proof), "verification")]
+
+    if chunk:
+      verify_chunk(verification_model, chunk, index)
+
+    return items
+
+  def latex_stage(items: list) -> list:
+    latex_chunk(latex_pool, [(path, proof) for path, proof in items if not index.is_done(*record_key(path, proof), "latex")], index)
+
+    return []
+
+  verification_model = build_verification_model(args)
+
+  try:
+    with LatexPool(LATEX_TEMPLATE, LATEX_WORKERS, LATEX_TIMEOUT, batch_size = LATEX_BATCH_SIZE) as latex_pool:
+      report = run_stages([
+        Source("generation", produce, to_verify),
+        Stage("verification", verify_stage, to_verify, to_latex, VERIFY_CHUNK_SIZE),
+        Stage("latex", latex_stage, to_latex, batch_size = LATEX_WORKERS * LATEX_BATCH_SIZE)
+      ])
+  finally:
+    if args.parallel:
+      verification_model.close()
+
+  record_failures(folders, index, args.proofs_path)
+  append_jsonl(os.path.join(args.folder_path, "pipeline-stats.jsonl"), {"time": str(datetime.now()), "stages": report})
+
+  for stage in report:
+    print(f'{stage["stage"]}: {stage["items"]} proofs, {stage["items per second"] or 0:.2f}/s, busy {stage["busy"] or 0:.0%}, waiting {stage["waiting"] or 0:.0%}, blocked {stage["blocked"] or 0:.0%}')
+
+def run_all(args):
+  if args.sequential or args.model_major:
+    generate(args)
+    verify(args)
+    latex(args)
+  else:
+    run_pipeline(args)
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description = "Generate, verify and evaluate informal proofs.")
+  subparsers = parser.add_subparsers(required = True)
+
+  def add_folder_args(subparser):
+    subparser.add_argument("folder_path")
+    subparser.add_argument("proofs_path", help = "propositions to prove, as JSONL")
+    subparser.add_argument("attempt", choices = ["1", "2", "all"])
+    subparser.add_argument("--store", default = None, help = "also write every result to this SQLite results store")
+    subparser.add_argument("--prometheus-textfile", default = None, help = f"where to write the run's metrics for Prometheus, folder_path/{PROMETHEUS_FILE} by default")
+
+  def add_generate_args(subparser):
+    subparser.add_argument("base_url")
+    subparser.add_argument("api_key")
+    add_folder_args(subparser)
+    subparser.add_argument("--resume", action = "store_true", help = "continue a run, skipping proofs already in proofs.jsonl; without it, generation refuses to add to an existing proofs.jsonl")
+    mode = subparser.add_mutually_exclusive_group()
+    mode.add_argument("--stream", action = "store_true", help = "stream responses, stopping at QED or at the first malformed section")
+    mode.add_argument("--batch", action = "store_true", help = "submit all requests through the provider's Batch API")
+
+  def add_verify_args(subparser):
+    # the worker processes score every model, so the cascade can't skip any of them
+    ensemble = subparser.add_mutually_exclusive_group()
+    ensemble.add_argument("--cascade", action = "store_true", help = "stop querying models once the majority is decided")
+    ensemble.add_argument("--parallel", action = "store_true", help = "run each NLI model in its own process")
+    subparser.add_argument("--early-exit", action = "store_true", help = "stop scoring a proof once its grade is decided")
+    subparser.add_argument("--model-major", action = "store_true", help = "load one NLI model at a time, saving its scores before the next")
+    subparser.add_argument("--backend", choices = ["TORCH_FP32", "TORCH_INT8", "ONNX"], default = "TORCH_FP32", help = "inference backend for the NLI models")
+
+  generate_parser = subparsers.add_parser("generate", help = "generate proofs")
+  add_generate_args(generate_parser)
+  generate_parser.set_defaults(func = generate)
+
+  verify_parser = subparsers.add_parser("verify", help = "grade generated proofs with the NLI ensemble")
+  add_folder_args(verify_parser)
+  add_verify_args(verify_parser)
+  verify_parser.set_defaults(func = verify)
+
+  latex_parser = subparsers.add_parser("latex", help = "check the LaTeX syntax of generated proofs")
+  add_folder_args(latex_parser)
+  latex_parser.set_defaults(func = latex)
+
+  stats_parser = subparsers.add_parser("stats", help = "print the metrics of every model, temperature and prompt type")
+  stats_parser.add_argument("folder_path")
+  stats_parser.add_argument("--file", default = "verification.jsonl", help = "human-annotated results file in each temperature folder")
+  stats_parser.add_argument("--baseline", type = int, default = 0, help = "index of the baseline NLI model")
+  stats_parser.add_argument("--store", default = None, help = "read the verification records from this SQLite results store instead of --file")
+  stats_parser.set_defaults(func = stats)
+
+  all_parser = subparsers.add_parser("all", help = "generate, verify and check LaTeX in one run")
+  add_generate_args(all_parser)
+  add_verify_args(all_parser)
+  all_parser.add_argument("--sequential", action = "store_true", help = "run the stages one after another instead of as a pipeline")
+  all_parser.set_defaults(func = run_all)
+
+  return parser
+
+def write_metrics(args):
+  if not os.path.isdir(args.folder_path):
+    return
+
+  METRICS.write_jsonl(os.path.join(args.folder_path, METRICS_FILE), command = args.func.__name__, attempt = args.attempt)
+  METRICS.write_prometheus(args.prometheus_textfile or os.path.join(args.folder_path, PROMETHEUS_FILE))
+
+def main(argv: list | None = None):
+  args = build_parser().parse_args(argv)
+  configure_appenders(JSONL_FLUSH_EVERY, JSONL_FSYNC_EVERY, JSONL_UNBUFFERED)
+
+  if args.func is stats:
+    return args.func(args)
+
+  # written even when the run fails, since that is when the numbers are wanted most
+  try:
+    args.func(args)
+  finally:
+    write_metrics(args)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,23 @@
+import pytest
+import sys
+import os
+
+# the package is imported as Code, so the directory that contains it goes on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+PROPOSITIONS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "propositions.jsonl")
+
+@pytest.fixture(scope = "session")
+def propositions_path() -> str:
+  return PROPOSITIONS_PATH
+
+@pytest.fixture(scope = "session")
+def tiny_model(tmp_path_factory) -> str:
+  # a randomly initialised classifier saved like a hub checkpoint
+  pytest.importorskip("torch")
+  from Code.benchmarks.tiny_models import build_tiny_model, proposition_words
+
+  path = str(tmp_path_factory.mktemp("models") / "tiny")
+  build_tiny_model(path, proposition_words(PROPOSITIONS_PATH))
+
+  return path
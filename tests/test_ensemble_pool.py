@@ -0,0 +1,28 @@
+from Code.verification.verification_model import NLIModelType
+from Code.verification.ensemble_pool import EnsemblePool
+import pytest
+import signal
+import os
+
+PROOF = {"id": 1, "prompt type": "zero shot", "premise": "Let $n$ be an even integer.", "proof": ["Then $n = 2k$ for some integer $k$.", "So $n^2 = 4k^2$."]}
+
+def test_dead_worker_raises(tiny_model):
+  pool = EnsemblePool([dict(model_type = model_type, model_name = tiny_model, device = "cpu", grade_threshold = 50) for model_type in NLIModelType][:2], poll_interval = 0.2)
+  worker = pool.worker_models[NLIModelType.BART.value]
+  os.kill(worker.pid, signal.SIGKILL)
+  worker.join()
+
+  with pytest.raises(RuntimeError, match = f"The worker for {tiny_model} exited with code -{signal.SIGKILL.value}"):
+    pool.verify_proofs([PROOF])
+
+  assert not any(worker.is_alive() for worker in pool.workers)
+
+def test_load_failure_is_reported_at_startup(tiny_model, tmp_path):
+  # a folder without a checkpoint fails straight away, where a missing path would be looked up on the hub
+  missing = str(tmp_path)
+
+  with pytest.raises(RuntimeError, match = f"Unable to load {missing}"):
+    EnsemblePool([
+      dict(model_type = NLIModelType.PRISM, model_name = tiny_model, device = "cpu", grade_threshold = 50),
+      dict(model_type = NLIModelType.BART, model_name = missing, device = "cpu", grade_threshold = 50)
+    ], poll_interval = 0.2)
@@ -0,0 +1,96 @@
+from Code.generation.generation_model import GenModelType, GenModel
+from Code.generation.section_parser import MalformedResponse, parse_sections
+from Code.generation.stub_server import StubServer, STUB_PROOF
+from Code.generation.async_engine import AsyncGenEngine
+from Code.generation.batch_engine import BatchEngine
+from openai import RateLimitError
+import asyncio
+import pytest
+import os
+
+SYSTEM_PROMPT = "Prove the proposition."
+
+def make_jobs(model: GenModel, n: int) -> list:
+  return [{"model": model, "prompt": [{"type": "text", "text": f"Proposition {i}"}], "theorem": {"id": i}, "prompt type": "zero shot", "sample": 0} for i in range(n)]
+
+def run_async(engine: AsyncGenEngine, jobs: list) -> list:
+  responses = []
+  asyncio.run(engine.run(jobs, SYSTEM_PROMPT, lambda job, response: responses.append(response)))
+
+  return responses
+
+def test_async_engine_retries_rate_limits(tmp_path):
+  with StubServer(rate_limit_first = 2) as server:
+    engine = AsyncGenEngine(max_retries = 3)
+    delays = []
+    engine.backoff = lambda attempt: delays.append(attempt) or 0
+    responses = run_async(engine, make_jobs(GenModel(GenModelType.GPT, "stub", 0.0, server.url, "key", str(tmp_path)), 1))
+
+  assert responses == [STUB_PROOF]
+  assert delays == [0, 1] # one backoff per 429, growing with the attempt
+  assert server.requests == 1
+
+def test_async_engine_gives_up_after_max_retries(tmp_path):
+  with StubServer(rate_limit_first = 10) as server:
+    engine = AsyncGenEngine(max_retries = 2, base_delay = 0.01)
+    responses = run_async(engine, make_jobs(GenModel(GenModelType.GPT, "stub", 0.0, server.url, "key", str(tmp_path)), 1))
+
+  assert isinstance(responses[0], RateLimitError)
+  assert server.httpd.rate_limited == 3
+
+def test_batch_engine_resumes_from_state_file(tmp_path):
+  folder = str(tmp_path / "batches")
+
+  with StubServer(batch_latency = 0.1) as server:
+    jobs = make_jobs(GenModel(GenModelType.GPT, "stub", 0.0, server.url, "key", str(tmp_path)), 3)
+    interrupted = BatchEngine(folder, poll_interval = 0.02)
+
+    def interrupt(client, batch_id):
+      raise KeyboardInterrupt
+
+    interrupted.wait = interrupt
+
+    with pytest.raises(KeyboardInterrupt):
+      interrupted.run(jobs, SYSTEM_PROMPT, lambda job, response: None)
+
+    assert len([name for name in os.listdir(folder) if name.endswith(".json")]) == 1
+
+    responses = []
+    BatchEngine(folder, poll_interval = 0.02).run(jobs, SYSTEM_PROMPT, lambda job, response: responses.append(response))
+
+  # the batch still in flight is picked up rather than submitted again
+  assert len(server.httpd.batches) == 1
+  assert responses == [STUB_PROOF] * 3
+  assert not [name for name in os.listdir(folder) if name.endswith(".json")]
+
+def stream(server: StubServer, folder: str) -> tuple:
+  model = GenModel(GenModelType.GPT, "stub", 0.0, server.url, "key", folder, stream = True)
+  metrics = {}
+
+  try:
+    return asyncio.run(model.request_stream(SYSTEM_PROMPT, [{"type": "text", "text": "Proposition"}], metrics)), metrics
+  except MalformedResponse as e:
+    return e, metrics
+
+def test_stream_stops_at_qed(tmp_path):
+  with StubServer(content = STUB_PROOF + "\n\nSome commentary after the proof." * 200, token_latency = 0.002) as server:
+    content, metrics = stream(server, str(tmp_path))
+
+  assert content.rstrip().endswith("QED")
+  assert metrics["finish reason"] == "qed"
+  assert metrics["tokens"] < len(STUB_PROOF.split()) + 10
+
+@pytest.mark.parametrize("server_kwargs, finish_reason", [
+  ({"max_tokens": 20}, "length"),
+  ({"content": STUB_PROOF.removesuffix("QED")}, "stop")
+])
+def test_stream_without_qed_is_malformed(tmp_path, server_kwargs, finish_reason):
+  with StubServer(**server_kwargs) as server:
+    content, metrics = stream(server, str(tmp_path))
+
+  assert isinstance(content, MalformedResponse)
+  assert metrics["finish reason"] == finish_reason
+
+def test_empty_proof_section_is_malformed():
+  with pytest.raises(MalformedResponse, match = "no steps"):
+    parse_sections("Variable definitions:\nLet $n$ be an integer.\n\nProof type(s):\nDirect proof.\n\nProof:\nQED")
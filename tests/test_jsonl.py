@@ -0,0 +1,53 @@
+from Code.utils.jsonl import JsonlAppender, close_all, configure_appenders, get_appender, iter_jsonl
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import json
+
+def read_lines(path) -> list:
+  return [json.loads(line) for line in path.read_text().splitlines()]
+
+@pytest.fixture
+def appenders():
+  yield
+  close_all()
+  configure_appenders()
+
+def test_unbuffered_files_are_written_after_every_record(tmp_path, appenders):
+  configure_appenders(64, None, ["proofs.jsonl"])
+  proofs, grades = get_appender(str(tmp_path / "proofs.jsonl")), get_appender(str(tmp_path / "verification.jsonl"))
+  proofs.write({"id": 1})
+  grades.write({"id": 1})
+
+  # read without iter_jsonl, which would flush the buffer first
+  assert read_lines(tmp_path / "proofs.jsonl") == [{"id": 1}]
+  assert (tmp_path / "verification.jsonl").read_text() == ""
+
+def test_appender_writes_whole_buffers(tmp_path):
+  path = tmp_path / "records.jsonl"
+  appender = JsonlAppender(str(path), flush_every = 3)
+
+  for i in range(4):
+    appender.write({"id": i})
+
+  # the fourth record waits for the next flush
+  assert read_lines(path) == [{"id": i} for i in range(3)]
+
+  appender.close()
+  assert read_lines(path) == [{"id": i} for i in range(4)]
+
+def test_reading_flushes_pending_records(tmp_path, appenders):
+  path = str(tmp_path / "records.jsonl")
+  get_appender(path).write({"id": 1, "prompt type": "zero shot", "success": True})
+  get_appender(path).write({"id": 2, "prompt type": "few shot", "success": False})
+
+  assert list(iter_jsonl(path, ["id"], {"success": True})) == [{"id": 1}]
+
+def test_concurrent_writes_keep_lines_whole(tmp_path):
+  path = tmp_path / "records.jsonl"
+  appender = JsonlAppender(str(path), flush_every = 7)
+
+  with ThreadPoolExecutor(8) as executor:
+    list(executor.map(lambda i: appender.write({"id": i, "text": "x" * (i % 50)}), range(1000)))
+
+  appender.close()
+  assert sorted(record["id"] for record in read_lines(path)) == list(range(1000))
@@ -0,0 +1,78 @@
+from Code.utils import latex
+from Code.utils.latex import LatexPool, attribute_errors, precheck_latex
+import pytest
+import shutil
+
+TEMPLATE = "\\documentclass{article}\n\\begin{document}\n%s\n\\end{document}\n"
+
+LOG = """This is pdfTeX
+@@begin 0@@
+@@end 0@@
+@@begin 1@@
+! Missing $ inserted.
+<inserted text>
+@@end 1@@
+@@begin 2@@
+! Emergency stop.
+"""
+
+@pytest.mark.parametrize("contents", [
+  r"It costs \$5 and $x \in \{1, 2\}$.",
+  r"Then $x = 1$. % a comment with $ and {",
+  r"Here 50\% of $\{x\}$ hold.",
+  r"First line\\$x$ on the next.",
+  r"\begin{align} x &= 1 \end{align}"
+])
+def test_precheck_accepts_escaped_characters(contents):
+  assert precheck_latex(contents) is None
+
+@pytest.mark.parametrize("contents, reason", [
+  (r"Let $x = 1.", "Unbalanced $"),
+  (r"Let $x = 1\$.", "Unbalanced $"),
+  (r"Then \frac{1}{2.", "Unbalanced braces"),
+  (r"Then \{x} }{.", "Unbalanced braces"),
+  (r"Here 50\%$ is not math.", "Unbalanced $"),
+  (r"\begin{align} x \end{equation}", "Unmatched \\end{equation}"),
+  (r"\begin{align} x", "Unmatched \\begin{align}")
+])
+def test_precheck_rejects_unbalanced_contents(contents, reason):
+  assert precheck_latex(contents) == reason
+
+@pytest.fixture
+def pool():
+  # no TeX engine is started, the runs are replaced below
+  with LatexPool(TEMPLATE, 1, engine = "no-such-tex") as pool:
+    yield pool
+
+def test_errors_are_attributed_between_markers():
+  # the run stopped inside proof 2, so the log can't vouch for it
+  assert attribute_errors(LOG, 3) == [True, False, None]
+
+def test_errors_outside_markers_are_ignored():
+  assert attribute_errors("! Emergency stop.\n@@begin 0@@\n@@end 0@@\n", 1) == [True]
+
+def test_batch_failures_are_compiled_again(pool, monkeypatch):
+  compiled = []
+  monkeypatch.setattr(latex, "run_tex_job", lambda *args, **kwargs: (1, LOG))
+  monkeypatch.setattr(pool, "compile", lambda contents: compiled.append(contents) or contents != "bad")
+
+  # an error that spilled from the good proof into "spilled" is cleared when it compiles on its own
+  assert pool.compile_batch(["good", "spilled", "bad"]) == [True, True, False]
+  assert compiled == ["spilled", "bad"]
+
+def test_batch_timeout_compiles_every_proof(pool, monkeypatch):
+  compiled = []
+  monkeypatch.setattr(latex, "run_tex_job", lambda *args, **kwargs: (None, ""))
+  monkeypatch.setattr(pool, "compile", lambda contents: compiled.append(contents) or True)
+
+  assert pool.compile_batch(["a", "b"]) == [True, True]
+  assert compiled == ["a", "b"]
+
+@pytest.mark.skipif(shutil.which("pdflatex") is None, reason = "pdflatex is not installed")
+def test_batch_matches_single_runs():
+  proofs = [{"id": 1, "prompt type": "zero shot", "premise": "Let $x = 1$.", "proof": ["Then $x + 1 = 2$."]},
+            {"id": 2, "prompt type": "zero shot", "premise": "Let $x = 1$.", "proof": ["Then \\undefinedmacro $x$."]}]
+
+  with LatexPool(TEMPLATE, 1, batch_size = 2) as batched, LatexPool(TEMPLATE, 1) as single:
+    assert [result["success"] for result in batched.verify_all(proofs)] == [True, False]
+    assert [result["success"] for result in single.verify_all(proofs)] == [True, False]
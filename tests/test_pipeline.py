@@ -0,0 +1,55 @@
+from Code.utils.pipeline import Source, Stage, run_stages
+import pytest
+import queue
+
+def numbers(n: int):
+  def produce(emit):
+    for i in range(n):
+      emit(i)
+
+  return produce
+
+def test_items_flow_through_every_stage():
+  first, second, seen = queue.Queue(2), queue.Queue(2), []
+  report = run_stages([
+    Source("source", numbers(50), first),
+    Stage("double", lambda items: [2 * i for i in items], first, second, batch_size = 4),
+    Stage("sink", lambda items: seen.extend(items) or [], second)
+  ])
+
+  assert seen == [2 * i for i in range(50)]
+  assert [stage["items"] for stage in report] == [50, 50, 50]
+
+def test_stage_error_is_raised_after_the_source_finishes():
+  # with queues of 2 the source would block forever if the failed stage stopped draining its inbox
+  first, second, seen = queue.Queue(2), queue.Queue(2), []
+
+  def fail_on_seven(items: list) -> list:
+    if 7 in items:
+      raise ValueError("seven")
+
+    return items
+
+  stages = [
+    Source("source", numbers(100), first),
+    Stage("check", fail_on_seven, first, second),
+    Stage("sink", lambda items: seen.extend(items) or [], second)
+  ]
+
+  with pytest.raises(ValueError, match = "seven"):
+    run_stages(stages)
+
+  assert stages[0].stats.items == 100
+  assert seen == list(range(7))
+
+def test_source_error_closes_the_pipeline():
+  first, seen = queue.Queue(2), []
+
+  def produce(emit):
+    emit(1)
+    raise RuntimeError("provider down")
+
+  with pytest.raises(RuntimeError, match = "provider down"):
+    run_stages([Source("source", produce, first), Stage("sink", lambda items: seen.extend(items) or [], first)])
+
+  assert seen == [1]
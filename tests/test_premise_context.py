@@ -0,0 +1,33 @@
+from Code.verification.premise_context import ContextPolicy, PremiseContext
+from Code.utils.utils import parse_jsonl
+import pytest
+
+PROOF = {
+  "premise": "Let $n$ be an odd integer.",
+  "proof": ["Then $n = 2k + 1$ for some integer $k$.", "So $n^2 = 4k^2 + 4k + 1$.", "Hence $n^2 = 2(2k^2 + 2k) + 1$.", "Therefore $n^2$ is odd."]
+}
+
+@pytest.fixture(scope = "module")
+def byte_level_tokenizer(propositions_path):
+  # a small byte-level BPE tokenizer with RoBERTa's pair template
+  from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+  from transformers import PreTrainedTokenizerFast
+
+  tokenizer = Tokenizer(models.BPE())
+  tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space = False)
+  trainer = trainers.BpeTrainer(vocab_size = 600, initial_alphabet = pre_tokenizers.ByteLevel.alphabet(), special_tokens = ["<s>", "</s>", "<pad>"])
+  tokenizer.train_from_iterator([f'{proposition["statement"]} {proposition["example"]}' for proposition in parse_jsonl(propositions_path)], trainer)
+  tokenizer.post_processor = processors.RobertaProcessing(("</s>", tokenizer.token_to_id("</s>")), ("<s>", tokenizer.token_to_id("<s>")), trim_offsets = False)
+
+  return PreTrainedTokenizerFast(tokenizer_object = tokenizer, bos_token = "<s>", eos_token = "</s>", sep_token = "</s>", cls_token = "<s>", pad_token = "<pad>")
+
+@pytest.mark.parametrize("policy", [ContextPolicy.FULL, ContextPolicy.WINDOW])
+def test_byte_level_ids_match_joined_premise(byte_level_tokenizer, policy):
+  context = PremiseContext(byte_level_tokenizer, 512, policy, window = 2)
+  pairs = context.encode_proof(PROOF)
+
+  assert context.separated
+  assert len(pairs) == len(PROOF["proof"]) - 1
+
+  for premise, hypothesis, input_ids in pairs:
+    assert input_ids == byte_level_tokenizer(premise, hypothesis)["input_ids"]
@@ -0,0 +1,75 @@
+from Code.utils.results_store import ResultsStore, folder_key, key_folder
+from Code.utils.statistics import StatisticsEngine
+import pickle
+import json
+import os
+
+def write_folder(root, model: str, attempt: int, temperature: float, files: dict) -> str:
+  folder = key_folder(str(root), model, attempt, temperature)
+  os.makedirs(folder, exist_ok = True)
+
+  for name, records in files.items():
+    with open(os.path.join(folder, name), "w") as f:
+      f.writelines(json.dumps(record) + "\n" for record in records)
+
+  return folder
+
+def grading(id: int, prompt_type: str, success: bool) -> dict:
+  return {"id": id, "prompt type": prompt_type, "classifications": [success] * 5, "success": success, "success-human": success, "clarity": 3, "descriptiveness": 4, "redundancy": 25, "steps": 4}
+
+def read_tree(root) -> dict:
+  contents = {}
+
+  for path, _, names in os.walk(root):
+    for name in names:
+      with open(os.path.join(path, name)) as f:
+        contents[os.path.relpath(os.path.join(path, name), root)] = [json.loads(line) for line in f]
+
+  return contents
+
+def test_import_export_round_trip(tmp_path):
+  proofs = [{"id": i, "prompt type": "zero shot", "premise": "", "proof type": [], "proof": [f"Step {i}."]} for i in [3, 1, 2]]
+
+  for attempt in [1, 2]:
+    write_folder(tmp_path / "in", "MODEL", attempt, 0.4, {
+      "proofs.jsonl": proofs,
+      "verification.jsonl": [grading(3, "zero shot", True), grading(1, "zero shot", False)]
+    })
+
+  store = ResultsStore(str(tmp_path / "results.sqlite"))
+
+  assert store.import_tree(str(tmp_path / "in")) == 10
+  assert store.export_tree(str(tmp_path / "out")) == 10
+  # records come back in the order they were written, not sorted by id
+  assert read_tree(tmp_path / "out") == read_tree(tmp_path / "in")
+
+def test_put_replaces_records_in_place(tmp_path):
+  store = ResultsStore(str(tmp_path / "results.sqlite"))
+  folder = write_folder(tmp_path, "MODEL", 1, 0.0, {})
+  store.put_path(folder, "verification", grading(1, "zero shot", False))
+  store.put_path(folder, "verification", grading(2, "zero shot", True))
+  store.put_path(folder, "verification", grading(1, "zero shot", True))
+
+  assert folder_key(folder) == ("MODEL", 1, 0.0)
+  assert [record["id"] for record in store.query("verification", "MODEL", 1, 0.0)] == [1, 2]
+  assert store.get("verification", "MODEL", 1, 0.0, 1, "zero shot")["success"]
+  assert store.query("verification", attempt = 2) == []
+
+def test_pickled_store_reopens_the_database(tmp_path):
+  store = ResultsStore(str(tmp_path / "results.sqlite"))
+  store.put("latex", "MODEL", 1, 0.0, {"id": 1, "prompt type": "few shot", "success": True})
+  copy = pickle.loads(pickle.dumps(store))
+
+  assert copy.conn is not store.conn
+  assert copy.query("latex") == [{"id": 1, "prompt type": "few shot", "success": True}]
+
+def test_statistics_from_store_match_files(tmp_path):
+  records = [grading(1, "zero shot", True), grading(2, "zero shot", False), grading(3, "few shot", True)]
+
+  for attempt in [1, 2]:
+    write_folder(tmp_path, "MODEL", attempt, 0.0, {"verification.jsonl": records})
+
+  store = ResultsStore(str(tmp_path / "results.sqlite"))
+  store.import_tree(str(tmp_path))
+
+  assert StatisticsEngine(store).report(str(tmp_path), ["MODEL"], [0.0]) == StatisticsEngine().report(str(tmp_path), ["MODEL"], [0.0])
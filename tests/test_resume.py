@@ -0,0 +1,37 @@
+from Code.utils.resume import ResumeIndex
+from Code.utils.utils import repair_jsonl
+import json
+
+def write_lines(path, records: list, tail: str = ""):
+  path.write_text("".join(json.dumps(record) + "\n" for record in records) + tail)
+
+def test_repair_drops_partial_last_line(tmp_path):
+  path = tmp_path / "proofs.jsonl"
+  write_lines(path, [{"id": 1}], '{"id": 2, "pro')
+  repair_jsonl(str(path))
+
+  assert path.read_text() == json.dumps({"id": 1}) + "\n"
+
+def test_repair_keeps_complete_files(tmp_path):
+  path = tmp_path / "proofs.jsonl"
+  write_lines(path, [{"id": 1}, {"id": 2}])
+  before = path.read_text()
+  repair_jsonl(str(path))
+  repair_jsonl(str(tmp_path / "missing.jsonl"))
+
+  assert path.read_text() == before
+
+def test_index_skips_completed_work_after_an_interrupted_run(tmp_path):
+  folder = str(tmp_path)
+  write_lines(tmp_path / "proofs.jsonl", [{"id": 1, "prompt type": "zero shot"}, {"id": 1, "prompt type": "few shot"}], '{"id": 2, "prompt type": "zero')
+  write_lines(tmp_path / "verification.jsonl", [{"id": 1, "prompt type": "zero shot", "success": True}])
+  index = ResumeIndex([folder])
+
+  assert index.is_done(folder, 1, "zero shot", "generation")
+  assert index.is_done(folder, 1, "few shot", "generation")
+  assert not index.is_done(folder, 2, "zero shot", "generation")
+  assert not index.is_done(folder, 1, "few shot", "verification")
+  assert index.get(folder, 1, "zero shot", "verification")["success"]
+
+  # the partial line is gone, so the next append starts on a line of its own
+  assert (tmp_path / "proofs.jsonl").read_text().endswith("\n")
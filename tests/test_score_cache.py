@@ -0,0 +1,32 @@
+from Code.verification.verification_model import NLIModelType, NLIModel
+from Code.verification.score_cache import ScoreCache
+from Code.verification.backends import InferenceBackend
+
+PREMISE = "Let $n$ be an even integer."
+HYPOTHESIS = "Then $n = 2k$ for some integer $k$."
+
+def test_backends_keep_separate_cache_entries(tiny_model, tmp_path):
+  cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+  fp32 = NLIModel(NLIModelType.BART, tiny_model, "cpu", 50, score_cache = cache)
+  int8 = NLIModel(NLIModelType.BART, tiny_model, "cpu", 50, score_cache = cache, backend = InferenceBackend.TORCH_INT8)
+  uncached_int8 = NLIModel(NLIModelType.BART, tiny_model, "cpu", 50, backend = InferenceBackend.TORCH_INT8)
+
+  fp32.verify_step(PREMISE, HYPOTHESIS)
+  int8_score = int8.verify_step(PREMISE, HYPOTHESIS)
+
+  assert fp32.cache_key("truncate") != int8.cache_key("truncate")
+  assert cache.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0] == 2
+  assert cache.stats()["hits"] == 0
+  assert int8_score == uncached_int8.verify_step(PREMISE, HYPOTHESIS)
+  # a second lookup is served from the backend's own entry
+  assert int8.verify_step(PREMISE, HYPOTHESIS) == int8_score
+  assert cache.stats()["hits"] == 1
+
+def test_cached_rescoring_loads_no_weights(tiny_model, tmp_path):
+  cache = ScoreCache(str(tmp_path / "scores.sqlite"))
+  proof = {"premise": PREMISE, "proof": [HYPOTHESIS, "So $n^2 = 4k^2$.", "Hence $n^2$ is even."]}
+  scores = NLIModel(NLIModelType.BART, tiny_model, "cpu", 50, score_cache = cache).score_proofs([proof])
+  rescoring = NLIModel(NLIModelType.BART, tiny_model, "cpu", 50, score_cache = cache)
+
+  assert rescoring.score_proofs([proof]) == scores
+  assert rescoring._model is None
@@ -0,0 +1,46 @@
+from Code.utils.statistics import METRIC_NAMES, StatisticsEngine
+from Code.verification.rescore import find_files, load_scores, pair_attempts
+from Code.verification.verification_model import NLIModelType
+import json
+import os
+
+def write_attempt(folder, attempt: int, records: list):
+  path = os.path.join(folder, "MODEL", f"Attempt {attempt}", "Temperature-0.0")
+  os.makedirs(path, exist_ok = True)
+
+  with open(os.path.join(path, "verification.jsonl"), "w") as f:
+    f.writelines(json.dumps(record) + "\n" for record in records)
+
+def record(id: int, success: bool, human: bool, classifications: list) -> dict:
+  return {"id": id, "prompt type": "zero shot", "classifications": classifications, "success": success, "success-human": human, "clarity": 3, "descriptiveness": 4, "redundancy": 50, "steps": 4}
+
+def test_missing_attempt_gives_empty_metrics(tmp_path):
+  write_attempt(str(tmp_path), 1, [record(1, True, True, [True] * 5)])
+  rows = StatisticsEngine().report(str(tmp_path), ["MODEL", "OTHER"], [0.0])
+
+  assert len(rows) == 8
+  assert all(row[name] is None for row in rows for name in METRIC_NAMES)
+
+def test_skipped_baseline_votes_are_not_negatives(tmp_path):
+  records = [record(1, True, True, [None, True, True, True, None]), record(2, True, True, [True] * 5), record(3, False, False, [False] * 5)]
+  write_attempt(str(tmp_path), 1, records)
+  write_attempt(str(tmp_path), 2, records)
+  metrics = StatisticsEngine().report(str(tmp_path), ["MODEL"], [0.0])[-1]
+
+  assert metrics["baseline f1"] == 1.0
+  assert metrics["baseline skipped"] == 1
+  assert metrics["ensemble f1"] == 1.0
+  assert metrics["redundancy"] == 0.5
+
+def test_rescore_pairs_attempts_like_stats(tmp_path):
+  scored = lambda id, human, score: {**record(id, human, human, [human] * 5), "scores": [[score] * 3] * 5}
+  write_attempt(str(tmp_path), 1, [scored(1, True, 0.9), scored(2, False, 0.1), scored(3, False, 0.2)])
+  write_attempt(str(tmp_path), 2, [scored(2, True, 0.8)])
+  pairs = pair_attempts(find_files([str(tmp_path)], "verification.jsonl"))
+  scores, steps, labels, skipped = load_scores(pairs, list(NLIModelType))
+
+  # proof 2 comes from the second attempt, proof 3 has none and is skipped
+  assert len(pairs) == 1
+  assert labels.tolist() == [True, True]
+  assert scores[:, 0, 0].tolist() == [0.9, 0.8]
+  assert skipped == 1
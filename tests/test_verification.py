@@ -0,0 +1,64 @@
+from Code.verification.verification_model import EARLY_EXIT_PAIRS, NLIModelType, NLIModel, VerificationModel
+import pytest
+
+PROOF = {"id": 1, "prompt type": "zero shot", "premise": "Let $n$ be an even integer.", "proof": ["Then $n = 2k$ for some integer $k$.", "So $n^2 = 4k^2$.", "Hence $n^2$ is even."]}
+EMPTY_PROOF = {"id": 2, "prompt type": "zero shot", "premise": "Let $n$ be an even integer.", "proof": []}
+
+@pytest.mark.parametrize("early_exit", [False, True])
+def test_empty_proof_is_rejected_without_failing_the_batch(tiny_model, early_exit):
+  model = NLIModel(NLIModelType.PRISM, tiny_model, "cpu", 0, early_exit = early_exit)
+  results = VerificationModel([model]).verify_proofs([PROOF, EMPTY_PROOF])
+
+  # with a threshold of 0 every proof with steps passes
+  assert [result["success"] for result in results] == [True, False]
+  assert results[1]["scores"] == [[]]
+
+LONG_PROOF = {"id": 3, "prompt type": "zero shot", "premise": "Let $n$ be an odd integer.", "proof": [f"Step {i} holds." for i in range(8)]}
+
+@pytest.mark.parametrize("threshold, verdict", [(0, True), (101, False)])
+def test_early_exit_stops_once_settled(tiny_model, threshold, verdict):
+  # 0 is reached by any first score and 101 can't be reached at all, so both settle after the first round
+  model = NLIModel(NLIModelType.PRISM, tiny_model, "cpu", threshold, early_exit = True)
+  verdicts, scores = model.evaluate_proofs([LONG_PROOF, PROOF])
+
+  assert verdicts == [verdict, verdict]
+  assert [len(proof_scores) for proof_scores in scores] == [EARLY_EXIT_PAIRS, EARLY_EXIT_PAIRS]
+
+@pytest.fixture(scope = "module")
+def larger_tiny_model(tmp_path_factory, propositions_path) -> str:
+  from Code.benchmarks.tiny_models import build_tiny_model, proposition_words
+
+  path = str(tmp_path_factory.mktemp("models") / "larger")
+  build_tiny_model(path, proposition_words(propositions_path), hidden_size = 64)
+
+  return path
+
+def test_cascade_runs_smallest_first_and_stops_at_majority(tiny_model, larger_tiny_model):
+  models = [
+    NLIModel(NLIModelType.PRISM, larger_tiny_model, "cpu", 0),
+    NLIModel(NLIModelType.BART, tiny_model, "cpu", 0),
+    NLIModel(NLIModelType.DEBERTA1, tiny_model, "cpu", 0)
+  ]
+  ensemble = VerificationModel(models, cascade = True)
+
+  # ordered on config.json alone, without loading any weights
+  assert ensemble.cascade_order()[-1] is models[0]
+  assert all(model._model is None for model in models)
+
+  result = ensemble.verify_proof(PROOF)
+
+  # the two small models already make a majority of 3, so the larger one is skipped
+  assert result["classifications"] == [None, True, True]
+  assert result["success"]
+  assert models[0]._model is None
+
+@pytest.mark.parametrize("batch_size, max_batch_tokens, batches", [
+  (16, None, [[1, 3, 0, 2, 4]]),
+  (2, None, [[1, 3], [0, 2], [4]]),
+  (16, 20, [[1, 3, 0], [2], [4]]), # adding 2 would pad 4 rows to 9 tokens
+  (16, 5, [[1], [3], [0], [2], [4]]) # a pair longer than the budget still gets a batch of its own
+])
+def test_make_batches_sorts_by_length_within_budgets(batch_size, max_batch_tokens, batches):
+  model = NLIModel(NLIModelType.PRISM, "unused", "cpu", 0, batch_size = batch_size, max_batch_tokens = max_batch_tokens)
+
+  assert model.make_batches([5, 2, 9, 3, 12]) == batches
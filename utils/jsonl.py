@@ -0,0 +1,116 @@
+import threading
+import atexit
+import json
+import os
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+if orjson is not None:
+  loads = orjson.loads
+  dumps = orjson.dumps
+else:
+  loads = json.loads
+  dumps = lambda record: json.dumps(record).encode()
+
+def iter_jsonl(path: str, keys: list | None = None, where: dict | None = None):
+  # yields one record at a time; `where` keeps records whose fields equal the given values
+  if (appender := appenders.get(os.path.abspath(path))) is not None:
+    appender.flush()
+
+  with open(path, "rb") as f:
+    for line in f:
+      if not line.strip():
+        continue
+
+      record = loads(line)
+
+      if where is not None and any(record.get(field) != value for field, value in where.items()):
+        continue
+
+      yield record if keys is None else {key: record[key] for key in keys if key in record}
+
+class JsonlAppender():
+  # whole lines are buffered and written with one write() per flush on an O_APPEND descriptor
+  def __init__(self, path: str, flush_every: int = 64, fsync_every: int | None = None):
+    self.path = path
+    self.flush_every = flush_every
+    self.fsync_every = fsync_every # flushes between fsyncs, None leaves it to the OS
+    self.buffer = []
+    self.flushes = 0
+    self.lock = threading.Lock()
+    self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+  def write(self, record: dict):
+    line = dumps(record) + b"\n"
+
+    with self.lock:
+      self.buffer.append(line)
+
+      if len(self.buffer) >= self.flush_every:
+        self.write_buffer()
+
+  def flush(self):
+    with self.lock:
+      self.write_buffer()
+
+  def write_buffer(self):
+    if not self.buffer:
+      return
+
+    data = b"".join(self.buffer)
+    self.buffer = []
+
+    while data:
+      data = data[os.write(self.fd, data):]
+
+    self.flushes += 1
+
+    if self.fsync_every is not None and self.flushes % self.fsync_every == 0:
+      os.fsync(self.fd)
+
+  def close(self):
+    self.flush()
+    os.close(self.fd)
+
+appenders = {}
+appender_settings = {"flush_every": 64, "fsync_every": None}
+unbuffered_names = set() # file names written after every record
+
+def configure_appenders(flush_every: int = 64, fsync_every: int | None = None, unbuffered: list | None = None):
+  flush_all()
+  appender_settings.update(flush_every = flush_every, fsync_every = fsync_every)
+  unbuffered_names.clear()
+  unbuffered_names.update(unbuffered or [])
+
+  for path, appender in appenders.items():
+    appender.flush_every, appender.fsync_every = settings(path)
+
+def settings(path: str) -> tuple:
+  # returns (flush_every, fsync_every) for the file at path
+  flush_every = 1 if os.path.basename(path) in unbuffered_names else appender_settings["flush_every"]
+
+  return flush_every, appender_settings["fsync_every"]
+
+def get_appender(path: str) -> JsonlAppender:
+  # one long-lived appender per output file
+  path = os.path.abspath(path)
+
+  if path not in appenders:
+    appenders[path] = JsonlAppender(path, *settings(path))
+
+  return appenders[path]
+
+def flush_all():
+  for appender in appenders.values():
+    appender.flush()
+
+def close_all():
+  for appender in appenders.values():
+    appender.close()
+
+  appenders.clear()
+
+atexit.register(close_all)
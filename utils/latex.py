@@ -0,0 +1,203 @@
+from Code.utils.metrics import METRICS
+from concurrent.futures import ThreadPoolExecutor
+import subprocess
+import tempfile
+import shutil
+import re
+import os
+
+FORMAT_NAME = "proof-preamble"
+ENVIRONMENT_PATTERN = re.compile(r"\\(begin|end)\s*\{([^}]*)\}")
+MARKER_PATTERN = re.compile(r"^@@(begin|end) (\d+)@@$")
+
+def precheck_latex(contents: str) -> str | None:
+  # cheap structural checks, returns the reason a proof can't compile or None
+  text = re.sub(r"\\\\", "", contents) # line breaks, so "\\$" below is an escaped dollar
+  text = re.sub(r"(?<!\\)%.*", "", text)
+  text = re.sub(r"\\[$%{}]", "", text)
+
+  if text.count("$") % 2 != 0:
+    return "Unbalanced $"
+
+  depth = 0
+
+  for char in text:
+    depth += (char == "{") - (char == "}")
+
+    if depth < 0:
+      return "Unbalanced braces"
+
+  if depth != 0:
+    return "Unbalanced braces"
+
+  environments = []
+
+  for kind, name in ENVIRONMENT_PATTERN.findall(text):
+    if kind == "begin":
+      environments.append(name)
+    elif not environments or environments.pop() != name:
+      return f"Unmatched \\end{{{name}}}"
+
+  if environments:
+    return f"Unmatched \\begin{{{environments[-1]}}}"
+
+  return None
+
+def proof_contents(proof: dict) -> str:
+  return " ".join([proof["premise"]] + proof["proof"])
+
+def split_template(template: str) -> tuple:
+  idx = template.index(r"\begin{document}")
+
+  return template[:idx], template[idx:]
+
+def run_tex_job(command: list, source: str, timeout: float, parent_dir: str | None = None, env: dict | None = None) -> tuple:
+  # returns (return code or None on timeout, contents of the log)
+  with tempfile.TemporaryDirectory(prefix = "latex-job-", dir = parent_dir) as job_dir:
+    with open(os.path.join(job_dir, "proof.tex"), "w") as f:
+      f.write(source)
+
+    try:
+      with METRICS.timer("latex_run_seconds"):
+        completed = subprocess.run(
+          command + ["-interaction=nonstopmode", "-no-shell-escape", "proof.tex"],
+          cwd = job_dir,
+          env = env,
+          stdout = subprocess.DEVNULL,
+          stderr = subprocess.DEVNULL,
+          timeout = timeout
+        )
+    except (OSError, subprocess.TimeoutExpired):
+      METRICS.count("latex_run_failures_total")
+      return None, ""
+
+    try:
+      with open(os.path.join(job_dir, "proof.log"), "r", errors = "replace") as f:
+        log = f.read()
+    except OSError:
+      log = ""
+
+  return completed.returncode, log
+
+def run_tex(command: list, source: str, timeout: float, parent_dir: str | None = None, env: dict | None = None) -> bool:
+  return run_tex_job(command + ["-halt-on-error"], source, timeout, parent_dir, env)[0] == 0
+
+def batch_body(contents: list) -> str:
+  # every proof sits in its own group between markers that end up in the log
+  return "\n".join(
+    f"\\typeout{{@@begin {i}@@}}\n\\begingroup\n{proof}\n\\endgroup\\par\n\\typeout{{@@end {i}@@}}"
+    for i, proof in enumerate(contents)
+  )
+
+def attribute_errors(log: str, n_proofs: int) -> list:
+  # True / False per proof, None where the log never reached the proof's end marker
+  failed = [False] * n_proofs
+  finished = [False] * n_proofs
+  current = None
+
+  for line in log.splitlines():
+    if match := MARKER_PATTERN.match(line):
+      kind, i = match.group(1), int(match.group(2))
+      current = i if kind == "begin" else None
+      finished[i] = finished[i] or kind == "end"
+    elif line.startswith("! ") and current is not None:
+      failed[current] = True
+
+  return [not fail if done else None for fail, done in zip(failed, finished)]
+
+class LatexPool():
+  # runs up to `workers` TeX processes at once, each in its own temporary directory
+  def __init__(self, template: str, workers: int | None = None, timeout: float = 60, engine: str = "pdflatex", batch_size: int | None = None):
+    self.template = template
+    self.batch_size = batch_size # proofs per TeX run, None compiles each proof separately
+    self.preamble, self.body = split_template(template)
+    self.timeout = timeout
+    self.engine = engine
+    self.format_dir = tempfile.mkdtemp(prefix = "latex-format-")
+    self.has_format = self.dump_format()
+    self.executor = ThreadPoolExecutor(workers or os.cpu_count())
+
+  def dump_format(self) -> bool:
+    # precompile the preamble once so jobs skip loading fontenc/inputenc/amsmath/amssymb
+    with open(os.path.join(self.format_dir, "preamble.tex"), "w") as f:
+      f.write(f"{self.preamble}\n\\dump\n")
+
+    try:
+      completed = subprocess.run(
+        [self.engine, "-ini", "-interaction=nonstopmode", f"-jobname={FORMAT_NAME}", f"&{self.engine}", "preamble.tex"],
+        cwd = self.format_dir,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL,
+        timeout = self.timeout
+      )
+    except (OSError, subprocess.TimeoutExpired):
+      return False
+
+    return completed.returncode == 0 and os.path.exists(os.path.join(self.format_dir, f"{FORMAT_NAME}.fmt"))
+
+  def tex_command(self) -> tuple:
+    if self.has_format:
+      return [self.engine, f"-fmt={FORMAT_NAME}"], self.body, {**os.environ, "TEXFORMATS": f"{self.format_dir}:"}
+
+    return [self.engine], self.template, None
+
+  def compile(self, contents: str) -> bool:
+    command, template, env = self.tex_command()
+
+    return run_tex(command, template % contents, self.timeout, env = env)
+
+  def compile_batch(self, contents: list) -> list:
+    # one TeX run for many proofs; anything the log can't vouch for is compiled on its own
+    command, template, env = self.tex_command()
+    returncode, log = run_tex_job(command, template % batch_body(contents), self.timeout * len(contents), env = env)
+
+    if returncode is None:
+      results = [None] * len(contents)
+    else:
+      results = attribute_errors(log, len(contents))
+
+    # an error in one proof can spill into the next, so failures are confirmed individually too
+    return [self.compile(proof) if result is not True else True for proof, result in zip(contents, results)]
+
+  def verify(self, proof: dict) -> dict:
+    contents = proof_contents(proof)
+
+    with METRICS.timer("latex_proof_seconds"):
+      return {
+        "id": proof["id"],
+        "prompt type": proof["prompt type"],
+        "success": precheck_latex(contents) is None and self.compile(contents)
+      }
+
+  def verify_many(self, proofs: list) -> list:
+    results = self.verify_all(proofs)
+
+    for result in results:
+      METRICS.count("latex_proofs_total", success = result["success"])
+
+    return results
+
+  def verify_all(self, proofs: list) -> list:
+    if self.batch_size is None:
+      return list(self.executor.map(self.verify, proofs))
+
+    results = [{"id": proof["id"], "prompt type": proof["prompt type"], "success": False} for proof in proofs]
+    contents = [proof_contents(proof) for proof in proofs]
+    passed = [i for i in range(len(proofs)) if precheck_latex(contents[i]) is None]
+    batches = [passed[lo:lo + self.batch_size] for lo in range(0, len(passed), self.batch_size)]
+
+    for batch, successes in zip(batches, self.executor.map(lambda batch: self.compile_batch([contents[i] for i in batch]), batches)):
+      for i, success in zip(batch, successes):
+        results[i]["success"] = success
+
+    return results
+
+  def close(self):
+    self.executor.shutdown()
+    shutil.rmtree(self.format_dir, ignore_errors = True)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,143 @@
+from contextlib import contextmanager
+from datetime import datetime
+import threading
+import bisect
+import json
+import time
+import os
+
+# upper bounds in seconds; the last bucket is +Inf
+LATENCY_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+RATE_BUCKETS = [1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+PREFIX = "itp_" # Prometheus metric names are PREFIX + name
+
+class Histogram():
+  def __init__(self, buckets: list):
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    self.sum = 0
+    self.count = 0
+
+  def observe(self, value: float):
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def quantile(self, q: float) -> float | None:
+    # upper bound of the bucket holding the q-th observation, like histogram_quantile without interpolation
+    if not self.count:
+      return None
+
+    rank, seen = q * self.count, 0
+
+    for bound, count in zip(self.buckets + [float("inf")], self.counts):
+      seen += count
+
+      if seen >= rank:
+        return bound
+
+  def report(self) -> dict:
+    return {
+      "count": self.count,
+      "sum": self.sum,
+      "mean": self.sum / self.count if self.count else None,
+      "p50": self.quantile(0.5),
+      "p99": self.quantile(0.99),
+      "buckets": self.counts
+    }
+
+class Metrics():
+  # counters and histograms keyed on (name, labels); every update is a dict lookup under one lock,
+  # cheap enough next to an API call, a model forward or a TeX run to leave on
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.counters = {}
+    self.histograms = {}
+    self.started = datetime.now()
+
+  def key(self, name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+  def count(self, name: str, amount: float = 1, **labels):
+    key = self.key(name, labels)
+
+    with self.lock:
+      self.counters[key] = self.counters.get(key, 0) + amount
+
+  def observe(self, name: str, value: float, buckets: list = LATENCY_BUCKETS, **labels):
+    key = self.key(name, labels)
+
+    with self.lock:
+      if key not in self.histograms:
+        self.histograms[key] = Histogram(buckets)
+
+      self.histograms[key].observe(value)
+
+  @contextmanager
+  def timer(self, name: str, **labels):
+    start = time.perf_counter()
+
+    try:
+      yield
+    finally:
+      self.observe(name, time.perf_counter() - start, **labels)
+
+  def reset(self):
+    with self.lock:
+      self.counters, self.histograms = {}, {}
+      self.started = datetime.now()
+
+  def snapshot(self) -> dict:
+    with self.lock:
+      return {
+        "started": str(self.started),
+        "finished": str(datetime.now()),
+        "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())],
+        "histograms": [
+          {"name": name, "labels": dict(labels), "bounds": histogram.buckets, **histogram.report()}
+          for (name, labels), histogram in sorted(self.histograms.items())
+        ]
+      }
+
+  def write_jsonl(self, path: str, **fields):
+    # one line per run; fields (e.g. the command) are stored alongside the snapshot
+    with open(path, "a") as f:
+      f.write(json.dumps({**fields, **self.snapshot()}) + "\n")
+
+  def prometheus(self) -> str:
+    labels_text = lambda labels: "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}" if labels else ""
+    lines, typed = [], set()
+
+    with self.lock:
+      for (name, labels), value in sorted(self.counters.items()):
+        if name not in typed:
+          lines.append(f"# TYPE {PREFIX}{name} counter")
+          typed.add(name)
+
+        lines.append(f"{PREFIX}{name}{labels_text(labels)} {value}")
+
+      for (name, labels), histogram in sorted(self.histograms.items()):
+        if name not in typed:
+          lines.append(f"# TYPE {PREFIX}{name} histogram")
+          typed.add(name)
+
+        cumulative = 0
+
+        for bound, count in zip(histogram.buckets + ["+Inf"], histogram.counts):
+          cumulative += count
+          lines.append(f'{PREFIX}{name}_bucket{labels_text(labels + (("le", bound),))} {cumulative}')
+
+        lines.append(f"{PREFIX}{name}_sum{labels_text(labels)} {histogram.sum}")
+        lines.append(f"{PREFIX}{name}_count{labels_text(labels)} {histogram.count}")
+
+    return "\n".join(lines) + "\n"
+
+  def write_prometheus(self, path: str):
+    # written to a temporary file and renamed, as the node exporter's textfile collector expects
+    with open(f"{path}.tmp", "w") as f:
+      f.write(self.prometheus())
+
+    os.replace(f"{path}.tmp", path)
+
+# the process-wide registry that the generation, verification and LaTeX code report to
+METRICS = Metrics()
@@ -0,0 +1,135 @@
+import threading
+import queue
+import time
+
+CLOSED = None # sent downstream once a stage has nothing more to emit
+
+class StageStats():
+  def __init__(self, name: str):
+    self.name = name
+    self.items = 0
+    self.busy = 0 # seconds spent processing
+    self.waiting = 0 # seconds waiting on the stage before
+    self.blocked = 0 # seconds waiting on the stage after, i.e. backpressure
+    self.started = None
+    self.finished = None
+
+  def report(self) -> dict:
+    # the stage that limits the run is the one that is busy for most of its wall time
+    wall = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+
+    return {
+      "stage": self.name,
+      "items": self.items,
+      "items per second": self.items / wall if wall > 0 else None,
+      "busy": self.busy / wall if wall > 0 else None,
+      "waiting": self.waiting / wall if wall > 0 else None,
+      "blocked": self.blocked / wall if wall > 0 else None,
+      "seconds": wall
+    }
+
+class Stage(threading.Thread):
+  # calls function(items) on up to batch_size items at a time from inbox and puts what it returns on outbox
+  def __init__(self, name: str, function, inbox: queue.Queue, outbox: queue.Queue | None = None, batch_size: int = 1):
+    super().__init__(name = name, daemon = True)
+    self.function = function
+    self.inbox = inbox
+    self.outbox = outbox
+    self.batch_size = batch_size
+    self.stats = StageStats(name)
+    self.error = None
+
+  def emit(self, item):
+    if self.outbox is None:
+      return
+
+    start = time.perf_counter()
+    self.outbox.put(item)
+    self.stats.blocked += time.perf_counter() - start
+
+  def take(self) -> tuple:
+    # (items, closed): blocks for the first item, then takes whatever else is already queued
+    start = time.perf_counter()
+    item = self.inbox.get()
+    self.stats.waiting += time.perf_counter() - start
+
+    if item is CLOSED:
+      return [], True
+
+    items = [item]
+
+    while len(items) < self.batch_size:
+      try:
+        item = self.inbox.get_nowait()
+      except queue.Empty:
+        break
+
+      if item is CLOSED:
+        return items, True
+
+      items.append(item)
+
+    return items, False
+
+  def process(self, items: list):
+    start = time.perf_counter()
+    outputs = self.function(items)
+    self.stats.busy += time.perf_counter() - start
+    self.stats.items += len(items)
+
+    for output in outputs:
+      self.emit(output)
+
+  def run(self):
+    self.stats.started = time.perf_counter()
+    closed = False
+
+    while not closed:
+      items, closed = self.take()
+
+      # after an error the inbox is still drained so the stages before never block on a full queue
+      if items and self.error is None:
+        try:
+          self.process(items)
+        except Exception as e:
+          self.error = e
+
+    self.stats.finished = time.perf_counter()
+    self.emit(CLOSED)
+
+class Source(Stage):
+  # function(emit) produces the items itself, e.g. from an event loop
+  def __init__(self, name: str, function, outbox: queue.Queue):
+    super().__init__(name, function, None, outbox)
+
+  def emit(self, item):
+    if item is not CLOSED:
+      self.stats.items += 1
+
+    super().emit(item)
+
+  def run(self):
+    self.stats.started = time.perf_counter()
+
+    try:
+      self.function(self.emit)
+    except Exception as e:
+      self.error = e
+
+    self.stats.busy = time.perf_counter() - self.stats.started - self.stats.blocked
+    self.stats.finished = time.perf_counter()
+    super().emit(CLOSED)
+
+def run_stages(stages: list) -> list:
+  # runs the stages to completion and returns their stats; the first error is raised once all have stopped
+  for stage in stages:
+    stage.start()
+
+  for stage in stages:
+    stage.join()
+
+  for stage in stages:
+    if stage.error is not None:
+      raise stage.error
+
+  return [stage.stats.report() for stage in stages]
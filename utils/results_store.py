@@ -0,0 +1,201 @@
+from Code.utils.jsonl import loads, dumps
+from Code.utils.utils import parse_jsonl, repair_jsonl
+from Code.utils.resume import STAGE_FILES
+import threading
+import argparse
+import sqlite3
+import sys
+import os
+
+# run from the directory containing Code/: python -m Code.utils.results_store import results.sqlite /path/to/folder
+
+def folder_key(path: str) -> tuple:
+  # <root>/<model>/Attempt <n>/Temperature-<t> -> (model, n, t)
+  path, temperature = os.path.split(os.path.normpath(path))
+  path, attempt = os.path.split(path)
+
+  return os.path.basename(path), int(attempt.removeprefix("Attempt ")), float(temperature.removeprefix("Temperature-"))
+
+def key_folder(root: str, model: str, attempt: int, temperature: float) -> str:
+  return os.path.join(root, model, f"Attempt {attempt}", f"Temperature-{temperature}")
+
+class ResultsStore():
+  # every record of every temperature folder in one SQLite table, one row per (stage, model, attempt, temperature, id, prompt type)
+  def __init__(self, path: str):
+    self.path = path
+    self.connect()
+
+  def connect(self):
+    self.lock = threading.Lock()
+    self.conn = sqlite3.connect(self.path, timeout = 60, check_same_thread = False)
+    self.conn.execute("PRAGMA journal_mode = WAL")
+    self.conn.execute("PRAGMA synchronous = NORMAL")
+    self.conn.execute('''
+      CREATE TABLE IF NOT EXISTS records (
+        stage TEXT NOT NULL,
+        model TEXT NOT NULL,
+        attempt INTEGER NOT NULL,
+        temperature REAL NOT NULL,
+        id INTEGER NOT NULL,
+        prompt_type TEXT NOT NULL,
+        success INTEGER,
+        record TEXT NOT NULL
+      )
+    ''')
+    # rowid keeps the order records were first written in, which the export reproduces
+    self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS records_key ON records (model, attempt, temperature, id, prompt_type, stage)")
+    self.conn.execute("CREATE INDEX IF NOT EXISTS records_stage ON records (stage, model, attempt, temperature)")
+    self.conn.execute("CREATE INDEX IF NOT EXISTS records_proof ON records (id, prompt_type)")
+    self.conn.commit()
+
+  # worker processes reopen the database instead of inheriting the connection
+  def __getstate__(self) -> dict:
+    state = self.__dict__.copy()
+    del state["conn"], state["lock"]
+
+    return state
+
+  def __setstate__(self, state: dict):
+    self.__dict__.update(state)
+    self.connect()
+
+  def row(self, stage: str, model: str, attempt: int, temperature: float, record: dict) -> tuple:
+    success = record.get("success")
+
+    return stage, model, attempt, temperature, record["id"], record["prompt type"], None if success is None else int(success), dumps(record).decode()
+
+  def put_many(self, rows: list):
+    # rows are (stage, model, attempt, temperature, record); a record that is already stored is replaced in place
+    with self.lock:
+      self.conn.executemany('''
+        INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (model, attempt, temperature, id, prompt_type, stage) DO UPDATE SET success = excluded.success, record = excluded.record
+      ''', [self.row(*row) for row in rows])
+      self.conn.commit()
+
+  def put(self, stage: str, model: str, attempt: int, temperature: float, record: dict):
+    self.put_many([(stage, model, attempt, temperature, record)])
+
+  def put_path(self, folder: str, stage: str, record: dict):
+    # folder is a temperature folder, as used by ResumeIndex
+    self.put(stage, *folder_key(folder), record)
+
+  def query(self, stage: str, model: str | None = None, attempt: int | None = None, temperature: float | None = None, id: int | None = None, prompt_type: str | None = None) -> list:
+    # records of one stage in the order they were written, filtered on whichever fields are given
+    filters = {"model": model, "attempt": attempt, "temperature": temperature, "id": id, "prompt_type": prompt_type}
+    filters = {column: value for column, value in filters.items() if value is not None}
+    where = "".join(f" AND {column} = ?" for column in filters)
+
+    with self.lock:
+      rows = self.conn.execute(f"SELECT record FROM records WHERE stage = ?{where} ORDER BY rowid", (stage, *filters.values())).fetchall()
+
+    return [loads(record) for record, in rows]
+
+  def get(self, stage: str, model: str, attempt: int, temperature: float, id: int, prompt_type: str) -> dict | None:
+    records = self.query(stage, model, attempt, temperature, id, prompt_type)
+
+    return records[0] if records else None
+
+  def folders(self) -> list:
+    # every (model, attempt, temperature) with at least one record
+    with self.lock:
+      return self.conn.execute("SELECT DISTINCT model, attempt, temperature FROM records ORDER BY model, attempt, temperature").fetchall()
+
+  def import_tree(self, root: str) -> int:
+    # loads the JSONL files of every <model>/Attempt <n>/Temperature-<t> folder under root
+    n_records = 0
+
+    for model in sorted(os.listdir(root)):
+      for attempt in sorted(os.listdir(os.path.join(root, model))) if os.path.isdir(os.path.join(root, model)) else []:
+        if not attempt.startswith("Attempt "):
+          continue
+
+        for temperature in sorted(os.listdir(os.path.join(root, model, attempt))):
+          folder = os.path.join(root, model, attempt, temperature)
+
+          if not temperature.startswith("Temperature-") or not os.path.isdir(folder):
+            continue
+
+          for stage, name in STAGE_FILES.items():
+            path = os.path.join(folder, name)
+
+            if os.path.exists(path):
+              repair_jsonl(path)
+              records = parse_jsonl(path)
+              self.put_many([(stage, *folder_key(folder), record) for record in records])
+              n_records += len(records)
+
+    return n_records
+
+  def export_tree(self, root: str) -> int:
+    # writes the current layout back out, replacing the JSONL files of every folder in the store
+    n_records = 0
+
+    for model, attempt, temperature in self.folders():
+      folder = key_folder(root, model, attempt, temperature)
+      os.makedirs(folder, exist_ok = True)
+
+      for stage, name in STAGE_FILES.items():
+        records = self.query(stage, model, attempt, temperature)
+
+        if not records:
+          continue
+
+        with open(os.path.join(folder, name), "wb") as f:
+          f.write(b"".join(dumps(record) + b"\n" for record in records))
+
+        n_records += len(records)
+
+    return n_records
+
+  def close(self):
+    self.conn.close()
+
+# one store per path, shared by every ResumeIndex and StatisticsEngine in the process
+stores = {}
+
+def open_store(path: str) -> ResultsStore:
+  path = os.path.abspath(path)
+
+  if path not in stores:
+    stores[path] = ResultsStore(path)
+
+  return stores[path]
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description = "Copy results between folder trees and a SQLite results store, or query the store")
+  subparsers = parser.add_subparsers(dest = "command", required = True)
+
+  import_parser = subparsers.add_parser("import", help = "load every JSONL result under folder_path into the store")
+  import_parser.add_argument("store_path")
+  import_parser.add_argument("folder_path")
+
+  export_parser = subparsers.add_parser("export", help = "write the store back out as the usual folder tree")
+  export_parser.add_argument("store_path")
+  export_parser.add_argument("folder_path")
+
+  query_parser = subparsers.add_parser("query", help = "print the matching records of one stage as JSONL")
+  query_parser.add_argument("store_path")
+  query_parser.add_argument("stage", choices = list(STAGE_FILES))
+  query_parser.add_argument("--model", default = None)
+  query_parser.add_argument("--attempt", type = int, default = None)
+  query_parser.add_argument("--temperature", type = float, default = None)
+  query_parser.add_argument("--id", type = int, default = None)
+  query_parser.add_argument("--prompt-type", default = None)
+
+  return parser
+
+def main(argv: list | None = None):
+  args = build_parser().parse_args(argv)
+  store = ResultsStore(args.store_path)
+
+  if args.command == "import":
+    print(f"Imported {store.import_tree(args.folder_path)} records")
+  elif args.command == "export":
+    print(f"Exported {store.export_tree(args.folder_path)} records")
+  else:
+    for record in store.query(args.stage, args.model, args.attempt, args.temperature, args.id, args.prompt_type):
+      sys.stdout.write(dumps(record).decode() + "\n")
+
+if __name__ == "__main__":
+  main()
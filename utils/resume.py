@@ -0,0 +1,40 @@
+from Code.utils.utils import parse_jsonl, repair_jsonl
+import os
+
+STAGE_FILES = {
+  "generation": "proofs.jsonl",
+  "verification": "verification.jsonl",
+  "latex": "syntax-verification.jsonl",
+  "failed": "failed-proofs.jsonl"
+}
+
+class ResumeIndex():
+  # records already written, keyed by (temperature folder, theorem id, prompt type, stage);
+  # with a ResultsStore, every record added is also written to the store
+  def __init__(self, folders: list, store = None):
+    self.records = {}
+    self.store = store
+
+    for folder in folders:
+      for stage, name in STAGE_FILES.items():
+        path = os.path.join(folder, name)
+
+        if not os.path.exists(path):
+          continue
+
+        repair_jsonl(path)
+
+        for record in parse_jsonl(path):
+          self.records[(folder, record["id"], record["prompt type"], stage)] = record
+
+  def is_done(self, folder: str, id: int, prompt_type: str, stage: str) -> bool:
+    return (folder, id, prompt_type, stage) in self.records
+
+  def get(self, folder: str, id: int, prompt_type: str, stage: str) -> dict | None:
+    return self.records.get((folder, id, prompt_type, stage))
+
+  def add(self, folder: str, stage: str, record: dict):
+    self.records[(folder, record["id"], record["prompt type"], stage)] = record
+
+    if self.store is not None:
+      self.store.put_path(folder, stage, record)
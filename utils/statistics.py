@@ -1,150 +1,165 @@
-from utils import parse_jsonl, find_thing
+from Code.utils.utils import parse_jsonl
+import os
+
+PROMPT_TYPES = ["zero shot", "chain of thought", "few shot"]
+METRIC_NAMES = ["clarity", "descriptiveness", "redundancy", "ensemble f1", "baseline f1", "baseline skipped", "accuracy"]
+
+class StatisticsEngine():
+  # every attempt file is parsed once and indexed on (id, prompt type); with a ResultsStore,
+  # report reads the verification records from the store instead of the folder tree
+  def __init__(self, store = None):
+    self.indexes = {}
+    self.store = store
+
+  def load(self, path: str | tuple) -> tuple | None:
+    # path is a file, or a (model, attempt, temperature) key into the store, which is queried every time;
+    # None when the file doesn't exist (yet), e.g. in a partially run tree
+    if isinstance(path, tuple):
+      records = self.store.query("verification", *path)
+
+      return records, {(record["id"], record.get("prompt type")): record for record in records}
+
+    if not os.path.exists(path):
+      return None
+
+    key = (path, os.stat(path).st_mtime_ns)
+
+    if key not in self.indexes:
+      records = parse_jsonl(path)
+      self.indexes[key] = (records, {(record["id"], record.get("prompt type")): record for record in records})
+
+    return self.indexes[key]
+
+  def find(self, index: dict, record: dict) -> dict | None:
+    return index.get((record["id"], record.get("prompt type")), index.get((record["id"], None)))
+
+  def compute(self, attempt_1_path: str | tuple, attempt_2_path: str | tuple, baseline_idx: int = 0, prompt_type: str | None = None) -> dict:
+    if type(baseline_idx) != int:
+      raise ValueError("The index of the baseline model should be an integer.")
+
+    first, second = self.load(attempt_1_path), self.load(attempt_2_path)
+
+    if first is None or second is None:
+      return dict.fromkeys(METRIC_NAMES)
+
+    records, _ = first
+    _, second_index = second
+    clarity, descriptiveness, graded = 0, 0, 0
+    tot_redundancy, tot_proof_length = 0, 0
+    ensemble, baseline = [0, 0, 0], [0, 0, 0] # tp, fp, fn
+    baseline_skipped = 0 # proofs the cascade decided without running the baseline model
+    tot_correct, tot = 0, 0
+
+    for record in records:
+      if prompt_type is not None and record.get("prompt type") != prompt_type:
+        continue
+
+      second_record = None if record["success"] and record["success-human"] else self.find(second_index, record)
+
+      if second_record is None and not (record["success"] and record["success-human"]):
+        print(f'Could not find the result of proof {record["id"]} prompt type {record.get("prompt type")}')
+
+      # clarity, descriptiveness and redundancy fall back on the second attempt when the ensemble rejected the first
+      graded_record = record if record["success"] else second_record
+
+      if graded_record is not None:
+        clarity += graded_record["clarity"]
+        descriptiveness += graded_record["descriptiveness"]
+        graded += 1
+
+        # verification records hold the number of steps, not the proof itself
+        if graded_record.get("steps"):
+          length = graded_record["steps"]
+          tot_redundancy += graded_record["redundancy"] * length / 100
+          tot_proof_length += length
+
+      # F1 and accuracy fall back on the second attempt when a human rejected the first
+      human_record = record if record["success-human"] else second_record
+
+      if human_record is None:
+        continue
+
+      correct = human_record["success-human"]
+      baseline_vote = human_record["classifications"][baseline_idx]
+      votes = [(ensemble, human_record["success"])]
+
+      if baseline_vote is None:
+        baseline_skipped += 1
+      else:
+        votes.append((baseline, baseline_vote))
+
+      for counts, classification in votes:
+        if correct and classification:
+          counts[0] += 1
+        elif not correct and classification:
+          counts[1] += 1
+        elif correct and not classification:
+          counts[2] += 1
+
+      tot_correct += correct
+      tot += 1
+
+    f1 = lambda tp, fp, fn: 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else None
+
+    return {
+      "clarity": clarity / graded if graded else None,
+      "descriptiveness": descriptiveness / graded if graded else None,
+      "redundancy": tot_redundancy / tot_proof_length if tot_proof_length else None,
+      "ensemble f1": f1(*ensemble),
+      "baseline f1": f1(*baseline),
+      "baseline skipped": baseline_skipped,
+      "accuracy": round(tot_correct * 100 / tot, 2) if tot else None
+    }
+
+  def report(self, folder_path: str, models: list, temperatures: list, file_name: str = "verification.jsonl", baseline_idx: int = 0) -> list:
+    # one row per model x temperature x prompt type, plus an "all" row per model x temperature
+    rows = []
+
+    for model in models:
+      for temperature in temperatures:
+        if self.store is not None:
+          attempt_1_path, attempt_2_path = (model, 1, temperature), (model, 2, temperature)
+        else:
+          attempt_1_path = os.path.join(folder_path, model, "Attempt 1", f"Temperature-{temperature}", file_name)
+          attempt_2_path = os.path.join(folder_path, model, "Attempt 2", f"Temperature-{temperature}", file_name)
+
+          for path in [attempt_1_path, attempt_2_path]:
+            if not os.path.exists(path):
+              print(f"Could not find {path}, its metrics are left empty")
+
+        for prompt_type in PROMPT_TYPES + [None]:
+          metrics = self.compute(attempt_1_path, attempt_2_path, baseline_idx, prompt_type)
+          rows.append({"model": model, "temperature": temperature, "prompt type": prompt_type or "all", **metrics})
+
+    return rows
+
+def format_report(rows: list) -> str:
+  columns = list(rows[0].keys())
+  cells = [[f"{row[column]:.4f}" if isinstance(row[column], float) and column != "temperature" else str(row[column]) for column in columns] for row in rows]
+  widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+  lines = [" | ".join(column.ljust(width) for column, width in zip(columns, widths)).rstrip()]
+  lines.append("-+-".join("-" * width for width in widths))
+  lines += [" | ".join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in cells]
+
+  return "\n".join(lines)
+
+engine = StatisticsEngine()
+
 
 def calc_avg_clarity(attempt_1_path: str, attempt_2_path: str) -> float:
-  proofs = parse_jsonl(attempt_1_path)
-  second_proofs = parse_jsonl(attempt_2_path)
-  avg_clarity, ctr = 0, 0
-
-  for proof in proofs:
-    correct = proof["success"]
-    clarity = proof["clarity"]
-
-    if not correct:
-      try:
-        second_proof = find_thing(second_proofs, proof["id"], proof["prompt type"])
-        clarity = second_proof["clarity"]
-      except Exception as e:
-        print(f'Could not find the result of proof {proof["id"]} prompt type {proof["prompt type"]}: {e}')
-        continue  
-    
-    avg_clarity += clarity
-    ctr += 1
-
-  return avg_clarity / ctr
+  return engine.compute(attempt_1_path, attempt_2_path)["clarity"]
 
 def calc_avg_descriptiveness(attempt_1_path: str, attempt_2_path: str) -> float:
-  proofs = parse_jsonl(attempt_1_path)
-  second_proofs = parse_jsonl(attempt_2_path)
-  avg_descriptiveness, ctr = 0, 0
-
-  for proof in proofs:
-    correct = proof["success"]
-    descriptiveness = proof["descriptiveness"]
-
-    if not correct:
-      try:
-        second_proof = find_thing(second_proofs, proof["id"], proof["prompt type"])
-        descriptiveness = second_proof["descriptiveness"]
-      except Exception as e:
-        print(f'Could not find the result of proof {proof["id"]} prompt type {proof["prompt type"]}: {e}')
-        continue  
-    
-    avg_descriptiveness += descriptiveness
-    ctr += 1
-
-  return avg_descriptiveness / ctr
+  return engine.compute(attempt_1_path, attempt_2_path)["descriptiveness"]
 
 def calc_avg_redundancy(attempt_1_path: str, attempt_2_path: str) -> float:
-  proofs = parse_jsonl(attempt_1_path)
-  second_proofs = parse_jsonl(attempt_2_path)
-  tot_redundancy = 0
-  tot_proof_length = 0
-
-  for proof in proofs:
-    length = len(proof["proof"])
-    redundancy = proof["redundancy"] * length / 100
-    correct = proof["success"]
-
-    if not correct:
-      try:
-        second_proof = find_thing(second_proofs, proof["id"], proof["prompt type"])
-        length = len(second_proof["proof"])
-        redundancy = second_proof["redundancy"] * length / 100
-      except Exception as e:
-        print(f'Could not find the result of proof {proof["id"]} prompt type {proof["prompt type"]}: {e}')
-        continue       
-
-    tot_proof_length += length
-    tot_redundancy += redundancy
-
-  return tot_redundancy / tot_proof_length
+  return engine.compute(attempt_1_path, attempt_2_path)["redundancy"]
 
 def calc_ensemble_f1(attempt_1_path: str, attempt_2_path: str) -> float:
-  results = parse_jsonl(attempt_1_path)
-  second_results = parse_jsonl(attempt_2_path)
-  tp, fp, fn = 0, 0, 0
-
-  for result in results:
-    correct = result["success-human"]
-    classification = result["success"]
-
-    if not correct:
-      try:
-        second_result = find_thing(second_results, result["id"], result["prompt type"])
-        correct = second_result["success-human"]
-        classification = second_result["success"]
-      except Exception as e:
-        print(f'Could not find the result of proof {result["id"]} prompt type {result["prompt type"]}: {e}')
-        continue      
-
-    if correct and classification:
-      tp += 1
-    elif not correct and classification:
-      fp += 1
-    elif correct and not classification:
-      fn += 1
-  
-  return 2 * tp / (2 * tp + fp + fn)
+  return engine.compute(attempt_1_path, attempt_2_path)["ensemble f1"]
 
 def calc_baseline_f1(attempt_1_path: str, attempt_2_path: str, baseline_idx: int) -> float:
-  try:
-    assert type(baseline_idx) == int
-  except Exception as e:
-    raise ValueError("The index of the baseline model should be an integer.")
-
-  results = parse_jsonl(attempt_1_path)
-  second_results = parse_jsonl(attempt_2_path)
-  tp, fp, fn = 0, 0, 0
-
-  for result in results:
-    correct = result["success-human"]
-    classification = result["classifications"][baseline_idx]
-
-    if not correct:
-      try:
-        second_result = find_thing(second_results, result["id"], result["prompt type"])
-        correct = second_result["success-human"]
-        classification = second_result["classifications"][baseline_idx]
-      except Exception as e:
-        print(f'Could not find the result of proof {result["id"]} prompt type {result["prompt type"]}: {e}')
-        continue      
-
-    if correct and classification:
-      tp += 1
-    elif not correct and classification:
-      fp += 1
-    elif correct and not classification:
-      fn += 1
-  
-  return 2 * tp / (2 * tp + fp + fn)
+  return engine.compute(attempt_1_path, attempt_2_path, baseline_idx)["baseline f1"]
 
 def calc_math_accuracy(attempt_1_path: str, attempt_2_path: str) -> float:
-  attempt_1_result = parse_jsonl(attempt_1_path)
-  attempt_2_result = parse_jsonl(attempt_2_path)
-  tot_correct, tot = 0, 0
-
-  for result in attempt_1_result:
-    correct = result["success-human"]
-
-    if not correct:
-      try:
-        second_result = find_thing(attempt_2_result, result["id"], result["prompt type"])
-        correct = second_result["success-human"]
-      except Exception as e:
-        print(f'Could not find the result of proof {result["id"]} prompt type {result["prompt type"]}: {e}')
-        continue
-    
-    tot_correct += correct
-    tot += 1
-
-  return round(tot_correct * 100 / tot, 2)
\ No newline at end of file
+  return engine.compute(attempt_1_path, attempt_2_path)["accuracy"]
\ No newline at end of file
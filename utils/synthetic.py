@@ -0,0 +1,37 @@
+from Code.utils.utils import parse_jsonl
+import random
+
+PROMPT_TYPES = ["zero shot", "chain of thought", "few shot"]
+
+def example_steps(example: str) -> list:
+  # the few-shot examples are "Prove the following proposition: ... Proof: <one sentence per line>"
+  if "Proof:" not in example:
+    return []
+
+  return [line.strip() for line in example.split("Proof:", 1)[1].split("\n") if line.strip()]
+
+def synthetic_proofs(propositions_path: str, seed: int = 0, max_steps: int = 12) -> list:
+  # proof-shaped records built from the propositions, for benchmarks and parity checks
+  propositions = parse_jsonl(propositions_path)
+  sentences = [step for proposition in propositions for step in example_steps(proposition["example"])]
+  rng = random.Random(seed)
+  proofs = []
+
+  for proposition in propositions:
+    for prompt_type in PROMPT_TYPES:
+      steps = example_steps(proposition["example"]) if prompt_type == "few shot" else []
+
+      if not steps:
+        steps = [f"Assume the hypotheses of the proposition {proposition['statement']}."]
+        steps += rng.sample(sentences, rng.randint(0, max_steps - 2))
+        steps.append(f"Hence {proposition['statement']}.")
+
+      proofs.append({
+        "id": proposition["id"],
+        "prompt type": prompt_type,
+        "proof type": ["Direct proof."],
+        "premise": f"Let the objects in {proposition['statement']} be arbitrary elements of the {proposition['field']} under consideration.",
+        "proof": steps[:max_steps]
+      })
+
+  return proofs
@@ -1,12 +1,26 @@
 from Code.generation.prompt_type import PromptType
-import json
+from Code.utils.latex import precheck_latex, proof_contents, run_tex
+from Code.utils.jsonl import iter_jsonl, get_appender
+from Code.utils.metrics import METRICS
 import os
 
 def parse_jsonl(path: str) -> list:
-  with open(path, "r") as f:
-    jsonl = list(f)
-    
-  return [json.loads(json_str) for json_str in jsonl]
+  return list(iter_jsonl(path))
+
+def append_jsonl(path: str, record: dict):
+  # buffered by the file's long-lived appender, which only ever writes whole lines
+  get_appender(path).write(record)
+
+def repair_jsonl(path: str):
+  # drop a trailing partial line left behind by an interrupted run
+  if not os.path.exists(path):
+    return
+
+  with open(path, "rb+") as f:
+    data = f.read()
+
+    if data and not data.endswith(b"\n"):
+      f.truncate(data.rfind(b"\n") + 1)
 
 def build_prompt(prompt_type: PromptType, theorem: dict) -> str:
   msg = ""
@@ -49,10 +63,10 @@ def build_prompts(path: str) -> list:
     
     if proof["example"] != "":
       prompt_fs = build_prompt(PromptType.FEW_SHOT, proof)
-      arr += [{
+      arr += [[{
         "type": "text",
         "text": prompt_fs
-      }]
+      }]]
       
     prompts.append(arr)
     
@@ -65,19 +79,13 @@ def verify_latex(path: str, proof: dict, template: str) -> dict:
     "success": False
   }
 
-  contents = " ".join([proof["premise"]] + proof["proof"])
-  
-  with open(path, "w") as f:
-    f.write(template % contents)
-  
-  result["success"] = os.system(f"latexmk -pdf {path}") == 0
+  contents = proof_contents(proof)
+
+  # compiled in a private directory next to `path`, so concurrent runs never share a file
+  with METRICS.timer("latex_proof_seconds"):
+    if precheck_latex(contents) is None:
+      result["success"] = run_tex(["pdflatex"], template % contents, 60, os.path.dirname(path) or None)
+
+  METRICS.count("latex_proofs_total", success = result["success"])
   
   return result
-
-def find_thing(things: list, id: int, prompt_type: str = "") -> dict | int:
-  for thing in things:
-    if thing["id"] == id:
-      if not "prompt type" in thing.keys() or thing["prompt type"] == prompt_type:
-        return thing
-      
-  return -1
\ No newline at end of file
@@ -0,0 +1,103 @@
+from enum import Enum
+import os
+
+class InferenceBackend(Enum):
+  TORCH_FP32 = 0
+  TORCH_INT8 = 1 # dynamic int8 quantization of the linear layers, CPU only
+  ONNX = 2 # exported graph run by ONNX Runtime
+
+ONNX_OPSET = 17
+
+def artifact_path(artifact_dir: str, model_name: str) -> str:
+  return os.path.join(artifact_dir, model_name.replace("/", "--"), "model.onnx")
+
+def export_onnx(model, path: str):
+  import torch
+
+  os.makedirs(os.path.dirname(path), exist_ok = True)
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  example = torch.ones((1, 8), dtype = torch.long)
+  model = model.to("cpu").eval()
+
+  torch.onnx.export(
+    model,
+    (example, example),
+    tmp_path,
+    input_names = ["input_ids", "attention_mask"],
+    output_names = ["logits"],
+    dynamic_axes = {
+      "input_ids": {0: "batch", 1: "sequence"},
+      "attention_mask": {0: "batch", 1: "sequence"},
+      "logits": {0: "batch"}
+    },
+    opset_version = ONNX_OPSET,
+    dynamo = False
+  )
+  os.replace(tmp_path, path)
+
+class TorchRunner():
+  def __init__(self, model, device):
+    self.model = model
+    self.device = device
+
+  def __call__(self, input_ids, attention_mask):
+    return self.model(input_ids = input_ids.to(self.device), attention_mask = attention_mask.to(self.device))["logits"]
+
+class OnnxRunner():
+  def __init__(self, path: str, threads: int | None = None):
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+    if threads is not None:
+      options.intra_op_num_threads = threads
+
+    self.session = onnxruntime.InferenceSession(path, options, providers = ["CPUExecutionProvider"])
+
+  def __call__(self, input_ids, attention_mask):
+    import torch
+
+    logits = self.session.run(["logits"], {"input_ids": input_ids.numpy(), "attention_mask": attention_mask.numpy()})[0]
+
+    return torch.from_numpy(logits)
+
+def backend_signature(backend: InferenceBackend, model_name: str, artifact_dir: str) -> str:
+  # identifies what produced a score, so score caches never mix backends; a re-exported ONNX graph gets a new signature
+  match backend:
+    case InferenceBackend.TORCH_FP32:
+      return "torch-fp32"
+    case InferenceBackend.TORCH_INT8:
+      return "torch-int8-dynamic-linear"
+    case InferenceBackend.ONNX:
+      path = artifact_path(artifact_dir, model_name)
+      stat = os.stat(path) if os.path.exists(path) else None
+
+      return f"onnx-opset{ONNX_OPSET}" + (f"-{stat.st_size}-{stat.st_mtime_ns}" if stat else "")
+    case _:
+      raise ValueError("Invalid inference backend")
+
+def load_runner(backend: InferenceBackend, model_name: str, device, artifact_dir: str) -> tuple:
+  # returns (runner, number of parameters); ONNX artifacts are exported once and reused
+  from transformers import AutoModelForSequenceClassification
+
+  match backend:
+    case InferenceBackend.TORCH_FP32:
+      model = AutoModelForSequenceClassification.from_pretrained(model_name).to(device).eval()
+      return TorchRunner(model, device), model.num_parameters()
+    case InferenceBackend.TORCH_INT8:
+      import torch
+
+      model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+      quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype = torch.qint8)
+      return TorchRunner(quantized, "cpu"), model.num_parameters()
+    case InferenceBackend.ONNX:
+      path = artifact_path(artifact_dir, model_name)
+
+      if not os.path.exists(path):
+        export_onnx(AutoModelForSequenceClassification.from_pretrained(model_name), path)
+
+      # fp32 weights dominate the graph file
+      return OnnxRunner(path), os.path.getsize(path) // 4
+    case _:
+      raise ValueError("Invalid inference backend")
@@ -0,0 +1,145 @@
+from Code.verification.verification_model import NLIModel, VerificationModel
+from Code.utils.metrics import METRICS
+import multiprocessing as mp
+import itertools
+import queue
+import os
+
+def split_cores(n_workers: int) -> list:
+  cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+  per_worker = max(len(cores) // n_workers, 1)
+
+  return [cores[(i * per_worker) % len(cores):][:per_worker] for i in range(n_workers)]
+
+def run_worker(model_kwargs: dict, cores: list, tasks, results):
+  import torch
+
+  if hasattr(os, "sched_setaffinity"):
+    os.sched_setaffinity(0, cores)
+
+  torch.set_num_threads(len(cores))
+  model_idx = model_kwargs["model_type"].value
+
+  try:
+    model = NLIModel(**model_kwargs)
+    model.load() # NLIModel loads lazily, so load now for a failure to show up in the handshake
+  except Exception as e:
+    results.put((None, model_idx, f"Unable to load {model_kwargs['model_name']}: {e}"))
+    return
+
+  results.put((None, model_idx, None))
+
+  while (task := tasks.get()) is not None:
+    job_id, proofs = task
+
+    try:
+      results.put((job_id, model_idx, model.evaluate_proofs(proofs)))
+    except Exception as e:
+      results.put((job_id, model_idx, f"{type(e).__name__}: {e}"))
+
+class EnsemblePool(VerificationModel):
+  # one persistent process per NLIModel, each pinned to its own slice of cores. Workers are spawned, so they
+  # re-import the __main__ module: create the pool under `if __name__ == "__main__":`, or every worker dies at startup
+  def __init__(self, model_kwargs: list, poll_interval: float = 5):
+    super().__init__([kwargs["model_type"] for kwargs in model_kwargs])
+    ctx = mp.get_context("spawn")
+    self.poll_interval = poll_interval # seconds between checks that the workers are still alive
+    self.model_names = {kwargs["model_type"].value: kwargs["model_name"] for kwargs in model_kwargs}
+    self.results = ctx.Queue()
+    self.tasks = [ctx.Queue() for _ in model_kwargs]
+    self.jobs = itertools.count()
+    self.workers = [
+      ctx.Process(target = run_worker, args = (kwargs, cores, tasks, self.results), daemon = True)
+      for kwargs, cores, tasks in zip(model_kwargs, split_cores(len(model_kwargs)), self.tasks)
+    ]
+
+    self.worker_models = {kwargs["model_type"].value: worker for kwargs, worker in zip(model_kwargs, self.workers)}
+
+    for worker in self.workers:
+      worker.start()
+
+    errors = [error for _, _, error in self.collect(set(self.worker_models), startup = True) if error is not None]
+
+    if errors:
+      self.close()
+      raise RuntimeError("; ".join(errors))
+
+  def evaluate_proofs(self, proofs: list) -> tuple:
+    # only the totals are recorded here, the per-model metrics stay in the worker processes
+    METRICS.count("verification_proofs_total", len(proofs))
+
+    with METRICS.timer("verification_seconds"):
+      return self.evaluate_in_workers(proofs)
+
+  def evaluate_in_workers(self, proofs: list) -> tuple:
+    job_id = next(self.jobs)
+    classifications = [[False] * len(self.models) for _ in proofs]
+    step_scores = [[None] * len(self.models) for _ in proofs]
+
+    for tasks in self.tasks:
+      tasks.put((job_id, proofs))
+
+    errors = []
+
+    for result_id, model_idx, result in self.collect(set(self.worker_models)):
+      if result_id != job_id:
+        raise RuntimeError(f"Received result for job {result_id} while waiting on job {job_id}")
+      elif isinstance(result, str):
+        errors.append(result)
+        continue
+
+      for row, score_row, verdict, scores in zip(classifications, step_scores, *result):
+        row[model_idx] = verdict
+        score_row[model_idx] = scores
+
+    if errors:
+      raise RuntimeError("; ".join(errors))
+
+    return classifications, step_scores
+
+  def collect(self, pending: set, startup: bool = False) -> list:
+    # one result from each model in pending; a worker that exits without answering (OOM kill, segfault,
+    # a missing __main__ guard) raises instead of leaving the parent waiting forever
+    results = []
+
+    while pending:
+      try:
+        result = self.results.get(timeout = self.poll_interval)
+      except queue.Empty:
+        dead = [model_idx for model_idx in sorted(pending) if not self.worker_models[model_idx].is_alive()]
+
+        if dead:
+          self.terminate()
+          hint = " (is the pool created under `if __name__ == \"__main__\":`?)" if startup else ""
+          raise RuntimeError("; ".join(f"The worker for {self.model_names[model_idx]} exited with code {self.worker_models[model_idx].exitcode}" for model_idx in dead) + hint)
+
+        continue
+
+      pending.discard(result[1])
+      results.append(result)
+
+    return results
+
+  def close(self):
+    for tasks, worker in zip(self.tasks, self.workers):
+      if worker.is_alive():
+        tasks.put(None)
+
+    for worker in self.workers:
+      worker.join()
+
+  def terminate(self):
+    # after a worker died mid-write it may still hold the results queue's lock, which would block the others forever
+    for tasks, worker in zip(self.tasks, self.workers):
+      tasks.cancel_join_thread() # tasks queued for a dead worker are never read
+
+      if worker.is_alive():
+        worker.terminate()
+
+      worker.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
@@ -0,0 +1,78 @@
+from Code.verification.verification_model import NLIModelType, NLIModel, is_majority
+from Code.verification.backends import InferenceBackend
+from Code.utils.synthetic import synthetic_proofs
+from Code.config import NLI_MODEL_NAMES
+import argparse
+import json
+import os
+
+def compare(reference: list, candidate: list) -> dict:
+  # reference and candidate are per-proof lists of step scores
+  diffs = [abs(a - b) for ref, cand in zip(reference, candidate) for a, b in zip(ref, cand)]
+
+  return {
+    "mean abs diff": sum(diffs) / len(diffs) if diffs else 0,
+    "max abs diff": max(diffs, default = 0)
+  }
+
+def run_parity(proofs: list, model_names: dict, backends: list, grade_threshold: float, batch_size: int, artifact_dir: str) -> dict:
+  # scores every proof under each backend and measures drift from torch fp32
+  scores, verdicts = {}, {}
+
+  for backend in [InferenceBackend.TORCH_FP32] + backends:
+    for model_type, model_name in model_names.items():
+      model = NLIModel(model_type, model_name, "cpu", grade_threshold, batch_size, backend = backend, artifact_dir = artifact_dir)
+      scores[backend, model_type] = model.score_proofs(proofs)
+      verdicts[backend, model_type] = [model.grade(steps, len(proof["proof"])) for proof, steps in zip(proofs, scores[backend, model_type])]
+      # only one model is held in memory at a time
+      model.unload()
+
+  report = {}
+
+  for backend in backends:
+    models = {}
+
+    for model_type in model_names:
+      flips = sum(a != b for a, b in zip(verdicts[InferenceBackend.TORCH_FP32, model_type], verdicts[backend, model_type]))
+      models[model_type.name] = {
+        **compare(scores[InferenceBackend.TORCH_FP32, model_type], scores[backend, model_type]),
+        "grade flips": flips
+      }
+
+    decisions = [
+      [is_majority([verdicts[b, model_type][i] for model_type in model_names]) for i in range(len(proofs))]
+      for b in (InferenceBackend.TORCH_FP32, backend)
+    ]
+    report[backend.name] = {
+      "models": models,
+      "ensemble flips": sum(a != b for a, b in zip(*decisions)),
+      "proofs": len(proofs)
+    }
+
+  return report
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description = "Score drift of the quantized and ONNX backends against torch fp32")
+  parser.add_argument("--propositions", default = os.path.join(os.path.dirname(__file__), "..", "data", "propositions.jsonl"))
+  parser.add_argument("--backends", nargs = "+", choices = [b.name for b in InferenceBackend if b != InferenceBackend.TORCH_FP32], default = ["TORCH_INT8", "ONNX"])
+  parser.add_argument("--models", nargs = "+", choices = [t.name for t in NLIModelType], default = [t.name for t in NLIModelType])
+  parser.add_argument("--model-name", action = "append", default = [], metavar = "TYPE=NAME", help = "override a checkpoint, e.g. BART=/path/to/model")
+  parser.add_argument("--limit", type = int, default = None, help = "number of synthetic proofs to score")
+  parser.add_argument("--grade-threshold", type = float, default = 50)
+  parser.add_argument("--batch-size", type = int, default = 16)
+  parser.add_argument("--artifact-dir", default = "nli-artifacts")
+  parser.add_argument("--seed", type = int, default = 0)
+
+  return parser
+
+def main(argv: list | None = None):
+  args = build_parser().parse_args(argv)
+  overrides = dict(item.split("=", 1) for item in args.model_name)
+  model_names = {NLIModelType[name]: overrides.get(name, NLI_MODEL_NAMES[NLIModelType[name].value]) for name in args.models}
+  proofs = synthetic_proofs(args.propositions, args.seed)[:args.limit]
+  report = run_parity(proofs, model_names, [InferenceBackend[name] for name in args.backends], args.grade_threshold, args.batch_size, args.artifact_dir)
+
+  print(json.dumps(report, indent = 2))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,99 @@
+from enum import Enum
+from itertools import accumulate
+
+class ContextPolicy(Enum):
+  FULL = 0 # whole prefix, oldest steps dropped only once the model limit is reached
+  WINDOW = 1 # variable definitions plus the last `window` steps
+
+class PremiseContext():
+  def __init__(self, tokenizer, max_length: int, policy: ContextPolicy = ContextPolicy.FULL, window: int = 8):
+    self.tokenizer = tokenizer
+    self.max_length = max_length
+    self.policy = policy
+    self.window = window
+    self.prefix, self.middle, self.suffix = self.pair_template()
+    self.n_special = len(self.prefix) + len(self.middle) + len(self.suffix)
+    self.separated = self.encodes_separators()
+
+  def signature(self) -> str:
+    # separator-aware encodings give different ids, so they don't share cache entries with the plain ones
+    separators = "-sep" if self.separated else ""
+
+    match self.policy:
+      case ContextPolicy.FULL:
+        return f"full-{self.max_length}{separators}"
+      case ContextPolicy.WINDOW:
+        return f"window{self.window}-{self.max_length}{separators}"
+      case _:
+        raise ValueError("Invalid context policy")
+
+  def pair_template(self) -> tuple:
+    # recover the special tokens the tokenizer wraps around a (premise, hypothesis) pair
+    premise_ids, hypothesis_ids = self.encode_text("premise"), self.encode_text("hypothesis")
+    pair_ids = self.tokenizer("premise", "hypothesis")["input_ids"]
+
+    for i in range(len(pair_ids) - len(premise_ids) + 1):
+      if pair_ids[i:i + len(premise_ids)] == premise_ids:
+        rest = pair_ids[i + len(premise_ids):]
+
+        for j in range(len(rest) - len(hypothesis_ids) + 1):
+          if rest[j:j + len(hypothesis_ids)] == hypothesis_ids:
+            return pair_ids[:i], rest[:j], rest[j + len(hypothesis_ids):]
+
+    raise ValueError("Unable to locate the premise and hypothesis in the tokenizer's pair encoding")
+
+  def encode_text(self, text: str) -> list:
+    return self.tokenizer(text, add_special_tokens = False)["input_ids"]
+
+  def encodes_separators(self) -> bool:
+    # byte-level BPE (RoBERTa, BART) folds the whitespace before a word into its token, so a step inside the premise
+    # must be encoded with its leading "\n" or " "; a tokenizer for which that doesn't reproduce the joined premise
+    # keeps encoding the bare steps
+    definitions, steps = "Let $n$ be an integer.", ["Then $n^2 \\geq 0$.", "Hence $n^2 + 1 > 0$."]
+    separated_ids = self.encode_text(definitions) + self.encode_text(f"\n{steps[0]}") + self.encode_text(f" {steps[1]}")
+
+    return separated_ids == self.encode_text(self.premise_text(definitions, steps, 0, 2))
+
+  def encode_proof(self, proof: dict) -> list:
+    # each step is tokenized once per role (hypothesis, first step of a premise, later step of a premise)
+    # and its ids are reused for every later premise
+    definitions = proof["premise"]
+    steps = proof["proof"]
+    definition_ids = self.encode_text(definitions)
+    step_ids = [self.encode_text(step) for step in steps]
+
+    if self.separated:
+      first_ids = [self.encode_text(f"\n{step}") for step in steps]
+      joined_ids = [self.encode_text(f" {step}") for step in steps]
+    else:
+      first_ids = joined_ids = step_ids
+
+    offsets = [0] + list(accumulate(len(ids) for ids in joined_ids))
+    steps_length = lambda lo, k: len(first_ids[lo]) + offsets[k] - offsets[lo + 1] if lo < k else 0
+    start = 0 if len(steps) == 1 else 1
+    pairs = []
+
+    for k in range(start, len(steps)):
+      hypothesis_ids = step_ids[k][:self.max_length // 2]
+      budget = self.max_length - self.n_special - len(hypothesis_ids)
+      kept_definitions = definition_ids[:budget]
+      lo = 0
+
+      if self.policy == ContextPolicy.WINDOW:
+        lo = max(0, k - self.window)
+
+      # drop the oldest steps first so the definitions and the latest steps survive
+      while lo < k and len(kept_definitions) + steps_length(lo, k) > budget:
+        lo += 1
+
+      premise_ids = kept_definitions + (first_ids[lo] + [token for ids in joined_ids[lo + 1:k] for token in ids] if lo < k else [])
+      input_ids = self.prefix + premise_ids + self.middle + hypothesis_ids + self.suffix
+      pairs.append((self.premise_text(definitions, steps, lo, k), steps[k], input_ids))
+
+    return pairs
+
+  def premise_text(self, definitions: str, steps: list, lo: int, k: int) -> str:
+    if lo == k:
+      return definitions
+
+    return f'{definitions}\n{" ".join(steps[lo:k])}'
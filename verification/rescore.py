@@ -0,0 +1,160 @@
+from Code.verification.verification_model import NLIModelType
+from Code.utils.jsonl import iter_jsonl
+import numpy as np
+import argparse
+import json
+import math
+import os
+
+def find_files(paths: list, file_name: str) -> list:
+  # directories are searched recursively for file_name
+  files = []
+
+  for path in paths:
+    if os.path.isdir(path):
+      files += sorted(os.path.join(root, file_name) for root, _, names in os.walk(path) if file_name in names)
+    else:
+      files.append(path)
+
+  return files
+
+def pair_attempts(files: list) -> list:
+  # returns (file, its "Attempt 2" file or None outside an "Attempt 1" folder); an "Attempt 2" file
+  # whose "Attempt 1" file is also listed is only read through that pair, as StatisticsEngine.compute does
+  pairs, listed = [], set(files)
+
+  for path in files:
+    parts = path.split(os.sep)
+
+    if "Attempt 2" in parts and os.sep.join("Attempt 1" if part == "Attempt 2" else part for part in parts) in listed:
+      continue
+
+    second = os.sep.join("Attempt 2" if part == "Attempt 1" else part for part in parts) if "Attempt 1" in parts else None
+    pairs.append((path, second))
+
+  return pairs
+
+def load_scores(pairs: list, models: list) -> tuple:
+  # returns (scores [proof, model, pair] padded with NaN, steps [proof], labels [proof], number of records skipped)
+  # as for the F1-scores of stats, a proof a human rejected in the first attempt is replaced by its second attempt;
+  # records are skipped when that attempt is missing, or when a selected model has no scores or stopped early
+  keys = ["id", "prompt type", "scores", "steps", "success-human"]
+  rows, steps, labels, skipped = [], [], [], 0
+
+  for first_path, second_path in pairs:
+    second_index = {}
+
+    # a missing second attempt file skips every proof rejected in the first
+    if second_path is not None and os.path.exists(second_path):
+      for record in iter_jsonl(second_path, keys):
+        second_index[(record.get("id"), record.get("prompt type"))] = record
+
+    for record in iter_jsonl(first_path, keys):
+      if not record.get("success-human", True):
+        key = (record.get("id"), record.get("prompt type"))
+        record = second_index.get(key, second_index.get((key[0], None))) if second_path is not None else record
+
+      if record is None or any(key not in record for key in ["scores", "steps", "success-human"]):
+        skipped += 1
+        continue
+
+      n_pairs = max(record["steps"] - 1, 1)
+      scores = [record["scores"][model.value] for model in models]
+
+      if any(model_scores is None or len(model_scores) != n_pairs for model_scores in scores):
+        skipped += 1
+        continue
+
+      rows.append(scores)
+      steps.append(record["steps"])
+      labels.append(bool(record["success-human"]))
+
+  width = max((len(model_scores) for row in rows for model_scores in row), default = 1)
+  array = np.full((len(rows), len(models), width), np.nan)
+
+  for i, row in enumerate(rows):
+    for j, model_scores in enumerate(row):
+      array[i, j, :len(model_scores)] = model_scores
+
+  return array, np.array(steps, dtype = float), np.array(labels, dtype = bool), skipped
+
+def f1_curve(predictions: np.ndarray, labels: np.ndarray) -> dict:
+  # predictions is [threshold, proof]
+  tp = (predictions & labels).sum(axis = 1)
+  fp = (predictions & ~labels).sum(axis = 1)
+  fn = (~predictions & labels).sum(axis = 1)
+
+  with np.errstate(divide = "ignore", invalid = "ignore"):
+    f1 = np.where(tp + fp + fn > 0, 2 * tp / (2 * tp + fp + fn), np.nan)
+    precision = np.where(tp + fp > 0, tp / (tp + fp), np.nan)
+    recall = np.where(tp + fn > 0, tp / (tp + fn), np.nan)
+
+  to_list = lambda values: [None if math.isnan(value) else float(value) for value in values]
+
+  return {"f1": to_list(f1), "precision": to_list(precision), "recall": to_list(recall)}
+
+def rescore(scores: np.ndarray, steps: np.ndarray, labels: np.ndarray, models: list, thresholds: np.ndarray) -> dict:
+  # averages are computed the same way as NLIModel.grade: sum of pair scores over the number of steps
+  averages = np.nansum(scores, axis = 2) / steps[:, None] * 100 # [proof, model]
+  votes = averages[None, :, :] >= thresholds[:, None, None] # [threshold, proof, model]
+  n_votes = votes.sum(axis = 2)
+  curves = {}
+
+  for j, model in enumerate(models):
+    curves[model.name] = f1_curve(votes[:, :, j], labels)
+
+  for k in range(1, len(models) + 1):
+    curves[f"{k} of {len(models)}"] = f1_curve(n_votes >= k, labels)
+
+  curves["mean"] = f1_curve(averages.mean(axis = 1)[None, :] >= thresholds[:, None], labels)
+
+  return curves
+
+def best_points(curves: dict, thresholds: np.ndarray) -> dict:
+  best = {}
+
+  for rule, curve in curves.items():
+    f1 = [value if value is not None else -1 for value in curve["f1"]]
+    i = int(np.argmax(f1))
+    best[rule] = {"threshold": float(thresholds[i]), "f1": curve["f1"][i]}
+
+  return best
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description = "Re-grade saved step scores over a range of thresholds and voting rules")
+  parser.add_argument("paths", nargs = "+", help = "verification files, or folders searched for --file")
+  parser.add_argument("--file", default = "verification.jsonl", help = "human-annotated results file to look for in folders")
+  parser.add_argument("--models", nargs = "+", choices = [t.name for t in NLIModelType], default = [t.name for t in NLIModelType])
+  parser.add_argument("--thresholds", nargs = 3, type = float, default = [0, 100, 1], metavar = ("START", "STOP", "STEP"))
+  parser.add_argument("--output", default = None, help = "write the curves here instead of printing them")
+
+  return parser
+
+def main(argv: list | None = None):
+  args = build_parser().parse_args(argv)
+  models = [NLIModelType[name] for name in args.models]
+  start, stop, step = args.thresholds
+  thresholds = np.arange(start, stop + step / 2, step)
+  pairs = pair_attempts(find_files(args.paths, args.file))
+  scores, steps, labels, skipped = load_scores(pairs, models)
+  curves = rescore(scores, steps, labels, models, thresholds)
+
+  report = {
+    "files": len(pairs),
+    "second attempts": sum(second is not None and os.path.exists(second) for _, second in pairs),
+    "proofs": len(labels),
+    "skipped": skipped,
+    "thresholds": thresholds.tolist(),
+    "best": best_points(curves, thresholds),
+    "curves": curves
+  }
+
+  if args.output is None:
+    print(json.dumps(report["best"], indent = 2))
+    print(f'{report["proofs"]} proofs from {report["files"]} files ({report["second attempts"]} with a second attempt), {skipped} skipped; pass --output for the full curves')
+  else:
+    with open(args.output, "w") as f:
+      json.dump(report, f, indent = 2)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,105 @@
+import threading
+import sqlite3
+import hashlib
+import time
+
+class ScoreCache():
+  # raw entailment probabilities keyed by (model key, sha256(premise), sha256(hypothesis))
+  def __init__(self, path: str, max_entries: int | None = None, evict_every: int = 1000):
+    self.path = path
+    self.max_entries = max_entries
+    self.evict_every = evict_every
+    self.writes = 0
+    self.hits = 0
+    self.misses = 0
+    self.connect()
+
+  def connect(self):
+    self.lock = threading.Lock()
+    self.conn = sqlite3.connect(self.path, timeout = 60, check_same_thread = False)
+    self.conn.execute("PRAGMA journal_mode = WAL")
+    self.conn.execute("PRAGMA synchronous = NORMAL")
+    self.conn.execute('''
+      CREATE TABLE IF NOT EXISTS scores (
+        model TEXT NOT NULL,
+        premise TEXT NOT NULL,
+        hypothesis TEXT NOT NULL,
+        score REAL NOT NULL,
+        used REAL NOT NULL,
+        PRIMARY KEY (model, premise, hypothesis)
+      ) WITHOUT ROWID
+    ''')
+    self.conn.execute("CREATE INDEX IF NOT EXISTS scores_used ON scores (used)")
+    self.conn.commit()
+
+  # worker processes reopen the database instead of inheriting the connection
+  def __getstate__(self) -> dict:
+    state = self.__dict__.copy()
+    del state["conn"], state["lock"]
+
+    return state
+
+  def __setstate__(self, state: dict):
+    self.__dict__.update(state)
+    self.connect()
+
+  def digest(self, text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+  def get_many(self, model: str, pairs: list) -> list:
+    keys = [(model, self.digest(premise), self.digest(hypothesis)) for premise, hypothesis in pairs]
+
+    with self.lock:
+      scores = [
+        row[0] if (row := self.conn.execute("SELECT score FROM scores WHERE model = ? AND premise = ? AND hypothesis = ?", key).fetchone()) else None
+        for key in keys
+      ]
+      hit_keys = [key for key, score in zip(keys, scores) if score is not None]
+
+      if hit_keys:
+        now = time.time()
+        self.conn.executemany("UPDATE scores SET used = ? WHERE model = ? AND premise = ? AND hypothesis = ?", [(now, *key) for key in hit_keys])
+        self.conn.commit()
+
+    self.hits += len(hit_keys)
+    self.misses += len(keys) - len(hit_keys)
+
+    return scores
+
+  def put_many(self, model: str, pairs: list, scores: list):
+    if not pairs:
+      return
+
+    now = time.time()
+    rows = [(model, self.digest(premise), self.digest(hypothesis), score, now) for (premise, hypothesis), score in zip(pairs, scores)]
+
+    with self.lock:
+      self.conn.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)", rows)
+      self.conn.commit()
+
+    previous, self.writes = self.writes, self.writes + len(rows)
+
+    if previous // self.evict_every != self.writes // self.evict_every:
+      self.evict()
+
+  def evict(self):
+    # least recently used rows go first
+    if self.max_entries is None:
+      return
+
+    with self.lock:
+      count = self.conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+      if count > self.max_entries:
+        cutoff = self.conn.execute("SELECT used FROM scores ORDER BY used LIMIT 1 OFFSET ?", (count - self.max_entries,)).fetchone()[0]
+        self.conn.execute("DELETE FROM scores WHERE used < ?", (cutoff,))
+        self.conn.commit()
+
+  def stats(self) -> dict:
+    total = self.hits + self.misses
+
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit rate": self.hits / total if total else 0
+    }
@@ -0,0 +1,37 @@
+import hashlib
+import json
+
+# probes for normalization differences (casing, accents, spacing) that the vocabulary alone doesn't show
+PROBES = ["premise", "hypothesis", "Let $x \\in \\mathbb{R}$ with  x^2 = 1, Théorème ABC."]
+
+tokenizers = {} # model name -> tokenizer
+fingerprints = {} # model name -> fingerprint
+by_fingerprint = {} # fingerprint -> the one tokenizer kept for it
+
+def fingerprint(tokenizer) -> str:
+  # tokenizers with equal fingerprints produce the same input ids for the same pair
+  digest = hashlib.sha256()
+  digest.update(type(tokenizer).__name__.encode())
+  digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+  digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys = True, default = str).encode())
+  digest.update(json.dumps([tokenizer(probe)["input_ids"] for probe in PROBES]).encode())
+  digest.update(json.dumps(tokenizer(PROBES[0], PROBES[1])["input_ids"]).encode())
+  digest.update(str(tokenizer.padding_side).encode())
+
+  return digest.hexdigest()
+
+def load_tokenizer(model_name: str):
+  # each checkpoint's tokenizer is loaded once per process, and identical ones are kept only once
+  if model_name not in tokenizers:
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    fingerprints[model_name] = fingerprint(tokenizer)
+    tokenizers[model_name] = by_fingerprint.setdefault(fingerprints[model_name], tokenizer)
+
+  return tokenizers[model_name]
+
+def tokenizer_fingerprint(model_name: str) -> str:
+  load_tokenizer(model_name)
+
+  return fingerprints[model_name]
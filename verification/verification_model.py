@@ -1,9 +1,18 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from Code.verification.premise_context import ContextPolicy, PremiseContext
+from Code.verification.score_cache import ScoreCache
+from Code.verification.backends import InferenceBackend, backend_signature, load_runner
+from Code.verification.shared_tokenizers import load_tokenizer, tokenizer_fingerprint
+from Code.utils.utils import append_jsonl
+from Code.utils.jsonl import iter_jsonl
+from Code.utils.metrics import METRICS
 from enum import Enum
-import torch
+import time
+import gc
 import os
 import math
-import json
+
+SCORE_DIGITS = 4 # decimals kept for the raw step scores written with each result
+EARLY_EXIT_PAIRS = 2 # pairs scored per undecided proof between two early exit checks
 
 class NLIModelType(Enum):
   PRISM = 0
@@ -13,87 +22,466 @@ class NLIModelType(Enum):
   DEBERTA3 = 4
 
 class NLIModel():
-  def __init__(self, model_type: NLIModelType, model_name: str, device: str, grade_threshold: float):
+  def __init__(self, model_type: NLIModelType, model_name: str, device: str, grade_threshold: float, batch_size: int = 16, max_batch_tokens: int | None = None, context_policy: ContextPolicy = ContextPolicy.FULL, context_window: int = 8, early_exit: bool = False, score_cache: ScoreCache | None = None, backend: InferenceBackend = InferenceBackend.TORCH_FP32, artifact_dir: str = "nli-artifacts"):
     self.model_type = model_type
     self.model_name = model_name
     self.device = device
     self.grade_threshold = grade_threshold
-    
-    self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-    self.model = AutoModelForSequenceClassification.from_pretrained(self.model_name).to(self.device)
-    
-  def verify_step(self, premise: str, hypothesis: str) -> str:
-    tokens = self.tokenizer(premise, hypothesis, truncation = True, return_tensors = "pt")
-    output = self.model(tokens["input_ids"].to(self.device))
-    prediction = torch.softmax(output["logits"][0], -1).tolist()
-    label_names = ["entailment"]
-    prediction = {label: pred for pred, label in zip(prediction, label_names)}
-    
-    return prediction["entailment"]
-  
-  def verify_proof(self, proof: dict) -> bool:
-    avg_entailment = 0
-    premise = proof["premise"]
-    steps = proof["proof"]
-    start = 1
-    
-    # for single step proofs:
-    if len(proof["proof"]) == 1:
-      start = 0
-    else:
-      premise += f'\n{steps[0]}'
+    self.batch_size = batch_size
+    self.max_batch_tokens = max_batch_tokens # caps batch rows * padded length
+    self.early_exit = early_exit
+    self.seconds_per_pair = None # measured cost, used to order cascades
+    self.score_cache = score_cache
+    self.context_policy = context_policy
+    self.context_window = context_window
+    self.backend = backend
+    self.artifact_dir = artifact_dir # exported ONNX graphs, reused across runs
+
+    # loaded on first use so that nothing imports torch until a model is needed
+    self._tokenizer = None
+    self._model = None
+    self._context = None
+    self.n_parameters = None
+    self.estimated_parameters = None
+
+  def load_encoding(self):
+    # the tokenizer and premise context are all that encoding and cache lookups need
+    from transformers import AutoConfig
+
+    self._tokenizer = load_tokenizer(self.model_name)
+    config = AutoConfig.from_pretrained(self.model_name)
+    max_length = min(self._tokenizer.model_max_length, getattr(config, "max_position_embeddings", 512))
+    self._context = PremiseContext(self._tokenizer, max_length, self.context_policy, self.context_window)
+
+  def load(self):
+    if self._tokenizer is None:
+      self.load_encoding()
+
+    # the model is a callable (input_ids, attention_mask) -> logits whatever the backend
+    self._model, self.n_parameters = load_runner(self.backend, self.model_name, self.device, self.artifact_dir)
+
+  @property
+  def tokenizer(self):
+    if self._tokenizer is None:
+      self.load_encoding()
+
+    return self._tokenizer
+
+  @property
+  def model(self):
+    if self._model is None:
+      self.load()
+
+    return self._model
+
+  def unload(self):
+    # drops the weights so the next model can take their memory; they are reloaded on next use
+    self._tokenizer = self._model = self._context = None
+    gc.collect()
 
-    for step in steps[start:]:
-      avg_entailment += self.verify_step(premise, step)
-      premise += f' {step}'
-      
-    avg_entailment /= len(steps)
+    import torch
+
+    if torch.cuda.is_available():
+      torch.cuda.empty_cache()
+
+  def parameter_count(self) -> int:
+    # exact once loaded; before that estimated from config.json, so ordering a cascade loads no weights
+    if self.n_parameters is not None:
+      return self.n_parameters
+
+    if self.estimated_parameters is None:
+      from transformers import AutoConfig
+
+      config = AutoConfig.from_pretrained(self.model_name)
+      # BART-style configs map num_hidden_layers to the encoder; the decoder layers are added on top
+      layers = config.num_hidden_layers + getattr(config, "decoder_layers", 0)
+      self.estimated_parameters = 12 * layers * config.hidden_size ** 2 + config.vocab_size * config.hidden_size
+
+    return self.estimated_parameters
+
+  @property
+  def context(self) -> PremiseContext:
+    if self._context is None:
+      self.load_encoding()
+
+    return self._context
     
-    if avg_entailment * 100 >= self.grade_threshold:
+  def verify_step(self, premise: str, hypothesis: str) -> float:
+    with METRICS.timer("nli_step_seconds", model = self.model_type.name):
+      return self.score_pairs([(premise, hypothesis)])[0]
+
+  def score_pairs(self, pairs: list) -> list:
+    def encode(premise: str, hypothesis: str) -> list:
+      with METRICS.timer("nli_tokenize_seconds", model = self.model_type.name):
+        return self.tokenizer(premise, hypothesis, truncation = True)["input_ids"]
+
+    return self.score_cached("truncate", pairs, encode)
+
+  def cache_key(self, encoding: str) -> str:
+    # scores differ between backends, so each backend has its own cache entries; no weights are loaded for this
+    return f"{self.model_name}|{backend_signature(self.backend, self.model_name, self.artifact_dir)}|{encoding}"
+
+  def score_cached(self, encoding: str, pairs: list, encode) -> list:
+    # pairs are (premise, hypothesis) texts, encode(premise, hypothesis) is only called on cache misses,
+    # and the model itself is only loaded (by score_encoded) when there are any
+    if self.score_cache is None:
+      return self.score_encoded([encode(premise, hypothesis) for premise, hypothesis in pairs])
+
+    scores = self.score_cache.get_many(self.cache_key(encoding), pairs)
+    missing = [i for i, score in enumerate(scores) if score is None]
+    METRICS.count("nli_cache_hits_total", len(pairs) - len(missing), model = self.model_type.name)
+    METRICS.count("nli_cache_misses_total", len(missing), model = self.model_type.name)
+    fresh = self.score_encoded([encode(*pairs[i]) for i in missing])
+
+    for i, score in zip(missing, fresh):
+      scores[i] = score
+
+    # the key is read again as loading may have just exported the ONNX graph it depends on
+    self.score_cache.put_many(self.cache_key(encoding), [pairs[i] for i in missing], fresh)
+
+    return scores
+
+  def score_context_pairs(self, context_pairs: list) -> list:
+    # context_pairs come from PremiseContext.encode_proof and already carry their input ids
+    encoded = {(premise, hypothesis): input_ids for premise, hypothesis, input_ids in context_pairs}
+    pairs = [(premise, hypothesis) for premise, hypothesis, _ in context_pairs]
+
+    return self.score_cached(self.context.signature(), pairs, lambda *pair: encoded[pair])
+
+  def score_encoded(self, encoded: list) -> list:
+    import torch
+
+    scores = [0.0] * len(encoded)
+
+    with torch.inference_mode():
+      for batch in self.make_batches([len(input_ids) for input_ids in encoded]):
+        with METRICS.timer("nli_pad_seconds", model = self.model_type.name):
+          tokens = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors = "pt")
+
+        # tolist() waits for the device, so the forward time includes the whole batch
+        with METRICS.timer("nli_forward_seconds", model = self.model_type.name):
+          logits = self.model(tokens["input_ids"], tokens["attention_mask"])
+          # index 0 is the entailment label, as in the original single-pair path
+          predictions = torch.softmax(logits, -1)[:, 0].tolist()
+
+        METRICS.count("nli_pairs_total", len(batch), model = self.model_type.name)
+        METRICS.count("nli_tokens_total", tokens["input_ids"].numel(), model = self.model_type.name)
+
+        for i, prediction in zip(batch, predictions):
+          scores[i] = prediction
+
+    return scores
+
+  def make_batches(self, lengths: list) -> list:
+    # bucket by length so each batch pads to roughly the same width
+    order = sorted(range(len(lengths)), key = lambda i: lengths[i])
+    batches, batch, width = [], [], 0
+
+    for i in order:
+      new_width = max(width, lengths[i])
+      full = len(batch) >= self.batch_size
+      over_budget = self.max_batch_tokens is not None and new_width * (len(batch) + 1) > self.max_batch_tokens
+
+      if batch and (full or over_budget):
+        batches.append(batch)
+        batch, new_width = [], lengths[i]
+
+      batch.append(i)
+      width = new_width
+
+    if batch:
+      batches.append(batch)
+
+    return batches
+
+  def grade(self, scores: list, n_steps: int) -> bool:
+    # a proof without steps entails nothing
+    if n_steps == 0:
+      return False
+
+    avg_entailment = sum(scores) / n_steps
+
+    return avg_entailment * 100 >= self.grade_threshold
+
+  def encoding_key(self) -> tuple:
+    # models with equal keys get identical input ids from encode_proofs
+    return tokenizer_fingerprint(self.model_name), self.context.signature()
+
+  def encode_proofs(self, proofs: list) -> list:
+    context = self.context
+
+    with METRICS.timer("nli_tokenize_seconds", model = self.model_type.name):
+      return [context.encode_proof(proof) for proof in proofs]
+
+  def score_proofs(self, proofs: list, encoded: list | None = None) -> list:
+    # encoded can be passed in from another model with the same encoding_key
+    context_pairs, bounds = [], []
+
+    for proof_pairs in encoded or self.encode_proofs(proofs):
+      bounds.append((len(context_pairs), len(context_pairs) + len(proof_pairs)))
+      context_pairs += proof_pairs
+
+    scores = self.score_context_pairs(context_pairs)
+
+    return [scores[lo:hi] for lo, hi in bounds]
+
+  def decide(self, scores: list, n_steps: int, n_pairs: int) -> bool | None:
+    # the final average is bounded by the unscored pairs all scoring 0 or all scoring 1
+    if n_steps == 0:
+      return False
+
+    low = sum(scores) / n_steps * 100
+    high = (sum(scores) + n_pairs - len(scores)) / n_steps * 100
+
+    if low >= self.grade_threshold:
       return True
-    
-    return False
+    elif high < self.grade_threshold:
+      return False
+
+    return None
+
+  def evaluate_early(self, proofs: list, encoded: list) -> tuple:
+    # each round scores the next EARLY_EXIT_PAIRS pairs of every undecided proof in one batched call,
+    # then drops the proofs whose verdict is settled; returns (verdicts, scores of the pairs scored)
+    verdicts = [None] * len(proofs)
+    scores = [[] for _ in proofs]
+    pending = list(range(len(proofs)))
+
+    while pending:
+      round_pairs, bounds = [], []
+
+      for i in pending:
+        next_pairs = encoded[i][len(scores[i]):len(scores[i]) + EARLY_EXIT_PAIRS]
+        bounds.append((len(round_pairs), len(round_pairs) + len(next_pairs)))
+        round_pairs += next_pairs
+
+      round_scores = self.score_context_pairs(round_pairs)
+      undecided = []
+
+      for i, (lo, hi) in zip(pending, bounds):
+        scores[i] += round_scores[lo:hi]
+        n_steps = len(proofs[i]["proof"])
+
+        if len(scores[i]) == len(encoded[i]):
+          verdicts[i] = self.grade(scores[i], n_steps)
+        elif (decision := self.decide(scores[i], n_steps, len(encoded[i]))) is not None:
+          verdicts[i] = decision
+        else:
+          undecided.append(i)
+
+      pending = undecided
+
+    return verdicts, scores
+
+  def verify_early(self, proof: dict, context_pairs: list | None = None) -> tuple:
+    # returns (verdict, scores of the pairs scored before the verdict was settled)
+    verdicts, scores = self.evaluate_early([proof], [context_pairs or self.context.encode_proof(proof)])
+
+    return verdicts[0], scores[0]
+
+  def evaluate_proofs(self, proofs: list, encoded: list | None = None) -> tuple:
+    # returns (verdicts, step scores) per proof; with early_exit the scores may stop short
+    start = time.perf_counter()
+    encoded = encoded or self.encode_proofs(proofs)
+
+    if self.early_exit:
+      verdicts, scores = self.evaluate_early(proofs, encoded)
+    else:
+      scores = self.score_proofs(proofs, encoded)
+      verdicts = [self.grade(proof_scores, len(proof["proof"])) for proof, proof_scores in zip(proofs, scores)]
+
+    n_pairs = sum(max(len(proof["proof"]) - 1, 1) for proof in proofs)
+    self.record_cost((time.perf_counter() - start) / max(n_pairs, 1))
+
+    return verdicts, scores
+
+  def verify_proofs(self, proofs: list, encoded: list | None = None) -> list:
+    return self.evaluate_proofs(proofs, encoded)[0]
+
+  def record_cost(self, seconds_per_pair: float):
+    if self.seconds_per_pair is None:
+      self.seconds_per_pair = seconds_per_pair
+    else:
+      self.seconds_per_pair = 0.8 * self.seconds_per_pair + 0.2 * seconds_per_pair
+
+  def verify_proof(self, proof: dict) -> bool:
+    return self.verify_proofs([proof])[0]
   
+def is_majority(classifications: list) -> bool:
+  # the ensemble decision: at least half of the models accept; a model the cascade skipped (None) counts as a no
+  return classifications.count(True) >= math.ceil(len(classifications) / 2)
+
 class VerificationModel():
-  def __init__(self, models: list):
+  def __init__(self, models: list, cascade: bool = False, share_tokenization: bool = True):
     self.models = models
+    self.cascade = cascade
+    self.share_tokenization = share_tokenization # models with the same tokenizer reuse one encoding
     
-  def verify_proof(self, proof: dict) -> dict:
-    classifications = [False] * len(self.models)
-    majority = math.ceil(len(self.models) / 2)
-    
+  def cascade_order(self) -> list:
+    # cheapest first: measured seconds per pair once every model has run, (estimated) parameter count before that
+    if all(model.seconds_per_pair is not None for model in self.models):
+      return sorted(self.models, key = lambda model: model.seconds_per_pair)
+
+    return sorted(self.models, key = lambda model: model.parameter_count())
+
+  def encode_for(self, model: NLIModel, proofs: list, indices, encodings: dict) -> list:
+    # encodings holds (encoding key, proof index) -> context pairs for the current call
+    if not self.share_tokenization:
+      return model.encode_proofs([proofs[i] for i in indices])
+
+    key = model.encoding_key()
+    missing = [i for i in indices if (key, i) not in encodings]
+
+    if missing:
+      for i, context_pairs in zip(missing, model.encode_proofs([proofs[i] for i in missing])):
+        encodings[key, i] = context_pairs
+
+    return [encodings[key, i] for i in indices]
+
+  def evaluate_proofs(self, proofs: list) -> tuple:
+    # returns (classifications, step scores), both indexed [proof][model type]
+    METRICS.count("verification_proofs_total", len(proofs))
+
+    with METRICS.timer("verification_seconds"):
+      if self.cascade:
+        return self.evaluate_cascade(proofs)
+
+      return self.evaluate_all(proofs)
+
+  def evaluate_all(self, proofs: list) -> tuple:
+
+    classifications = [[False] * len(self.models) for _ in proofs]
+    step_scores = [[None] * len(self.models) for _ in proofs]
+    encodings = {}
+
     for model in self.models:
-      classifications[model.model_type.value] = model.verify_proof(proof)
-      
-    success = sum(classifications) >= majority
-    
+      encoded = self.encode_for(model, proofs, range(len(proofs)), encodings)
+      verdicts, scores = model.evaluate_proofs(proofs, encoded)
+
+      for row, score_row, verdict, proof_scores in zip(classifications, step_scores, verdicts, scores):
+        row[model.model_type.value] = verdict
+        score_row[model.model_type.value] = proof_scores
+
+    return classifications, step_scores
+
+  def classify_proofs(self, proofs: list) -> list:
+    return self.evaluate_proofs(proofs)[0]
+
+  def evaluate_cascade(self, proofs: list) -> tuple:
+    # skipped models stay None; a proof leaves the cascade once its vote is settled
+    classifications = [[None] * len(self.models) for _ in proofs]
+    step_scores = [[None] * len(self.models) for _ in proofs]
+    majority = math.ceil(len(self.models) / 2)
+    pending = list(range(len(proofs)))
+    encodings = {}
+
+    for model in self.cascade_order():
+      if not pending:
+        break
+
+      verdicts, scores = model.evaluate_proofs([proofs[i] for i in pending], self.encode_for(model, proofs, pending, encodings))
+
+      for i, verdict, proof_scores in zip(pending, verdicts, scores):
+        classifications[i][model.model_type.value] = verdict
+        step_scores[i][model.model_type.value] = proof_scores
+
+      pending = [
+        i for i in pending
+        if classifications[i].count(True) < majority and classifications[i].count(False) <= len(self.models) - majority
+      ]
+
+    return classifications, step_scores
+
+  def is_success(self, classifications: list) -> bool:
+    return is_majority(classifications)
+
+  def compact_scores(self, step_scores: list) -> list:
+    return [None if scores is None else [round(score, SCORE_DIGITS) for score in scores] for scores in step_scores]
+
+  def build_result(self, proof: dict, classifications: list, step_scores: list) -> dict:
+    # "scores" holds each model's raw step probabilities (None where a model was skipped) for re-scoring
     return {
       "id": proof["id"],
       "prompt type": proof["prompt type"],
       "classifications": classifications,
-      "success": success,
+      "success": self.is_success(classifications),
+      "steps": len(proof["proof"]),
+      "scores": self.compact_scores(step_scores),
       "success-human": False, # human eval metrics here and below
       "clarity": 0,
       "descriptiveness": 0,
       "redundancy": 0
     }
-  
-  def verify_math_proof(self, proof: dict) -> dict:
-    classifications = [False] * len(self.models)
-    majority = math.ceil(len(self.models) / 2)
-
-    for model in self.models:
-      classifications[model.model_type.value] = model.verify_proof(proof)
 
-    success = sum(classifications) >= majority
-    
+  def build_math_result(self, proof: dict, classifications: list, step_scores: list) -> dict:
     return {
       "id": proof["premise"],
       "type": proof["type"],
       "classifications": classifications,
-      "success": success
+      "success": self.is_success(classifications),
+      "steps": len(proof["proof"]),
+      "scores": self.compact_scores(step_scores)
     }
 
+  def verify_proofs(self, proofs: list) -> list:
+    classifications, step_scores = self.evaluate_proofs(proofs)
+
+    return [self.build_result(proof, row, scores) for proof, row, scores in zip(proofs, classifications, step_scores)]
+
+  def verify_math_proofs(self, proofs: list) -> list:
+    classifications, step_scores = self.evaluate_proofs(proofs)
+
+    return [self.build_math_result(proof, row, scores) for proof, row, scores in zip(proofs, classifications, step_scores)]
+    
+  def verify_proof(self, proof: dict) -> dict:
+    return self.verify_proofs([proof])[0]
+  
+  def verify_math_proof(self, proof: dict) -> dict:
+    return self.verify_math_proofs([proof])[0]
+
+  def score_model_major(self, items: list, score_path, chunk_size: int = 64):
+    # items are (folder, proof); only one model is resident at a time and its raw step scores
+    # go to score_path(folder, model_type), skipping proofs that file already has
+    for model in self.models:
+      scored = {}
+
+      for folder in {folder for folder, _ in items}:
+        path = score_path(folder, model.model_type)
+        scored[folder] = {(record["id"], record["prompt type"]) for record in iter_jsonl(path, ["id", "prompt type"])} if os.path.exists(path) else set()
+
+      todo = [(folder, proof) for folder, proof in items if (proof["id"], proof["prompt type"]) not in scored[folder]]
+
+      for lo in range(0, len(todo), chunk_size):
+        chunk = todo[lo:lo + chunk_size]
+
+        for (folder, proof), scores in zip(chunk, model.score_proofs([proof for _, proof in chunk])):
+          append_jsonl(score_path(folder, model.model_type), {"id": proof["id"], "prompt type": proof["prompt type"], "scores": scores})
+
+      model.unload()
+
+  def merge_model_major(self, items: list, score_path) -> list:
+    # grades the saved scores of every model and builds the usual majority records
+    scores = {}
+
+    for folder in {folder for folder, _ in items}:
+      for model in self.models:
+        path = score_path(folder, model.model_type)
+        scores[folder, model.model_type] = {(record["id"], record["prompt type"]): record["scores"] for record in iter_jsonl(path)}
+
+    results = []
+
+    for folder, proof in items:
+      classifications = [False] * len(self.models)
+      step_scores = [None] * len(self.models)
+
+      for model in self.models:
+        proof_scores = scores[folder, model.model_type][proof["id"], proof["prompt type"]]
+        classifications[model.model_type.value] = model.grade(proof_scores, len(proof["proof"]))
+        step_scores[model.model_type.value] = proof_scores
+
+      results.append(self.build_result(proof, classifications, step_scores))
+
+    return results
+
   def write_result(self, path: str, result: dict):
-    with open(path, "a") as f:
-      f.write(f'{json.dumps(result)}\n')
\ No newline at end of file
+    append_jsonl(path, result)
\ No newline at end of file
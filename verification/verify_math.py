@@ -1,67 +1,168 @@
-from verification_model import NLIModelType, NLIModel, VerificationModel
-from datasets import load_dataset
-import torch
-import sys
-import os
-
-DEVICE = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-GRADE_THRESHOLD = 50
-
-ds_nt  = load_dataset("EleutherAI/hendrycks_math", 'number_theory', split = "test")
-ds_nt = ds_nt.filter(lambda x: int(x['level'][-1]) > 1)
-ds_al = load_dataset("EleutherAI/hendrycks_math", 'algebra', split = "test")
-ds_al = ds_al.filter(lambda x: int(x['level'][-1]) > 1)
-dataset = ds_nt[:500] + ds_al[:500]
-
-folder_path = sys.argv[0]
-path = os.path.join(folder_path, "math-verification.jsonl")
-f1_path = os.path.join(folder_path, "f1-scores.txt")
-
-nli_model_names = ["Jaehun/PrismNLI-0.4B", "facebook/bart-large-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli", "MoritzLaurer/DeBERTa-v3-base-mnli-fever-anli", "MoritzLaurer/DeBERTa-v3-large-mnli-fever-anli-ling-wanli"]
-nli_models = [NLIModel(model_type, nli_model_names[model_type.value], DEVICE, GRADE_THRESHOLD) for model_type in NLIModelType]
-verification_model = VerificationModel(nli_models)
-
-tp_ensemble, fn_ensemble = 0, 0
-f1_ensemble = 0
-
-tp_baseline, fn_baseline = 0, 0
-f1_baseline = 0
-
-for problem in dataset:
-  solution = problem["solution"].replace(".$", "$.").replace(".\\]", "\\].").split(".")
-  solution = list(
-    map(
-      lambda x: x.strip() + "",
-      filter(
-        lambda x: x.strip() != "",
-        solution
-      )
-    )
-  )
-  proof = {
-    "premise": proof["problem"],
-    "type": problem["type"],
-    "proof": solution
-  }
-  
-  result = verification_model.verify_math_proof(proof)
-  verification_model.write_result(path, result)
-
-  if result["success"]:
-    tp_ensemble += 1
-  else:
-    fn_ensemble += 1 # no fp here, all proofs are ground truth and thankfully correct thank god
-  
-  if result["classifications"][0]:
-    tp_baseline += 1
-  else:
-    fn_baseline += 1
-
-f1_ensemble = 2 * tp_ensemble / (2 * tp_ensemble + fn_ensemble)
-f1_baseline = 2 * tp_baseline / (2 * tp_baseline + fn_baseline)
-
-with open(f1_path, "w") as f:
-  f.write(f'''
-F1-score of ensemble model: {f1_ensemble}
-F1-score of baseline: {f1_baseline}         
-''')
\ No newline at end of file
+from Code.verification.verification_model import NLIModelType, NLIModel, VerificationModel
+from Code.utils.utils import append_jsonl, parse_jsonl, repair_jsonl
+from Code.utils.jsonl import flush_all, iter_jsonl
+from Code.config import GRADE_THRESHOLD, NLI_BATCH_SIZE, NLI_MAX_BATCH_TOKENS, NLI_MODEL_NAMES, VERIFY_CHUNK_SIZE
+import subprocess
+import argparse
+import json
+import sys
+import os
+
+# run from the directory containing Code/: python -m Code.verification.verify_math /path/to/folder --shards 4
+DATASET_NAME = "EleutherAI/hendrycks_math"
+SUBSETS = ["number_theory", "algebra"]
+PROBLEMS_PER_SUBSET = 500
+MIN_LEVEL = 2 # "Level 1" problems are left out
+SNAPSHOT_FILE = "math-problems.jsonl" # the selected problems, so later runs need no network
+PARENT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def download_problems() -> list:
+  from datasets import load_dataset
+
+  problems = []
+
+  for subset in SUBSETS:
+    dataset = load_dataset(DATASET_NAME, subset, split = "test")
+    dataset = dataset.filter(lambda x: int(x["level"][-1]) >= MIN_LEVEL)
+    dataset = dataset.select(range(min(PROBLEMS_PER_SUBSET, len(dataset))))
+    problems += [{"problem": x["problem"], "solution": x["solution"], "type": x["type"], "level": x["level"]} for x in dataset]
+
+  return problems
+
+def load_problems(snapshot_path: str, offline: bool = False) -> list:
+  # problems are numbered in dataset order, which fixes the order of the merged results
+  if not os.path.exists(snapshot_path):
+    if offline:
+      raise FileNotFoundError(f"No dataset snapshot at {snapshot_path}; run once without --offline to create it")
+
+    with open(f"{snapshot_path}.tmp", "w") as f:
+      for index, problem in enumerate(download_problems()):
+        f.write(json.dumps({"index": index, **problem}) + "\n")
+
+    os.replace(f"{snapshot_path}.tmp", snapshot_path)
+
+  return parse_jsonl(snapshot_path)
+
+def split_solution(solution: str) -> list:
+  solution = solution.replace(".$", "$.").replace(".\\]", "\\].").split(".")
+
+  return [sentence.strip() for sentence in solution if sentence.strip() != ""]
+
+def build_proof(problem: dict) -> dict:
+  return {
+    "premise": problem["problem"],
+    "type": problem["type"],
+    "proof": split_solution(problem["solution"])
+  }
+
+def shard_path(folder_path: str, shard: int, n_shards: int) -> str:
+  return os.path.join(folder_path, "math-shards", f"math-verification-{shard}-of-{n_shards}.jsonl")
+
+def run_shard(folder_path: str, problems: list, shard: int, n_shards: int, device: str):
+  # problems are dealt round robin so every shard gets both subsets; results already in the shard file are kept
+  path = shard_path(folder_path, shard, n_shards)
+  os.makedirs(os.path.dirname(path), exist_ok = True)
+  repair_jsonl(path)
+  done = {record["index"] for record in iter_jsonl(path, ["index"])} if os.path.exists(path) else set()
+  todo = [problem for problem in problems if problem["index"] % n_shards == shard and problem["index"] not in done]
+
+  nli_models = [NLIModel(model_type, NLI_MODEL_NAMES[model_type.value], device, GRADE_THRESHOLD, NLI_BATCH_SIZE, NLI_MAX_BATCH_TOKENS) for model_type in NLIModelType]
+  verification_model = VerificationModel(nli_models)
+
+  for lo in range(0, len(todo), VERIFY_CHUNK_SIZE):
+    chunk = todo[lo:lo + VERIFY_CHUNK_SIZE]
+
+    for problem, result in zip(chunk, verification_model.verify_math_proofs([build_proof(problem) for problem in chunk])):
+      append_jsonl(path, {"index": problem["index"], **result})
+
+  flush_all()
+
+def run_shards(folder_path: str, snapshot_path: str, n_shards: int, threads: int, device: str | None, offline: bool):
+  # one process per shard, each limited to `threads` intra-op threads so they don't oversubscribe the cores
+  env = {**os.environ, "OMP_NUM_THREADS": str(threads), "MKL_NUM_THREADS": str(threads)}
+  command = [sys.executable, "-m", "Code.verification.verify_math", folder_path, "--shards", str(n_shards), "--threads", str(threads), "--snapshot", snapshot_path]
+  command += (["--device", device] if device else []) + (["--offline"] if offline else [])
+  processes = [subprocess.Popen(command + ["--shard", str(shard)], cwd = PARENT_DIR, env = env) for shard in range(n_shards)]
+  failed = [shard for shard, process in enumerate(processes) if process.wait() != 0]
+
+  if failed:
+    raise RuntimeError(f"Shards {failed} failed; rerun to resume them")
+
+def merge_shards(folder_path: str, problems: list, n_shards: int):
+  # results are written in problem order whatever order the shards finished in
+  results = {}
+
+  for shard in range(n_shards):
+    path = shard_path(folder_path, shard, n_shards)
+
+    if os.path.exists(path):
+      repair_jsonl(path)
+      results.update({record["index"]: record for record in iter_jsonl(path)})
+
+  missing = [problem["index"] for problem in problems if problem["index"] not in results]
+
+  if missing:
+    raise RuntimeError(f"{len(missing)} problems have no result, e.g. {missing[:10]}; rerun the shards that hold them")
+
+  tp_ensemble, fn_ensemble = 0, 0
+  tp_baseline, fn_baseline = 0, 0
+
+  with open(os.path.join(folder_path, "math-verification.jsonl"), "w") as f:
+    for problem in problems:
+      result = {key: value for key, value in results[problem["index"]].items() if key != "index"}
+      f.write(json.dumps(result) + "\n")
+
+      # no fp here, all proofs are ground truth and thankfully correct
+      if result["success"]:
+        tp_ensemble += 1
+      else:
+        fn_ensemble += 1
+
+      if result["classifications"][0]:
+        tp_baseline += 1
+      else:
+        fn_baseline += 1
+
+  f1_ensemble = 2 * tp_ensemble / (2 * tp_ensemble + fn_ensemble) if problems else 0
+  f1_baseline = 2 * tp_baseline / (2 * tp_baseline + fn_baseline) if problems else 0
+
+  with open(os.path.join(folder_path, "f1-scores.txt"), "w") as f:
+    f.write(f'''
+F1-score of ensemble model: {f1_ensemble}
+F1-score of baseline: {f1_baseline}
+''')
+
+def build_parser() -> argparse.ArgumentParser:
+  parser = argparse.ArgumentParser(description = "Grade the MATH number theory and algebra solutions with the NLI ensemble")
+  parser.add_argument("folder_path")
+  parser.add_argument("--shards", type = int, default = 1, help = "number of shards, each run in its own process")
+  parser.add_argument("--threads", type = int, default = None, help = "torch threads per shard, the cores split evenly by default")
+  parser.add_argument("--shard", type = int, default = None, help = "run only this shard and skip the merge, e.g. one shard per node")
+  parser.add_argument("--merge", action = "store_true", help = "only merge the shard files into math-verification.jsonl and f1-scores.txt")
+  parser.add_argument("--snapshot", default = None, help = f"dataset snapshot, folder_path/{SNAPSHOT_FILE} by default")
+  parser.add_argument("--offline", action = "store_true", help = "fail instead of downloading the dataset when there is no snapshot")
+  parser.add_argument("--device", default = None, help = "cuda if available, otherwise cpu")
+
+  return parser
+
+def main(argv: list | None = None):
+  args = build_parser().parse_args(argv)
+  os.makedirs(args.folder_path, exist_ok = True)
+  snapshot_path = args.snapshot or os.path.join(args.folder_path, SNAPSHOT_FILE)
+  problems = load_problems(snapshot_path, args.offline)
+  threads = args.threads or max((os.cpu_count() or 1) // args.shards, 1)
+
+  if args.shard is not None:
+    import torch
+
+    torch.set_num_threads(threads)
+    device = args.device or ("cuda" if torch.cuda.is_available() else "cpu")
+    run_shard(args.folder_path, problems, args.shard, args.shards, device)
+  elif args.merge:
+    merge_shards(args.folder_path, problems, args.shards)
+  else:
+    run_shards(args.folder_path, snapshot_path, args.shards, threads, args.device, args.offline)
+    merge_shards(args.folder_path, problems, args.shards)
+
+if __name__ == "__main__":
+  main()